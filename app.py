@@ -1,7 +1,40 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import os, time
-import tempfile
-from cad import generate_cad
+from artifact_server import get_artifact_server
+from artifacts import gzip_payload, zip_bundle
+from clients import get_pool
+from coalesce import get_registry
+from history import get_history
+from identity import current_user
+from jobs import get_job_manager
+from metrics import estimator, serve_metrics
+from preview import preview_html, preview_stats
+from scheduler import quota_summary
+from similarity import find_similar
+
+# Share one pooled API client across every session on this server
+@st.cache_resource
+def client_pool():
+    return get_pool()
+
+# Expose /metrics for scraping when a port is configured
+@st.cache_resource
+def metrics_server():
+    port = os.environ.get("CADIA_METRICS_PORT")
+    return serve_metrics(int(port)) if port else None
+
+# With CADIA_ARTIFACT_PORT set, downloads are signed links to a streaming endpoint,
+# so sessions hold links instead of every offered file's bytes
+@st.cache_resource
+def artifact_server():
+    return get_artifact_server()
+
+# One background job manager enforces the generation cap for the whole server;
+# in queue mode this server only enqueues and worker processes generate
+@st.cache_resource
+def job_manager():
+    return get_job_manager()
 
 # Set page configuration
 st.set_page_config(
@@ -11,6 +44,9 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Start the shared /metrics endpoint (only after set_page_config)
+metrics_server()
+
 # Custom CSS for the entire application
 st.markdown("""
 <style>
@@ -216,6 +252,24 @@ with st.sidebar:
         
         [View CADIA API Documentation](https://github.com/SourceBox-LLC/cad-generator)
         """)
+
+    with st.expander("Connection Stats", expanded=False):
+        pool_stats = client_pool().stats()
+        flight_stats = get_registry().stats()
+        st.markdown(f"""
+        - API requests: {pool_stats['requests']}
+        - Connections opened: {pool_stats['connections_opened']}
+        - Connection reuse: {pool_stats['reuse_ratio']:.0%}
+        - HTTP/2: {"enabled" if pool_stats['http2'] else "unavailable"}
+        - Duplicate requests coalesced: {flight_stats['coalesced']}
+        - Retried API calls: {pool_stats['retries']}
+        - Submissions waiting: {pool_stats['admission']['submit']['queued']} (avg wait {pool_stats['admission']['submit']['avg_wait_s']:.1f}s)
+        - Status polls waiting: {pool_stats['admission']['poll']['queued']}
+        """)
+        if artifact_server():
+            scratch = artifact_server().scratch.usage()
+            st.markdown(f"- Download scratch space: {scratch['bytes'] / 1024 ** 2:,.1f} of "
+                        f"{scratch['quota'] / 1024 ** 2:,.0f} MB ({scratch['files']} files)")
         
     st.markdown("---")
     
@@ -269,11 +323,11 @@ with input_container:
             form_col1, form_col2 = st.columns(2)
             
             with form_col1:
-                output_format = st.selectbox(
-                    "Output format", 
+                output_formats = st.multiselect(
+                    "Output formats", 
                     ["step", "stl"], 
-                    index=0,
-                    help="STEP is better for precision engineering, STL for 3D printing"
+                    default=["step"],
+                    help="STEP is better for precision engineering, STL for 3D printing. Pick both to get both from one generation."
                 )
             
             with form_col2:
@@ -283,6 +337,13 @@ with input_container:
                     help="Name your file without the extension"
                 )
             
+            # Let users force a fresh generation instead of reusing a cached result
+            bypass_cache = st.checkbox(
+                "Force fresh generation",
+                value=False,
+                help="Ignore previously generated results for this prompt and call the API again"
+            )
+            
             # Submit button - full width and prominent
             submit_button = st.form_submit_button("🔄 Generate 3D Model")
         
@@ -379,100 +440,295 @@ with input_container:
         """)
         st.markdown('</div>', unsafe_allow_html=True)
 
-# Process the form submission
+# The signed-in user, or a server-signed session ID kept in the URL so reloads and new
+# tabs find their jobs; anonymous sessions share one quota, so a new ID gains nothing
+user_id = current_user()
+
+# Once per session, pick up generations a restart or closed tab left behind
+if "reattached" not in st.session_state:
+    st.session_state["reattached"] = True
+    st.session_state.setdefault("jobs", []).extend(job_manager().reattach(user_id))
+
+def queue_job(request):
+    # A submission over the hourly quota is refused; the reason shows above the jobs
+    try:
+        job_id = job_manager().submit(
+            request["prompt"],
+            request["formats"],
+            file_name=request["file_name"],
+            use_cache=request["use_cache"],
+            owner=user_id,
+        )
+    except Exception as e:
+        st.session_state["submit_error"] = str(e)
+        return
+    st.session_state.setdefault("jobs", []).append(job_id)
+
+
+def render_quota():
+    st.caption("Your usage: " + quota_summary(job_manager().quota(user_id)))
+
+
+# Queue the form submission; generation runs in the background job manager.
+# A near-identical past design is offered first, since it costs nothing to reuse
 if submit_button and prompt:
-    with result_container:
-        st.markdown('<div class="card">', unsafe_allow_html=True)
-        
-        try:
-            # Custom info message
-            st.markdown("""
-            <div class="info-box">
-                <div>
-                    <h3 style="margin: 0; color: #1E40AF;">Generating your 3D model...</h3>
-                    <p style="margin: 0.5rem 0 0 0;">This typically takes 1-2 minutes. Please wait while we process your request.</p>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Create a temporary file to store the CAD output
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{output_format}") as tmp_file:
-                output_path = tmp_file.name
-            
-            # Generate the CAD file
-            generate_cad(prompt, output_path)
-            
-            # Read the generated file for download
-            with open(output_path, "rb") as file:
-                file_content = file.read()
-            
-            # Success message with custom styling
-            st.markdown("""
-            <div class="success-box">
-                <div>
-                    <h3 style="margin: 0; color: #065F46;">Success! Your 3D model is ready</h3>
-                    <p style="margin: 0.5rem 0 0 0;">Your CAD file has been generated and is ready for download.</p>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-            
-            # Create a download button
-            final_filename = f"{file_name}.{output_format}"
-            col1, col2 = st.columns(2)
-            
-            with col1:
+    request = {
+        "prompt": prompt,
+        "formats": output_formats or ["step"],
+        "file_name": file_name,
+        "use_cache": not bypass_cache,
+    }
+    matches = [] if bypass_cache else find_similar(prompt)
+    if matches:
+        st.session_state["similar_offer"] = dict(request, matches=matches)
+    else:
+        st.session_state.pop("similar_offer", None)
+        queue_job(request)
+
+
+def render_similar_offer(offer):
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    st.markdown("""
+    <div class="info-box">
+        <div>
+            <h3 style="margin: 0; color: #1E40AF;">A near-identical design already exists</h3>
+            <p style="margin: 0.5rem 0 0 0;">Download it right away, or generate a new one anyway.</p>
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
+    st.markdown(f"**Your description:** {offer['prompt']}")
+
+    history = get_history()
+    server = artifact_server()
+    for index, match in enumerate(offer["matches"]):
+        st.markdown(f"**Existing design ({match['score']:.0%} similar):** {match['prompt']}")
+        artifacts = [artifact for artifact in history.job_artifacts(match["ref"]) if artifact["artifact_sha256"]]
+        columns = st.columns(max(len(artifacts), 1))
+        for column, artifact in zip(columns, artifacts):
+            label = f"📥 Download {artifact['format'].upper()}"
+            download_name = f"{offer['file_name']}.{artifact['format']}"
+            if server:
+                with column:
+                    st.link_button(label, server.blob_link(
+                        artifact["artifact_sha256"], download_name, size=artifact["artifact_size"]
+                    ), use_container_width=True)
+                continue
+            data = history.read_blob(artifact["artifact_sha256"])
+            if data is None:
+                continue
+            with column:
                 st.download_button(
-                    label="📥 Download CAD File",
-                    data=file_content,
-                    file_name=final_filename,
+                    label=label,
+                    data=data,
+                    file_name=download_name,
                     mime="application/octet-stream",
                     use_container_width=True,
+                    key=f"similar_{index}_{artifact['id']}",
                 )
-            
-            with col2:
-                st.link_button(
-                    "🔍 View in Autodesk",
-                    "https://viewer.autodesk.com",
+
+    generate_col, dismiss_col = st.columns(2)
+    with generate_col:
+        if st.button("🔄 Generate a new design anyway", use_container_width=True):
+            st.session_state.pop("similar_offer", None)
+            queue_job(offer)
+            st.rerun()
+    with dismiss_col:
+        if st.button("Dismiss", use_container_width=True):
+            st.session_state.pop("similar_offer", None)
+            st.rerun()
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+# Content types of the compressed downloads
+DOWNLOAD_TYPES = {".gz": "application/gzip", ".zip": "application/zip"}
+
+
+@st.cache_data(max_entries=32, show_spinner="Compressing downloads...")
+def compressed_downloads(job_id, _job):
+    # Artifacts are stored gzip-compressed in the history, so .gz downloads are read
+    # straight from disk; the in-memory payload is compressed only if recording failed
+    history = get_history()
+    digests = {artifact["format"]: artifact["artifact_sha256"] for artifact in history.job_artifacts(job_id)}
+    downloads = []
+    for ext, payload in _job.results.items():
+        data = history.read_blob(digests[ext], compressed=True) if ext in digests else None
+        downloads.append((f"{ext.upper()}.GZ", f"{_job.file_name}.{ext}.gz", data or gzip_payload(payload)))
+    if len(_job.results) > 1:
+        bundle = zip_bundle((f"{_job.file_name}.{ext}", payload) for ext, payload in _job.results.items())
+        downloads.append(("all (.zip)", f"{_job.file_name}.zip", bundle))
+    return downloads
+
+
+def job_downloads(job, compress):
+    # (label, file name, link or bytes) for each download of a completed job. Links
+    # need the outputs in the history; if recording failed the bytes are offered
+    server = artifact_server()
+    history = get_history()
+    stored = {artifact["format"]: artifact for artifact in history.job_artifacts(job.id)} if server else {}
+    if not server or any(ext not in stored for ext in job.results):
+        if compress:
+            return compressed_downloads(job.id, job)
+        return [(ext.upper(), f"{job.file_name}.{ext}", payload) for ext, payload in job.results.items()]
+
+    downloads = []
+    for ext in job.results:
+        download_name = f"{job.file_name}.{ext}.gz" if compress else f"{job.file_name}.{ext}"
+        link = server.blob_link(stored[ext]["artifact_sha256"], download_name, size=stored[ext]["artifact_size"],
+                                compressed=compress, ref=job.id)
+        downloads.append((f"{ext.upper()}.GZ" if compress else ext.upper(), download_name, link))
+    if compress and len(job.results) > 1:
+        members = [(f"{job.file_name}.{ext}", history.blob_path(stored[ext]["artifact_sha256"])) for ext in job.results]
+        try:
+            link = server.bundle_link(f"job:{job.id}", f"{job.file_name}.zip", members, ref=job.id)
+            downloads.append(("all (.zip)", f"{job.file_name}.zip", link))
+        except Exception as e:
+            # Scratch space full: the single-file downloads still work
+            st.caption(f"The zip download is unavailable: {e}")
+    return downloads
+
+
+def render_job(job):
+    st.markdown('<div class="card">', unsafe_allow_html=True)
+    filenames = [f"{job.file_name}.{ext}" for ext in job.results]
+
+    if not job.done:
+        # Custom info message
+        st.markdown(f"""
+        <div class="info-box">
+            <div>
+                <h3 style="margin: 0; color: #1E40AF;">Generating your 3D model...</h3>
+                <p style="margin: 0.5rem 0 0 0;">Recent designs took about {estimator.estimate():.0f} seconds. You can keep working and queue more designs meanwhile.</p>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+        st.markdown(f"**Description:** {job.prompt}")
+        st.progress(job.progress)
+        st.text(job.message)
+        if job.remote_id:
+            st.caption(f"Remote job {job.remote_id[:8]} · {job.polls} status checks so far")
+
+    elif job.status == "completed":
+        # Success message with custom styling
+        st.markdown("""
+        <div class="success-box">
+            <div>
+                <h3 style="margin: 0; color: #065F46;">Success! Your 3D model is ready</h3>
+                <p style="margin: 0.5rem 0 0 0;">Your CAD file has been generated and is ready for download.</p>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Create a download button per format, all from the same generation;
+        # compressed downloads add one zip holding every format
+        compress = st.toggle(
+            "Compressed downloads",
+            key=f"compress_{job.id}",
+            help="Download .gz files (STEP shrinks 5-10x), plus one .zip with every format",
+        )
+        downloads = job_downloads(job, compress)
+        columns = st.columns(len(downloads) + 1)
+        
+        for column, (label, download_name, payload) in zip(columns, downloads):
+            with column:
+                if isinstance(payload, str):
+                    # Served by the artifact endpoint, which marks the job delivered
+                    st.link_button(f"📥 Download {label}", payload, use_container_width=True)
+                    continue
+                st.download_button(
+                    label=f"📥 Download {label}",
+                    data=payload,
+                    file_name=download_name,
+                    mime=DOWNLOAD_TYPES.get(os.path.splitext(download_name)[1], "application/octet-stream"),
                     use_container_width=True,
+                    key=f"download_{job.id}_{download_name}",
+                    on_click=job_manager().delivered,
+                    args=(job.id,),
                 )
-            
-            # Clean up temporary file
-            os.unlink(output_path)
-            
-            # Display information about the generated design
-            st.markdown("### Generated Design Details")
-            st.markdown(f"**Description:** {prompt}")
-            st.markdown(f"**Format:** {output_format.upper()}")
-            st.markdown(f"**Filename:** {final_filename}")
-            
-            # Add tips for viewing/editing
-            st.info("""
-            **Next Steps:**
-            1. Download your CAD file using the button above
-            2. Open it in Autodesk Viewer or your preferred CAD software
-            3. Make any necessary adjustments or refinements
-            """)
-            
-        except Exception as e:
-            # Error message with custom styling
-            st.markdown(f"""
-            <div class="error-box">
-                <div>
-                    <h3 style="margin: 0; color: #991B1B;">Error Generating CAD Model</h3>
-                    <p style="margin: 0.5rem 0 0 0;">An error occurred during the generation process: {e}</p>
-                </div>
+        
+        with columns[-1]:
+            st.link_button(
+                "🔍 View in Autodesk",
+                "https://viewer.autodesk.com",
+                use_container_width=True,
+            )
+        
+        # Display information about the generated design
+        st.markdown("### Generated Design Details")
+        st.markdown(f"**Description:** {job.prompt}")
+        st.markdown(f"**Format:** {', '.join(ext.upper() for ext in job.results)}")
+        st.markdown(f"**Filename:** {', '.join(filenames)}")
+        
+        # Interactive preview from the decimated mesh, so large outputs stay light in the browser
+        if job.preview:
+            st.markdown("### 3D Preview")
+            components.html(preview_html(job.preview), height=440)
+            stats = preview_stats(job.preview)
+            if stats and job.analysis and stats[1] < job.analysis["triangles"]:
+                st.caption(f"Preview simplified to {stats[1]:,} of {job.analysis['triangles']:,} triangles.")
+
+        # Local mesh measurements (available whenever an STL was generated)
+        if job.analysis:
+            size_x, size_y, size_z = job.analysis["size"]
+            metric_cols = st.columns(4)
+            metric_cols[0].metric("Triangles", f"{job.analysis['triangles']:,}")
+            metric_cols[1].metric("Volume", f"{job.analysis['volume']:,.1f} mm³")
+            metric_cols[2].metric("Surface area", f"{job.analysis['surface_area']:,.1f} mm²")
+            metric_cols[3].metric("Watertight", "Yes" if job.analysis["watertight"] else "No")
+            st.markdown(f"**Bounding box:** {size_x:.2f} × {size_y:.2f} × {size_z:.2f} mm")
+        elif "stl" not in job.results:
+            st.caption("Include STL in the output formats to see a 3D preview and mesh measurements here.")
+        
+        # Add tips for viewing/editing
+        st.info("""
+        **Next Steps:**
+        1. Download your CAD files using the buttons above
+        2. Open it in Autodesk Viewer or your preferred CAD software
+        3. Make any necessary adjustments or refinements
+        """)
+
+    else:
+        # Error message with custom styling
+        st.markdown(f"""
+        <div class="error-box">
+            <div>
+                <h3 style="margin: 0; color: #991B1B;">Error Generating CAD Model</h3>
+                <p style="margin: 0.5rem 0 0 0;">An error occurred during the generation process: {job.error}</p>
             </div>
-            """, unsafe_allow_html=True)
-            
-            st.markdown("""
-            **Troubleshooting Steps:**
-            1. Check that your API key is correctly set in `.streamlit/secrets.toml`
-            2. Verify your prompt is clear and descriptive
-            3. Try again with a simpler description
-            4. Contact support if the issue persists
-            """)
+        </div>
+        """, unsafe_allow_html=True)
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        st.markdown("""
+        **Troubleshooting Steps:**
+        1. Check that your API key is correctly set in `.streamlit/secrets.toml`
+        2. Verify your prompt is clear and descriptive
+        3. Try again with a simpler description
+        4. Contact support if the issue persists
+        """)
+    
+    st.markdown('</div>', unsafe_allow_html=True)
+
+
+# Only auto-refresh while this session has jobs in flight
+session_jobs = job_manager().jobs(st.session_state.get("jobs", []))
+polling = any(not job.done for job in session_jobs)
+
+@st.fragment(run_every=2 if polling else None)
+def render_jobs():
+    render_quota()
+    jobs = job_manager().jobs(st.session_state.get("jobs", []))
+    for job in reversed(jobs):
+        render_job(job)
+
+    # Everything finished: stop the refresh timer with one full rerun
+    if polling and all(job.done for job in jobs):
+        st.rerun()
+
+with result_container:
+    if "submit_error" in st.session_state:
+        st.error(st.session_state.pop("submit_error"))
+    if "similar_offer" in st.session_state:
+        render_similar_offer(st.session_state["similar_offer"])
+    render_jobs()
 
 # Footer
 st.markdown("""
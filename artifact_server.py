@@ -0,0 +1,362 @@
+import gzip
+import hashlib
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from artifacts import CHUNK_SIZE, Payload, detect_codec, open_payload, write_zip
+from history import DEFAULT_DATA_DIR, HistoryStore, get_history
+from identity import load_secret
+from metrics import registry
+from scratch import ScratchSpace, get_scratch
+
+logger = logging.getLogger("cadia")
+
+# Port of the artifact endpoint. Unset, downloads go through Streamlit, which keeps
+# every offered file's bytes in memory for each session
+ARTIFACT_PORT = os.environ.get("CADIA_ARTIFACT_PORT")
+ARTIFACT_HOST = os.environ.get("CADIA_ARTIFACT_HOST", "0.0.0.0")
+
+# Base URL browsers reach the endpoint at, e.g. https://cad.example.com/files behind
+# a reverse proxy (default: http://localhost:<port>)
+PUBLIC_URL = os.environ.get("CADIA_ARTIFACT_URL")
+
+# Seconds a download link stays valid; spooled bundles live as long as their last link
+LINK_TTL = float(os.environ.get("CADIA_ARTIFACT_LINK_TTL", 3600))
+
+served_bytes = registry.counter("cadia_artifact_served_bytes_total", "Artifact bytes sent to browsers, by encoding.")
+link_requests = registry.counter("cadia_artifact_requests_total", "Artifact link requests, by result.")
+
+_KEY = re.compile(r"^[0-9a-f]{32,64}$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], total: Optional[int]) -> Optional[Tuple[int, int]]:
+    """
+    Returns the inclusive (first, last) byte positions of a single-range Range header,
+    or None to send the whole body. Raises ValueError for an unsatisfiable range.
+    """
+    match = _RANGE.match(header.strip()) if header and total is not None else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # bytes=-500: the final 500 bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(total - length, 0), total - 1
+    first, last = int(first), min(int(last), total - 1) if last else total - 1
+    if first >= total or last < first:
+        raise ValueError(header)
+    return first, last
+
+
+def _disposition(file_name: str) -> str:
+    fallback = re.sub(r'[^\w.() -]', "_", file_name.encode("ascii", "replace").decode("ascii"))
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{urllib.parse.quote(file_name)}"
+
+
+class _CountingWriter:
+    # Forwards compressed output to the client, counting it as served
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, data) -> int:
+        served_bytes.inc(len(data), labels={"encoding": "gzip"})
+        return self.wfile.write(data)
+
+    def flush(self) -> None:
+        self.wfile.flush()
+
+
+class _ArtifactHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.artifacts.handle(self, send_body=True)
+
+    def do_HEAD(self):
+        self.server.artifacts.handle(self, send_body=False)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArtifactServer:
+    """
+    Serves generated files to browsers from disk over a small HTTP endpoint, so a
+    download costs the web app a link instead of the file's bytes in every session.
+
+    History blobs are streamed in CHUNK_SIZE slices: to clients that accept gzip as
+    stored, otherwise decompressed on the fly, with single Range requests for
+    resumed downloads. Zip bundles are spooled to the scratch space once, and its
+    janitor removes them after their last link expires. Links are HMAC-signed and time-limited, so they can only
+    come from the app and stop working after LINK_TTL.
+    """
+
+    def __init__(self, port: int, host: str = ARTIFACT_HOST, public_url: Optional[str] = PUBLIC_URL,
+                 history: Optional[HistoryStore] = None, directory: str = DEFAULT_DATA_DIR,
+                 secret: Optional[bytes] = None, link_ttl: float = LINK_TTL,
+                 scratch: Optional[ScratchSpace] = None):
+        self.port = port
+        self.host = host
+        self.history = history or get_history()
+        self.scratch = scratch or get_scratch()
+        self.link_ttl = link_ttl
+        self._public_url = public_url
+        self._secret = secret or load_secret(directory, "artifact_secret", "CADIA_ARTIFACT_SECRET")
+        self._callbacks: List[Callable[[str], None]] = []
+        self._httpd: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return (self._public_url or f"http://localhost:{self.port}").rstrip("/")
+
+    def start(self) -> "ArtifactServer":
+        """
+        Starts serving on a background thread.
+        """
+        self._httpd = ThreadingHTTPServer((self.host, self.port), _ArtifactHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.artifacts = self
+        # Port 0 picks a free port
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="cad-artifacts", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    def on_download(self, callback: Callable[[str], None]) -> None:
+        """
+        Calls callback(ref) whenever a link made with ref has been downloaded to the end.
+        """
+        self._callbacks.append(callback)
+
+    def _sign(self, kind: str, key: str, file_name: str, params: Dict[str, str]) -> str:
+        message = "\n".join([kind, key, file_name] + [f"{name}={params[name]}" for name in sorted(params)])
+        return hmac.new(self._secret, message.encode("utf-8"), hashlib.sha256).hexdigest()
+
+    def _link(self, kind: str, key: str, file_name: str, params: Dict[str, str]) -> str:
+        params = {name: str(value) for name, value in params.items() if value is not None}
+        params["exp"] = str(int(time.time() + self.link_ttl))
+        params["sig"] = self._sign(kind, key, file_name, params)
+        return f"{self.url}/{kind}/{key}/{urllib.parse.quote(file_name)}?{urllib.parse.urlencode(params)}"
+
+    def blob_link(self, digest: str, file_name: str, size: Optional[int] = None,
+                  compressed: bool = False, ref: Optional[str] = None) -> str:
+        """
+        Returns a signed link that downloads a history blob as file_name. size is its
+        raw length (from the history row), needed to serve byte ranges of the raw
+        file; compressed serves the gzip encoding as a .gz download.
+        """
+        return self._link("blob", digest, file_name, {"size": size, "gz": 1 if compressed else None, "ref": ref})
+
+    def bundle_link(self, key: str, file_name: str,
+                    members: Iterable[Tuple[str, Union[str, Payload]]], ref: Optional[str] = None) -> str:
+        """
+        Returns a signed link to a zip of members (file name, raw bytes or stored
+        artifact path), written to the scratch space on first use. key identifies the content:
+        the same key reuses the spooled zip and keeps it alive for another LINK_TTL.
+        """
+        spool_id = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        if self.scratch.touch(spool_id, self.link_ttl) is None:
+            members = list(members)
+            # Deflated, the bundle takes about as much room as its stored members
+            reserve = sum(os.path.getsize(source) if isinstance(source, str) else len(source) for _, source in members)
+            with self.scratch.file(suffix=".zip", reserve=reserve) as path:
+                with open(path, "wb") as handle:
+                    write_zip(handle, members)
+                self.scratch.keep(path, spool_id, self.link_ttl)
+        return self._link("spool", spool_id, file_name, {"ref": ref})
+
+    def handle(self, request: BaseHTTPRequestHandler, send_body: bool = True) -> None:
+        """
+        Answers one GET or HEAD for a signed link.
+        """
+        parsed = urllib.parse.urlsplit(request.path)
+        parts = [urllib.parse.unquote(part) for part in parsed.path.strip("/").split("/")]
+        params = dict(urllib.parse.parse_qsl(parsed.query))
+        if len(parts) != 3 or parts[0] not in ("blob", "spool") or not _KEY.match(parts[1]):
+            link_requests.inc(labels={"result": "not_found"})
+            request.send_error(404)
+            return
+        kind, key, file_name = parts
+
+        signature = params.pop("sig", "")
+        if not hmac.compare_digest(signature, self._sign(kind, key, file_name, params)):
+            link_requests.inc(labels={"result": "forbidden"})
+            request.send_error(403, "Invalid download link")
+            return
+        expires = int(params.get("exp", 0))
+        if expires < time.time():
+            link_requests.inc(labels={"result": "expired"})
+            request.send_error(410, "This download link has expired; reload the page for a new one")
+            return
+
+        # Expired bundles may already be gone; the page makes a new one on its next run
+        path = self.history.blob_path(key) if kind == "blob" else self.scratch.path(key)
+        try:
+            if path is None:
+                raise FileNotFoundError(key)
+            handle = open(path, "rb")
+        except FileNotFoundError:
+            link_requests.inc(labels={"result": "not_found"})
+            request.send_error(404)
+            return
+        with handle:
+            stored_codec = detect_codec(handle.read(4))
+            handle.seek(0)
+            stored_size = os.fstat(handle.fileno()).st_size
+            headers = {
+                "Content-Disposition": _disposition(file_name),
+                # Blobs and spool files are content-addressed, so any copy is good until the link expires
+                "Cache-Control": f"private, max-age={max(expires - int(time.time()), 0)}",
+            }
+
+            if params.get("gz"):
+                headers["Content-Type"] = "application/gzip"
+                if stored_codec == "gzip":
+                    # .gz downloads of gzip blobs are the stored file, byte for byte
+                    self._send(request, handle, stored_size, f'"{key}.gz"', headers, send_body, params)
+                else:
+                    self._send_gzip(request, path, headers, send_body, params)
+                return
+
+            headers["Content-Type"] = "application/zip" if kind == "spool" else "application/octet-stream"
+            if stored_codec == "none":
+                self._send(request, handle, stored_size, f'"{key}"', headers, send_body, params)
+                return
+            raw_size = int(params["size"]) if params.get("size") else None
+            accepts_gzip = "gzip" in (request.headers.get("Accept-Encoding") or "")
+            if stored_codec == "gzip" and accepts_gzip and not request.headers.get("Range"):
+                # The browser decompresses while saving; nothing is decoded here
+                headers["Content-Encoding"] = "gzip"
+                headers["Vary"] = "Accept-Encoding"
+                self._send(request, handle, stored_size, f'"{key}-gzip"', headers, send_body, params,
+                           ranges=False)
+                return
+            with open_payload(path) as reader:
+                self._send(request, reader, raw_size, f'"{key}"', headers, send_body, params)
+
+    def _send(self, request: BaseHTTPRequestHandler, reader, total: Optional[int], etag: str,
+              headers: Dict[str, str], send_body: bool, params: Dict[str, str], ranges: bool = True) -> None:
+        # Sends reader's bytes, or the requested range of them when total is known
+        range_header = request.headers.get("Range") if ranges else None
+        if_range = request.headers.get("If-Range")
+        if if_range and if_range != etag:
+            range_header = None
+        try:
+            span = parse_range(range_header, total)
+        except ValueError:
+            link_requests.inc(labels={"result": "unsatisfiable"})
+            request.send_response(416)
+            request.send_header("Content-Range", f"bytes */{total}")
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+
+        if span is None:
+            first, length = 0, total
+            request.send_response(200)
+        else:
+            first, length = span[0], span[1] - span[0] + 1
+            request.send_response(206)
+            request.send_header("Content-Range", f"bytes {span[0]}-{span[1]}/{total}")
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header("ETag", etag)
+        if total is not None and ranges:
+            request.send_header("Accept-Ranges", "bytes")
+        if length is not None:
+            request.send_header("Content-Length", str(length))
+        request.end_headers()
+        if not send_body:
+            link_requests.inc(labels={"result": "head"})
+            return
+
+        # Decompressing readers skip forward by decoding; nothing before first is kept
+        if first:
+            reader.seek(first)
+        if self._copy(request, reader, length, headers.get("Content-Encoding", "identity")):
+            finished = total is None or first + (length or 0) >= total
+            link_requests.inc(labels={"result": "partial" if span else "ok"})
+            if finished and params.get("ref"):
+                self._downloaded(params["ref"])
+
+    def _send_gzip(self, request: BaseHTTPRequestHandler, path: str, headers: Dict[str, str],
+                   send_body: bool, params: Dict[str, str]) -> None:
+        # .gz download of a blob stored another way: compress while sending, length unknown
+        request.send_response(200)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.end_headers()
+        if not send_body:
+            link_requests.inc(labels={"result": "head"})
+            return
+
+        try:
+            with open_payload(path) as reader, \
+                    gzip.GzipFile(fileobj=_CountingWriter(request.wfile), mode="wb", mtime=0) as writer:
+                while True:
+                    chunk = reader.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        link_requests.inc(labels={"result": "ok"})
+        if params.get("ref"):
+            self._downloaded(params["ref"])
+
+    def _copy(self, request: BaseHTTPRequestHandler, reader, length: Optional[int], encoding: str) -> bool:
+        # Streams length bytes (all, when None) in slices; False if the client went away
+        remaining = length
+        try:
+            while remaining is None or remaining > 0:
+                chunk = reader.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                request.wfile.write(chunk)
+                served_bytes.inc(len(chunk), labels={"encoding": encoding})
+                if remaining is not None:
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            link_requests.inc(labels={"result": "aborted"})
+            return False
+        return True
+
+    def _downloaded(self, ref: str) -> None:
+        for callback in self._callbacks:
+            try:
+                callback(ref)
+            except Exception:
+                logger.exception("Download callback failed for %s", ref)
+
+
+_default_server: Optional[ArtifactServer] = None
+_default_server_lock = threading.Lock()
+
+
+def get_artifact_server() -> Optional[ArtifactServer]:
+    """
+    Returns the process-wide artifact server, started on first use, or None when
+    CADIA_ARTIFACT_PORT is not set. Completed downloads mark their job delivered.
+    """
+    global _default_server
+    if not ARTIFACT_PORT:
+        return None
+    with _default_server_lock:
+        if _default_server is None:
+            from jobs import get_job_manager
+
+            _default_server = ArtifactServer(int(ARTIFACT_PORT)).start()
+            _default_server.on_download(lambda job_id: get_job_manager().delivered(job_id))
+        return _default_server
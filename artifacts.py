@@ -0,0 +1,226 @@
+import gzip
+import io
+import logging
+import os
+import shutil
+import tempfile
+import zipfile
+from typing import BinaryIO, Iterable, Optional, Tuple, Union
+
+from metrics import registry
+
+logger = logging.getLogger("cadia")
+
+# Codec for stored artifacts: "gzip", "zstd" (needs the zstandard package) or "none".
+# Reads detect the codec from the data, so changing this never strands old entries
+DEFAULT_CODEC = os.environ.get("CADIA_ARTIFACT_CODEC", "gzip")
+
+# Compression levels; the defaults trade a little ratio for speed on multi-megabyte STEP text
+GZIP_LEVEL = int(os.environ.get("CADIA_GZIP_LEVEL", 6))
+ZSTD_LEVEL = int(os.environ.get("CADIA_ZSTD_LEVEL", 3))
+
+# Data is compressed and decompressed in slices of this size, so a raw and a
+# compressed copy of a large artifact are never both held in memory
+CHUNK_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# File suffixes that ask for a compressed output file
+SUFFIX_CODECS = {".gz": "gzip", ".zst": "zstd"}
+
+artifact_bytes = registry.counter(
+    "cadia_artifact_bytes_total", "Artifact bytes written to storage, raw and as stored after compression."
+)
+
+Payload = Union[bytes, bytearray, memoryview]
+
+
+def _zstd():
+    # zstandard is optional; without it zstd storage falls back to gzip
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def resolve_codec(codec: Optional[str] = None) -> str:
+    """
+    Returns the codec that will actually be used for codec (default: DEFAULT_CODEC).
+    """
+    codec = (codec or DEFAULT_CODEC).lower()
+    if codec == "zstd" and _zstd() is None:
+        logger.warning("zstd artifact compression needs the zstandard package; using gzip")
+        return "gzip"
+    if codec not in ("gzip", "zstd", "none"):
+        raise Exception(f"Unknown artifact codec: {codec}")
+    return codec
+
+
+def detect_codec(head: bytes) -> str:
+    """
+    Returns the codec of data starting with head: "gzip", "zstd" or "none".
+    """
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return "none"
+
+
+def path_codec(path: str) -> str:
+    """
+    Returns the codec a file name asks for by its suffix, e.g. "gzip" for part.step.gz.
+    """
+    return SUFFIX_CODECS.get(os.path.splitext(path)[1].lower(), "none")
+
+
+def strip_suffix(path: str) -> str:
+    """
+    Returns path without a compression suffix: part.step.gz -> part.step.
+    """
+    stem, ext = os.path.splitext(path)
+    return stem if ext.lower() in SUFFIX_CODECS else path
+
+
+def _writer(handle: BinaryIO, codec: str) -> Optional[BinaryIO]:
+    # A compressing writer over handle, or None when data goes in as is
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=handle, mode="wb", compresslevel=GZIP_LEVEL, mtime=0)
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).stream_writer(handle, closefd=False)
+    return None
+
+
+def write_payload(handle: BinaryIO, data: Payload, codec: Optional[str] = None,
+                  chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Writes data to an open binary file, compressed with codec, one slice at a time.
+    """
+    view = memoryview(data)
+    writer = _writer(handle, resolve_codec(codec))
+    for offset in range(0, len(view), chunk_size):
+        (writer or handle).write(view[offset:offset + chunk_size])
+    if writer is not None:
+        writer.close()
+
+
+def write_file_atomic(path: str, data: Payload, codec: Optional[str] = None) -> int:
+    """
+    Stores data compressed at path via a sibling temp file, so readers never see a
+    partial artifact. Returns the stored size.
+    """
+    # Reads tell codecs apart by their magic bytes, so raw data that happens to start
+    # with one is always stored compressed
+    codec = resolve_codec(codec)
+    if codec == "none" and detect_codec(bytes(memoryview(data)[:4])) != "none":
+        codec = "gzip"
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            write_payload(handle, data, codec)
+            handle.flush()
+            os.fsync(handle.fileno())
+            stored = handle.tell()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    artifact_bytes.inc(len(data), labels={"stage": "raw"})
+    artifact_bytes.inc(stored, labels={"stage": "stored"})
+    return stored
+
+
+def open_payload(path: str) -> BinaryIO:
+    """
+    Opens a stored artifact for reading its raw bytes, decompressing as it goes.
+    """
+    handle = open(path, "rb")
+    codec = detect_codec(handle.read(4))
+    handle.seek(0)
+    if codec == "gzip":
+        return gzip.GzipFile(fileobj=handle, mode="rb")
+    if codec == "zstd":
+        zstandard = _zstd()
+        if zstandard is None:
+            handle.close()
+            raise Exception(f"{path} is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().stream_reader(handle, closefd=True)
+    return handle
+
+
+def read_payload(path: str) -> bytes:
+    """
+    Returns the raw bytes of a stored artifact.
+    """
+    with open_payload(path) as reader:
+        return reader.read()
+
+
+def copy_payload(source: str, destination: str, codec: Optional[str] = None) -> None:
+    """
+    Copies a stored artifact to destination, encoded with codec (by default the
+    one destination's suffix asks for). Matching codecs are copied byte for byte.
+    """
+    codec = resolve_codec(codec or path_codec(destination))
+    with open(source, "rb") as handle:
+        stored = detect_codec(handle.read(4))
+    if stored == codec:
+        shutil.copyfile(source, destination)
+        return
+
+    with open_payload(source) as reader, open(destination, "wb") as handle:
+        writer = _writer(handle, codec)
+        shutil.copyfileobj(reader, writer or handle, CHUNK_SIZE)
+        if writer is not None:
+            writer.close()
+
+
+def gzip_payload(source: Union[str, Payload]) -> bytes:
+    """
+    Returns an artifact gzip-compressed for download, from raw bytes or a stored
+    artifact path. Artifacts already stored as gzip are returned as they are.
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as handle:
+            if detect_codec(handle.read(4)) == "gzip":
+                handle.seek(0)
+                return handle.read()
+        buffer = io.BytesIO()
+        with open_payload(source) as reader, _writer(buffer, "gzip") as writer:
+            shutil.copyfileobj(reader, writer, CHUNK_SIZE)
+        return buffer.getvalue()
+
+    buffer = io.BytesIO()
+    write_payload(buffer, source, "gzip")
+    return buffer.getvalue()
+
+
+def write_zip(handle: BinaryIO, members: Iterable[Tuple[str, Union[str, Payload]]]) -> None:
+    """
+    Writes a deflate-compressed zip of (file name, raw bytes or stored artifact path)
+    members to an open binary file, streaming each member through in slices.
+    """
+    with zipfile.ZipFile(handle, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=GZIP_LEVEL) as bundle:
+        for name, source in members:
+            with bundle.open(name, "w", force_zip64=True) as writer:
+                if isinstance(source, str):
+                    with open_payload(source) as reader:
+                        shutil.copyfileobj(reader, writer, CHUNK_SIZE)
+                else:
+                    view = memoryview(source)
+                    for offset in range(0, len(view), CHUNK_SIZE):
+                        writer.write(view[offset:offset + CHUNK_SIZE])
+
+
+def zip_bundle(members: Iterable[Tuple[str, Union[str, Payload]]]) -> bytes:
+    """
+    Returns a zip of (file name, raw bytes or stored artifact path) members, e.g.
+    every format of one generation as a single download.
+    """
+    buffer = io.BytesIO()
+    write_zip(buffer, members)
+    return buffer.getvalue()
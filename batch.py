@@ -0,0 +1,203 @@
+import asyncio
+import csv
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from cache import cache_key, get_cache
+from events import Completed, Emitter, Failed, Written
+from generator import (
+    acache_outputs,
+    aresume_or_submit,
+    await_completion,
+    collect_outputs,
+    extract_output,
+    get_client,
+    resolve_format,
+    write_file,
+)
+from journal import get_journal
+from ratelimit import PRIORITY_BATCH
+
+
+def read_jobs(path: str) -> List[Dict[str, str]]:
+    """
+    Reads batch rows from a JSONL or CSV file.
+    Each row needs a "prompt" and may set "name" (output file name) and "format".
+    """
+    with open(path, "r", encoding="utf-8", newline="") as handle:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(handle))
+        else:
+            rows = [json.loads(line) for line in handle if line.strip()]
+
+    jobs = []
+    for index, row in enumerate(rows):
+        prompt = (row.get("prompt") or "").strip()
+        if not prompt:
+            raise ValueError(f"Row {index + 1} in {path} has no prompt")
+
+        # The output name may carry its own extension; otherwise use the format column
+        name = row.get("name") or row.get("output") or f"job_{index + 1:05d}"
+        if not os.path.splitext(name)[1]:
+            name = f"{name}.{(row.get('format') or 'step').lower()}"
+        jobs.append({"prompt": prompt, "output": name})
+    return jobs
+
+
+def load_manifest(manifest_path: str) -> Dict[str, dict]:
+    """
+    Returns the latest manifest record for every output written so far.
+    """
+    records: Dict[str, dict] = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, "r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                record = json.loads(line)
+                records[record["output"]] = record
+    return records
+
+
+class _Manifest:
+    """
+    Append-only JSONL manifest, flushed per record so a killed run loses nothing.
+    """
+
+    def __init__(self, path: str):
+        self._handle = open(path, "a", encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+        self._handle.write(json.dumps(record) + "\n")
+        self._handle.flush()
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+async def arun_batch(jobs: List[Dict[str, str]], out_dir: str, parallelism: int = 16,
+                     manifest_path: Optional[str] = None, use_cache: bool = True) -> Dict[str, int]:
+    """
+    Generates every job, at most parallelism at once from submission to download.
+    Rows already marked completed in the manifest (with their output on disk) are
+    skipped.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = manifest_path or os.path.join(out_dir, "manifest.jsonl")
+    previous = load_manifest(manifest_path)
+    manifest = _Manifest(manifest_path)
+    summary = {"completed": 0, "failed": 0, "skipped": 0}
+
+    cache = get_cache()
+    journal = get_journal()
+    limiter = asyncio.Semaphore(parallelism)
+    client = None
+    pending = []
+
+    def record(job: dict, status: str, started: float, size: int = 0, error: str = "", job_id: str = "",
+               source: str = "api") -> None:
+        summary[status] += 1
+        emitter = Emitter(job["prompt"], [resolve_format(job["output"])[1]])
+        emitter.job_id = job_id or None
+        if status == "completed":
+            emitter.emit(Written, path=os.path.join(out_dir, job["output"]), size=size)
+            emitter.emit(Completed, source=source, size=size)
+        else:
+            emitter.emit(Failed, error=error)
+        manifest.write({
+            "output": job["output"],
+            "prompt": job["prompt"],
+            "status": status,
+            "job_id": job_id,
+            "latency_s": round(time.monotonic() - started, 3),
+            "bytes": size,
+            "error": error,
+        })
+
+    try:
+        for job in jobs:
+            path = os.path.join(out_dir, job["output"])
+            done = previous.get(job["output"])
+            if done and done["status"] == "completed" and os.path.exists(path):
+                summary["skipped"] += 1
+                continue
+
+            started = time.monotonic()
+            file_ext, output_format = resolve_format(path)
+            key = cache_key(job["prompt"], output_format)
+            if use_cache:
+                if await asyncio.to_thread(cache.copy_to, key, path):
+                    record(job, "completed", started, size=os.path.getsize(path), source="cache")
+                    continue
+
+            pending.append((job, path, file_ext, output_format, key, started))
+
+        if pending:
+            client = get_client()
+
+        # Rows asking for the same prompt and format share one remote job
+        groups: Dict[str, list] = {}
+        for entry in pending:
+            groups.setdefault(entry[4], []).append(entry)
+
+        async def run(entries):
+            # At most `parallelism` groups are between submission and download at once
+            async with limiter:
+                return await generate(entries)
+
+        async def generate(entries):
+            job, _, _, output_format, _, _ = entries[0]
+            try:
+                # Rows whose job was submitted by a killed earlier run pick it back up
+                result = await aresume_or_submit(client, job["prompt"], output_format, reuse_completed=use_cache,
+                                                 priority=PRIORITY_BATCH)
+            except Exception as e:
+                return [(job, started, "", None, str(e)) for job, _, _, _, _, started in entries]
+            try:
+                result = await await_completion(client, result)
+                await acache_outputs(job["prompt"], collect_outputs(result), result)
+            except Exception as e:
+                if result.completed_at is not None:
+                    await asyncio.to_thread(journal.mark, str(result.id), "failed", str(e))
+                return [(job, started, str(result.id), None, str(e)) for job, _, _, _, _, started in entries]
+
+            finished = []
+            for job, path, file_ext, _, _, started in entries:
+                try:
+                    data = extract_output(result, file_ext)
+                    await asyncio.to_thread(write_file, path, data)
+                except Exception as e:
+                    finished.append((job, started, str(result.id), None, str(e)))
+                else:
+                    finished.append((job, started, str(result.id), data, ""))
+            # A row that could not be written leaves the cached job for --resume to deliver
+            if all(data is not None for _, _, _, data, _ in finished):
+                await asyncio.to_thread(journal.mark, str(result.id), "delivered")
+            else:
+                await asyncio.to_thread(journal.mark, str(result.id), "completed")
+            return finished
+
+        tasks = [run(entries) for entries in groups.values()]
+
+        # Record each job the moment it lands on disk
+        for task in asyncio.as_completed(tasks):
+            for job, started, job_id, data, error in await task:
+                if data is None:
+                    record(job, "failed", started, error=error, job_id=job_id)
+                else:
+                    record(job, "completed", started, size=len(data), job_id=job_id)
+    finally:
+        manifest.close()
+
+    return summary
+
+
+def run_batch(jobs_path: str, out_dir: str, parallelism: int = 16,
+              manifest_path: Optional[str] = None, use_cache: bool = True) -> Dict[str, int]:
+    """
+    Synchronous entry point for the CLI batch mode.
+    """
+    jobs = read_jobs(jobs_path)
+    return asyncio.run(arun_batch(jobs, out_dir, parallelism, manifest_path, use_cache))
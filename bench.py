@@ -0,0 +1,291 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+# Concurrency levels measured by default
+DEFAULT_LEVELS = (1, 10, 100, 1000)
+
+# A metric that gets worse by more than this fraction against the baseline is a regression
+DEFAULT_TOLERANCE = 0.2
+
+# Report fields where a higher value is better; every other compared field is lower-is-better
+HIGHER_IS_BETTER = {"throughput_jobs_s"}
+COMPARED_FIELDS = ("throughput_jobs_s", "latency_p50_s", "latency_p99_s", "memory_per_job_kb", "polls_per_job")
+
+
+def _rss_bytes() -> int:
+    # Current resident set size; /proc is Linux-only, so fall back to the peak elsewhere
+    try:
+        with open("/proc/self/statm") as handle:
+            return int(handle.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+async def run_level(concurrency: int, formats: List[str], server, sample_interval: float = 0.05) -> dict:
+    """
+    Runs concurrency generations at once against the mock server and returns their metrics.
+    """
+    from generator import agenerate_cad_formats
+    from clients import get_pool
+    from poller import get_poller
+
+    server.reset_counts()
+    polls_before = get_poller().polls_issued
+    requests_before = get_pool().stats()["requests"]
+    baseline_rss = peak_rss = _rss_bytes()
+    run_id = uuid.uuid4().hex[:8]
+    latencies: List[float] = []
+    failures: List[str] = []
+
+    async def sample_memory() -> None:
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, _rss_bytes())
+            await asyncio.sleep(sample_interval)
+
+    async def one(index: int) -> None:
+        started = time.perf_counter()
+        try:
+            # Unique prompts so neither the cache, the journal nor coalescing short-circuit the run
+            await agenerate_cad_formats(f"bench {run_id} part {index}", formats, use_cache=False)
+        except Exception as e:
+            failures.append(str(e))
+        else:
+            latencies.append(time.perf_counter() - started)
+
+    sampler = asyncio.ensure_future(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(concurrency)))
+    wall = time.perf_counter() - started
+    sampler.cancel()
+    peak_rss = max(peak_rss, _rss_bytes())
+
+    polls = get_poller().polls_issued - polls_before
+    return {
+        "concurrency": concurrency,
+        "completed": len(latencies),
+        "failed": len(failures),
+        "wall_s": round(wall, 3),
+        "throughput_jobs_s": round(len(latencies) / wall, 3) if wall else 0.0,
+        "latency_p50_s": round(percentile(latencies, 0.50), 3),
+        "latency_p99_s": round(percentile(latencies, 0.99), 3),
+        "latency_mean_s": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        "peak_rss_delta_mb": round((peak_rss - baseline_rss) / 1024**2, 2),
+        "memory_per_job_kb": round((peak_rss - baseline_rss) / 1024 / concurrency, 1),
+        "polls": polls,
+        "polls_per_job": round(polls / concurrency, 2),
+        "http_requests": get_pool().stats()["requests"] - requests_before,
+        "server_counts": dict(server.counts),
+        "errors": sorted(set(failures))[:5],
+    }
+
+
+def measure_startup(repeats: int = 5) -> Dict[str, float]:
+    """
+    Returns the median wall time of fresh interpreters importing the library and
+    running the CLI's --help, the cold-start cost every scripted invocation pays.
+    """
+    from cache import ResultCache, cache_key
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    workdir = tempfile.mkdtemp(prefix="cadia-startup-")
+    env = dict(os.environ, CADIA_CACHE_DIR=os.path.join(workdir, "cache"), CADIA_DATA_DIR=os.path.join(workdir, "data"))
+
+    # A primed cache entry, so the CLI generate run measures startup rather than the API
+    prompt = "startup benchmark part"
+    ResultCache(env["CADIA_CACHE_DIR"]).put(cache_key(prompt, "step"), b"ISO-10303-21;\nEND-ISO-10303-21;\n")
+
+    commands = {
+        "python_s": [sys.executable, "-c", "pass"],
+        "import_cad_s": [sys.executable, "-c", "import cad"],
+        "cli_help_s": [sys.executable, os.path.join(here, "cad.py"), "--help"],
+        "cli_cached_generate_s": [sys.executable, os.path.join(here, "cad.py"), prompt,
+                                  "-o", os.path.join(workdir, "out.step")],
+    }
+    timings = {}
+    for name, command in commands.items():
+        samples = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            subprocess.run(command, cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            samples.append(time.perf_counter() - started)
+        timings[name] = round(statistics.median(samples), 3)
+    return timings
+
+
+def measure_similarity(size: int, queries: int = 500, seed: int = 1) -> Dict[str, float]:
+    """
+    Builds a prompt index of size synthetic prompts and returns the build time and the
+    lookup latency percentiles the app pays before every submission.
+    """
+    import random
+    from similarity import PromptIndex
+
+    rng = random.Random(seed)
+    shapes = ("cube", "bracket", "gear", "flange", "pipe", "plate", "bolt", "washer", "hinge", "pulley",
+              "shaft", "enclosure", "knob", "spacer", "mount")
+    features = ("with a hole", "with four mounting holes", "with rounded edges", "with a chamfer", "with a slot",
+                "with teeth", "with a keyway", "with ribs", "hollow", "with threads", "with a counterbore")
+    sizes = ("small", "large", "thin", "thick", "sturdy", "compact", "tall", "flat")
+    units = ("mm", "millimeters", "cm", "inches")
+
+    def prompt() -> str:
+        return (f"{rng.choice(('a', 'the', ''))} {rng.choice(sizes)} {rng.choice(shapes)} {rng.randint(1, 300)}"
+                f"{rng.choice(units)} {rng.choice(features)} and {rng.choice(features)}")
+
+    prompts = [prompt() for _ in range(size)]
+    index = PromptIndex()
+    started = time.perf_counter()
+    index.add_many(prompts, list(range(size)))
+    index.rebuild()
+    build = time.perf_counter() - started
+
+    # Half reworded stored prompts, half unseen ones
+    lookups = [text.upper().replace(" ", "  ") for text in rng.sample(prompts, min(queries // 2, size))]
+    lookups += [prompt() for _ in range(queries - len(lookups))]
+    latencies = []
+    for text in lookups:
+        started = time.perf_counter()
+        index.search(text, limit=3, match_numbers=True)
+        latencies.append(time.perf_counter() - started)
+    return {
+        "prompts": len(index),
+        "build_s": round(build, 3),
+        "lookup_p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "lookup_p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compare(results: List[dict], baseline: dict, tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Returns a description of every metric that regressed beyond tolerance.
+    """
+    previous = {entry["concurrency"]: entry for entry in baseline.get("results", [])}
+    regressions = []
+    for entry in results:
+        old = previous.get(entry["concurrency"])
+        if not old:
+            continue
+        for field in COMPARED_FIELDS:
+            before, after = old.get(field), entry.get(field)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if field in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    f"{field} at concurrency {entry['concurrency']}: {before} -> {after} ({change:+.0%} worse)"
+                )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end generation against the local mock Zoo API.")
+    parser.add_argument("--levels", type=str, default=",".join(map(str, DEFAULT_LEVELS)),
+                        help="Comma-separated concurrency levels.")
+    parser.add_argument("--formats", type=str, default="step", help="Comma-separated formats per job.")
+    parser.add_argument("--latency", type=float, default=2.0, help="Median mock job duration in seconds.")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Log-normal spread of mock job durations.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of mock jobs that fail.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of mock requests answered with 429.")
+    parser.add_argument("--triangles", type=int, default=5000, help="Triangles in every mock model.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the mock latency and failure draws.")
+    parser.add_argument("--startup", action="store_true", help="Only measure interpreter and CLI cold-start time.")
+    parser.add_argument("--similarity", type=int, metavar="N",
+                        help="Only measure near-duplicate lookup latency over N stored prompts.")
+    parser.add_argument("--report", type=str, default="bench_report.json", help="Where to write the JSON report.")
+    parser.add_argument("--baseline", type=str, help="Earlier report to compare against; regressions exit non-zero.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative regression.")
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        startup = measure_startup()
+        print(json.dumps(startup, indent=2))
+        with open(args.report, "w", encoding="utf-8") as handle:
+            json.dump({"created_at": time.time(), "startup": startup}, handle, indent=2)
+        return 0
+
+    if args.similarity:
+        similarity = measure_similarity(args.similarity)
+        print(json.dumps(similarity, indent=2))
+        with open(args.report, "w", encoding="utf-8") as handle:
+            json.dump({"created_at": time.time(), "similarity": similarity}, handle, indent=2)
+        return 0
+
+    # The API rate limits are for the real service; here we measure our own pipeline.
+    # Configuration is read at import time, so it is set before importing the client code
+    workdir = tempfile.mkdtemp(prefix="cadia-bench-")
+    os.environ.setdefault("CADIA_CACHE_DIR", os.path.join(workdir, "cache"))
+    os.environ.setdefault("CADIA_DATA_DIR", os.path.join(workdir, "data"))
+    os.environ.setdefault("CADIA_SUBMIT_RATE", "10000")
+    os.environ.setdefault("CADIA_SUBMIT_BURST", "10000")
+    os.environ.setdefault("CADIA_POLL_RATE", "10000")
+    os.environ.setdefault("CADIA_POLL_BURST", "10000")
+    os.environ.setdefault("ZOO_API_TOKEN", "mock-token")
+
+    from mock_server import MockZooServer
+
+    server = MockZooServer(latency_median=args.latency, latency_sigma=args.sigma, failure_rate=args.failure_rate,
+                           throttle_rate=args.throttle_rate, output_triangles=args.triangles, seed=args.seed).start()
+    os.environ["ZOO_HOST"] = server.url
+
+    from clients import get_pool
+    get_pool().base_url = server.url
+
+    formats = [name.strip() for name in args.formats.split(",") if name.strip()]
+    results = []
+    try:
+        for level in (int(value) for value in args.levels.split(",")):
+            result = asyncio.run(run_level(level, formats, server))
+            results.append(result)
+            print(f"{level:>5} jobs: {result['throughput_jobs_s']:>8.2f} jobs/s  p50 {result['latency_p50_s']:.2f}s  "
+                  f"p99 {result['latency_p99_s']:.2f}s  {result['memory_per_job_kb']:.0f} KB/job  "
+                  f"{result['polls_per_job']:.1f} polls/job  {result['failed']} failed")
+    finally:
+        server.stop()
+
+    report = {
+        "created_at": time.time(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("report", "baseline")},
+        "results": results,
+    }
+    with open(args.report, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Report written to {args.report}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from importlib import metadata
+from typing import Optional
+
+from artifacts import copy_payload, read_payload, write_file_atomic
+from prompts import canonicalize_prompt
+
+# Default location and limits for the on-disk result cache
+DEFAULT_CACHE_DIR = os.environ.get(
+    "CADIA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "cadia")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("CADIA_CACHE_MAX_BYTES", 2 * 1024**3))
+DEFAULT_MAX_AGE = float(os.environ.get("CADIA_CACHE_MAX_AGE", 30 * 24 * 3600))
+
+# Temp files from writes interrupted by a crash are removed once this old
+STALE_TEMP_AGE = 3600
+
+
+def api_version() -> str:
+    """
+    Returns the API/model version string that cache keys are scoped to.
+    """
+    # Override lets us invalidate everything when the remote model changes
+    override = os.environ.get("CADIA_MODEL_VERSION")
+    if override:
+        return override
+    try:
+        return f"kittycad-{metadata.version('kittycad')}"
+    except metadata.PackageNotFoundError:
+        return "kittycad-unknown"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a prompt so trivially different spellings (casing, whitespace,
+    units, number formats) share a cache entry.
+    """
+    return canonicalize_prompt(prompt)
+
+
+def cache_key(prompt: str, output_format: str, version: Optional[str] = None) -> str:
+    """
+    Returns the content address for a prompt/format/version combination.
+    """
+    material = "\0".join([
+        normalize_prompt(prompt),
+        str(output_format).lower(),
+        version or api_version(),
+    ])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of generated CAD payloads with size- and age-based eviction.
+    Payloads are stored compressed; max_bytes counts their size on disk.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.bin")
+
+    def _fresh_path(self, key: str) -> Optional[str]:
+        # Expired entries count as a miss and are removed on sight
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if time.time() - stat.st_mtime > self.max_age:
+            self._remove(path)
+            return None
+
+        # Touch the access time so eviction is least-recently-used
+        try:
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+        return path
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Returns the cached payload for a key, or None on a miss.
+        """
+        path = self._fresh_path(key)
+        if path is None:
+            return None
+        try:
+            return read_payload(path)
+        except FileNotFoundError:
+            return None
+
+    def copy_to(self, key: str, destination: str) -> bool:
+        """
+        Copies a cached payload straight to a file without loading it into memory,
+        compressed if destination ends in .gz or .zst. Returns False on a miss.
+        """
+        path = self._fresh_path(key)
+        if path is None:
+            return False
+        try:
+            copy_payload(path, destination)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, key: str, data: bytes, meta: Optional[dict] = None) -> None:
+        """
+        Atomically stores a payload, compressed, (and optional metadata) under a key.
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file_atomic(path, data)
+        if meta is not None:
+            self._atomic_write(path[:-4] + ".json", json.dumps(meta).encode("utf-8"))
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Drops expired entries, then least-recently-used ones until under max_bytes,
+        and temp files left by interrupted writes. Returns the number of entries removed.
+        """
+        with self._lock:
+            now = time.time()
+            entries = []
+            removed = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if name.endswith(".tmp"):
+                        try:
+                            if now - os.stat(path).st_mtime > STALE_TEMP_AGE:
+                                os.unlink(path)
+                        except FileNotFoundError:
+                            pass
+                        continue
+                    if not name.endswith(".bin"):
+                        continue
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if now - stat.st_mtime > self.max_age:
+                        self._remove(path)
+                        removed += 1
+                    else:
+                        entries.append((stat.st_atime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+                removed += 1
+            return removed
+
+    @staticmethod
+    def _atomic_write(path: str, data: bytes) -> None:
+        # Write to a sibling temp file and rename so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        for candidate in (path, path[:-4] + ".json"):
+            try:
+                os.unlink(candidate)
+            except FileNotFoundError:
+                pass
+
+
+_default_cache: Optional[ResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResultCache:
+    """
+    Returns the process-wide result cache, creating it on first use.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
@@ -1,126 +1,81 @@
+import asyncio
 import os
-import time
-import streamlit as st
-
-from kittycad.api.ml import create_text_to_cad, get_text_to_cad_model_for_user
-from kittycad.client import Client
-from kittycad.models import (
-    ApiCallStatus,
-    Error,
-    FileExportFormat,
-    TextToCad,
-    TextToCadCreateBody,
+import sys
+from typing import Optional, Union
+
+# The generation library lives in generator; it is re-exported here so existing
+# imports keep working. Neither module imports Streamlit or kittycad.models up
+# front, so the CLI starts quickly and cache hits never load them at all
+from artifacts import path_codec, strip_suffix
+from cache import cache_key
+from events import Event, get_bus, progress_handler
+from generator import (
+    EXPORT_FORMATS,
+    MAX_CONCURRENT_JOBS,
+    WRITE_CHUNK_SIZE,
+    aconvert,
+    agenerate_cad,
+    agenerate_cad_formats,
+    aresume_or_submit,
+    aresume_unfinished,
+    asubmit,
+    await_completion,
+    cache_meta,
+    collect_outputs,
+    extract_output,
+    generate_cad_formats,
+    get_client,
+    resolve_format,
+    write_file,
 )
+from journal import get_journal
 
-def generate_cad(prompt: str, output_file: str = "output.step") -> str:
+
+def generate_cad(prompt: str, output_file: str = "output.step", use_cache: bool = True,
+                 output_format: Optional[str] = None, in_memory: bool = False) -> Union[str, bytes]:
     """
     Generates a CAD file from a text prompt using the Zoo text-to-CAD API.
+    Identical prompts are served from the local result cache unless use_cache is False.
+    With in_memory=True the payload bytes are returned instead of written to output_file.
     """
-    # Get API key exclusively from Streamlit secrets
-    try:
-        os.environ["ZOO_API_TOKEN"] = st.secrets["ZOO_API_KEY"]
-    except (KeyError, AttributeError):
-        raise ValueError("ZOO_API_KEY not found in Streamlit secrets. Please add it to .streamlit/secrets.toml")
-
-    # Create client directly with API key instead of using environment variables
-    client = Client(token=os.environ["ZOO_API_TOKEN"])
-    
-    # Determine file format from output file extension
-    file_ext = os.path.splitext(output_file)[1].lstrip('.')
-    if not file_ext:
-        file_ext = "step"  # Default format
-    
-    # Convert file extension to FileExportFormat enum
-    format_map = {
-        "step": FileExportFormat.STEP,
-        "stl": FileExportFormat.STL,
-    }
-    
-    # Default to STEP if extension is not supported
-    output_format = format_map.get(file_ext.lower(), FileExportFormat.STEP)
-
-    # Show progress if in Streamlit
-    try:
-        progress_bar = st.progress(0)
-        status_text = st.empty()
-        status_text.text("Submitting your design prompt to the API...")
-    except:
-        progress_bar = None
-        status_text = None
-    
-    # Prompt the API to generate a 3D model from text
-    response = create_text_to_cad.sync(
-        client=client,
+    # Show progress if in Streamlit; only a process that already runs it pays for the import
+    on_event = None
+    if "streamlit" in sys.modules:
+        import streamlit as st
+        try:
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+        except Exception:
+            progress_bar = None
+
+        if progress_bar is not None:
+            def show_progress(fraction: float, message: str) -> None:
+                progress_bar.progress(fraction)
+                status_text.text(message)
+
+            on_event = progress_handler(show_progress)
+
+    return asyncio.run(agenerate_cad(
+        prompt,
+        output_file,
+        use_cache=use_cache,
+        on_event=on_event,
         output_format=output_format,
-        body=TextToCadCreateBody(
-            prompt=prompt,
-        ),
-    )
+        in_memory=in_memory,
+    ))
 
-    if isinstance(response, Error) or response is None:
-        raise Exception(f"Error: {response}")
-
-    result: TextToCad = response
-
-    # Polling to check if the task is complete
-    poll_count = 0
-    max_polls = 60  # Maximum number of polls (5 min at 5 sec intervals)
-    
-    while result.completed_at is None:
-        if status_text:
-            status_text.text(f"Generating your CAD model... (this may take a minute)")
-        
-        if progress_bar:
-            progress = min(0.9, poll_count / max_polls)
-            progress_bar.progress(progress)
-            
-        # Wait for 5 seconds before checking again
-        time.sleep(5)
-        poll_count += 1
-        
-        if poll_count >= max_polls:
-            raise Exception("CAD generation timed out after 5 minutes")
-
-        # Check the status of the task
-        response = get_text_to_cad_model_for_user.sync(
-            client=client,
-            id=result.id,
-        )
 
-        if isinstance(response, Error) or response is None:
-            raise Exception(f"Error: {response}")
-
-        result = response
-
-    if progress_bar:
-        progress_bar.progress(1.0)
-        
-    if status_text:
-        status_text.text("CAD model completed! Preparing download...")
-
-    if result.status == ApiCallStatus.FAILED:
-        # Print out the error message
-        raise Exception(f"Text-to-CAD failed: {result.error}")
-
-    elif result.status == ApiCallStatus.COMPLETED:
-        if result.outputs is None:
-            raise Exception("Text-to-CAD completed but returned no files.")
-
-        # Get the source file with the correct extension
-        output_key = f"source.{file_ext.lower()}"
-        if output_key not in result.outputs:
-            # Fallback to any available output
-            if not result.outputs:
-                raise Exception("No output files available")
-            output_key = next(iter(result.outputs))
-
-        final_result = result.outputs[output_key]
-        
-        # Save the data
-        with open(output_file, "w", encoding="utf-8") as output_file_handle:
-            output_file_handle.write(final_result.decode("utf-8"))
-    
-    return output_file
+def print_event(event: Event) -> None:
+    """
+    CLI progress output: one line per event on stderr, with polls updating a single line in place.
+    """
+    percent = f"[{event.progress:>4.0%}] " if event.progress is not None else "       "
+    if event.kind == "polled":
+        sys.stderr.write(f"\r\x1b[K{percent}{event.message} ({event.elapsed:.0f}s)")
+    else:
+        sys.stderr.write(f"\r\x1b[K{percent}{event.message}\n")
+    sys.stderr.flush()
+
 
 if __name__ == "__main__":
     import argparse
@@ -128,12 +83,100 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Generate a CAD file from a text prompt using the Zoo text-to-CAD API."
     )
-    parser.add_argument("prompt", type=str, help="Text prompt describing the design for the CAD file.")
+    parser.add_argument("prompt", type=str, nargs="?", help="Text prompt describing the design for the CAD file.")
     parser.add_argument("-o", "--output", type=str, default="output.step", help="Output file path for the generated CAD file.")
+    parser.add_argument("--compress", action="store_true", help="Write gzip-compressed outputs (e.g. output.step.gz).")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the local result cache and always call the API.")
+    parser.add_argument("--formats", type=str, help="Comma-separated formats to export from one generation, e.g. step,stl.")
+    parser.add_argument("--batch", type=str, help="JSONL or CSV file of prompts to generate in one run.")
+    parser.add_argument("--sweep", type=str, metavar="TEMPLATE",
+                        help='Generate every variant of a prompt template, e.g. "gear with {teeth} teeth".')
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUES",
+                        help="Sweep values for a template field: a list (20,24,28) or a range (5:10:2.5).")
+    parser.add_argument("--pair", action="store_true",
+                        help="Pair the i-th values of every --param instead of taking every combination.")
+    parser.add_argument("--out-dir", type=str, default="batch_output", help="Directory for batch and sweep outputs.")
+    parser.add_argument("--parallel", type=int, default=16, help="Maximum jobs in flight (submitted but not yet downloaded) in batch and sweep mode.")
+    parser.add_argument("--manifest", type=str, help="Batch manifest path (defaults to <out-dir>/manifest.jsonl).")
+    parser.add_argument("--resume", action="store_true", help="Reattach to unfinished jobs from earlier runs and save them to --out-dir.")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while running.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log structured timing events to stderr.")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Do not print progress to stderr.")
     args = parser.parse_args()
 
-    try:
-        result_path = generate_cad(args.prompt, args.output)
-        print(f"CAD file successfully generated and saved to: {result_path}")
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    # Progress lines are for people; piped or scripted runs stay quiet
+    if not args.quiet and sys.stderr.isatty():
+        get_bus().subscribe(print_event)
+
+    if args.verbose:
+        import logging
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if args.metrics_port:
+        from metrics import serve_metrics
+        serve_metrics(args.metrics_port)
+
+    # A .gz or .zst output name compresses on its own; --compress asks for .gz
+    output = args.output
+    if args.compress and path_codec(output) == "none":
+        output += ".gz"
+
+    if args.batch:
+        from batch import run_batch
+
+        summary = run_batch(
+            args.batch,
+            args.out_dir,
+            parallelism=args.parallel,
+            manifest_path=args.manifest,
+            use_cache=not args.no_cache,
+        )
+        print(f"Batch finished: {summary['completed']} completed, {summary['failed']} failed, {summary['skipped']} skipped")
+    elif args.sweep:
+        from sweep import format_table, parse_values, run_sweep
+
+        try:
+            params = {}
+            for param in args.param:
+                name, separator, values = param.partition("=")
+                if not separator:
+                    parser.error(f"--param needs NAME=VALUES, got {param}")
+                params[name.strip()] = parse_values(values)
+            rows = run_sweep(
+                args.sweep,
+                params,
+                args.formats.split(",") if args.formats else ["step"],
+                args.out_dir,
+                mode="zip" if args.pair else "grid",
+                parallelism=args.parallel,
+                use_cache=not args.no_cache,
+                on_row=lambda row: print(f"{row['variant']}: {row['status']}", file=sys.stderr),
+            )
+            print(format_table(rows))
+            print(f"Sweep outputs and sweep.csv saved to: {args.out_dir}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
+    elif args.resume:
+        recovered = asyncio.run(aresume_unfinished(args.out_dir))
+        for path in recovered:
+            print(f"Recovered CAD file saved to: {path}")
+        if not recovered:
+            print("No unfinished jobs to resume.")
+    elif not args.prompt:
+        parser.error("a prompt is required unless --batch, --sweep or --resume is given")
+    elif args.formats:
+        try:
+            artifacts = generate_cad_formats(args.prompt, args.formats.split(","), use_cache=not args.no_cache)
+            stem = os.path.splitext(strip_suffix(args.output))[0]
+            suffix = output[len(strip_suffix(output)):]
+            for ext, payload in artifacts.items():
+                write_file(f"{stem}.{ext}{suffix}", payload)
+                print(f"CAD file successfully generated and saved to: {stem}.{ext}{suffix}")
+            get_journal().mark_delivered([cache_key(args.prompt, ext) for ext in artifacts])
+        except Exception as e:
+            print(f"An error occurred: {e}")
+    else:
+        try:
+            result_path = generate_cad(args.prompt, output, use_cache=not args.no_cache)
+            print(f"CAD file successfully generated and saved to: {result_path}")
+        except Exception as e:
+            print(f"An error occurred: {e}")
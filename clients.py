@@ -0,0 +1,189 @@
+import asyncio
+import importlib.util
+import os
+import threading
+from types import ModuleType
+from typing import Any, Dict, Optional
+
+import httpx
+from kittycad.client import Client
+
+from metrics import registry
+from ratelimit import PRIORITY_NORMAL, AdmissionController, QueueCallback, api_retries
+
+# Connection pool limits shared by every request the process makes
+DEFAULT_MAX_CONNECTIONS = int(os.environ.get("CADIA_HTTP_MAX_CONNECTIONS", 100))
+DEFAULT_MAX_KEEPALIVE = int(os.environ.get("CADIA_HTTP_MAX_KEEPALIVE", 20))
+DEFAULT_KEEPALIVE_EXPIRY = float(os.environ.get("CADIA_HTTP_KEEPALIVE_EXPIRY", 60.0))
+
+# Send every request somewhere else, e.g. the local mock server, with ZOO_HOST
+DEFAULT_BASE_URL = os.environ.get("ZOO_HOST")
+
+# HTTP/2 needs the optional h2 package
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class ClientPool:
+    """
+    Process-wide kittycad clients backed by one keep-alive HTTP connection pool.
+
+    The generated kittycad endpoints open a fresh connection per call, so requests
+    are built with each endpoint's own helpers and sent through the shared pool.
+    Requests from any thread or event loop are funnelled onto the pool's own loop,
+    so a single connection pool and a single admission controller serve the whole process.
+    """
+
+    def __init__(self, max_connections: int = DEFAULT_MAX_CONNECTIONS,
+                 max_keepalive: int = DEFAULT_MAX_KEEPALIVE,
+                 keepalive_expiry: float = DEFAULT_KEEPALIVE_EXPIRY,
+                 http2: bool = HTTP2_AVAILABLE,
+                 admission: Optional[AdmissionController] = None,
+                 base_url: Optional[str] = DEFAULT_BASE_URL):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.admission = admission or AdmissionController()
+        self.base_url = base_url
+
+        self._clients: Dict[str, Client] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "connections_opened": 0, "http2_requests": 0, "retries": 0}
+
+        self._async_http: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    def client(self, token: str) -> Client:
+        """
+        Returns the kittycad Client for a token, creating it on first use.
+        """
+        with self._lock:
+            client = self._clients.get(token)
+            if client is None:
+                client = Client(token=token)
+                if self.base_url:
+                    client = client.with_base_url(self.base_url.rstrip("/"))
+                self._clients[token] = client
+            return client
+
+    def call(self, endpoint: ModuleType, method: str, client: Client,
+             priority: int = PRIORITY_NORMAL, **params: Any) -> Any:
+        """
+        Synchronously calls a kittycad endpoint module through the pooled connections.
+        Must not be called from the pool's own loop.
+        """
+        loop = self._ensure_loop()
+        coroutine = self._asend(endpoint, method, client, params, priority, None)
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    async def acall(self, endpoint: ModuleType, method: str, client: Client,
+                    priority: int = PRIORITY_NORMAL, on_queue: Optional[QueueCallback] = None,
+                    **params: Any) -> Any:
+        """
+        Awaits a kittycad endpoint module call through the pooled connections.
+        Calls wait their turn for an API token by priority; on_queue is called from
+        the pool's thread with the caller's queue position while it waits.
+        """
+        loop = self._ensure_loop()
+        coroutine = self._asend(endpoint, method, client, params, priority, on_queue)
+        if asyncio.get_running_loop() is loop:
+            return await coroutine
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
+
+    def stats(self) -> dict:
+        """
+        Returns request and connection counters; reused_requests shows keep-alive at work.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["clients"] = len(self._clients)
+        stats["reused_requests"] = max(0, stats["requests"] - stats["connections_opened"])
+        stats["reuse_ratio"] = stats["reused_requests"] / stats["requests"] if stats["requests"] else 0.0
+        stats["http2"] = self.http2
+        stats["admission"] = self.admission.stats()
+        return stats
+
+    async def _asend(self, endpoint: ModuleType, method: str, client: Client, params: dict,
+                     priority: int, on_queue: Optional[QueueCallback]) -> Any:
+        kwargs = self._request_kwargs(endpoint, client, params)
+        bucket = self.admission.bucket_for(method)
+        attempt = 0
+        while True:
+            await bucket.acquire(priority, on_queue)
+            response = await self._async_client().request(method, **kwargs, extensions={"trace": self._trace_async})
+            self._count(response)
+
+            delay = self.admission.retry_delay(response, method, attempt)
+            if delay is None:
+                return endpoint._build_response(response=response).parsed
+
+            # A 429 means everyone is over the limit, not just this call
+            if response.status_code == 429:
+                bucket.pause(delay)
+            attempt += 1
+            with self._lock:
+                self._stats["retries"] += 1
+            api_retries.inc(labels={"status": str(response.status_code)})
+            registry.emit("api_retry", method=method, status=response.status_code, attempt=attempt, delay_s=delay)
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _request_kwargs(endpoint: ModuleType, client: Client, params: dict) -> dict:
+        kwargs = endpoint._get_kwargs(client=client, **params)
+        # Per-request cookies are deprecated in httpx and never set by our clients
+        if not kwargs.get("cookies"):
+            kwargs.pop("cookies", None)
+        return kwargs
+
+    def _count(self, response: httpx.Response) -> None:
+        with self._lock:
+            self._stats["requests"] += 1
+            if response.http_version == "HTTP/2":
+                self._stats["http2_requests"] += 1
+
+    def _connection_opened(self, event_name: str) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self._lock:
+                self._stats["connections_opened"] += 1
+
+    async def _trace_async(self, event_name: str, info: dict) -> None:
+        self._connection_opened(event_name)
+
+    def _async_client(self) -> httpx.AsyncClient:
+        # Only ever touched from the pool's own loop
+        if self._async_http is None:
+            self._async_http = httpx.AsyncClient(limits=self.limits, http2=self.http2)
+        return self._async_http
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cad-http-pool", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+        return self._loop
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+
+_default_pool: Optional[ClientPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool() -> ClientPool:
+    """
+    Returns the process-wide client pool, creating it on first use.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ClientPool()
+        return _default_pool
@@ -0,0 +1,76 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class InFlightRegistry:
+    """
+    Single-flight deduplication: callers asking for a key that is already being
+    produced wait for that result instead of starting their own. Works across
+    threads and event loops, so sync and async callers share the same flights.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def run(self, key: str, produce: Callable[[], Awaitable[Any]],
+                  on_join: Optional[Callable[[], None]] = None) -> Any:
+        """
+        Returns produce()'s result for key, calling it only if no flight is running.
+        on_join is called when this caller attaches to an existing flight.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = concurrent.futures.Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if on_join:
+                on_join()
+            # Shielded: a follower going away must not cancel the flight for everyone else
+            return await asyncio.shield(asyncio.wrap_future(flight))
+
+        try:
+            result = await produce()
+        except asyncio.CancelledError:
+            flight.set_exception(Exception("The shared generation was cancelled"))
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            raise
+        else:
+            flight.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    def stats(self) -> dict:
+        """
+        Returns how many flights were started and how many calls joined one.
+        """
+        with self._lock:
+            return {"in_flight": len(self._flights), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+_default_registry: Optional[InFlightRegistry] = None
+_default_registry_lock = threading.Lock()
+
+
+def get_registry() -> InFlightRegistry:
+    """
+    Returns the process-wide in-flight registry.
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = InFlightRegistry()
+        return _default_registry
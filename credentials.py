@@ -0,0 +1,147 @@
+import os
+import re
+import sys
+import threading
+from typing import List, Optional, Sequence
+
+# Key holding the API token in Streamlit secrets and secrets.toml files
+SECRET_NAME = "ZOO_API_KEY"
+
+# Environment variable holding the API token (kittycad's own convention)
+TOKEN_ENV_VAR = "ZOO_API_TOKEN"
+
+# Files searched for a token: a plain-text token file, then Streamlit's secrets.toml locations
+DEFAULT_TOKEN_FILES = (
+    os.environ.get("CADIA_TOKEN_FILE", os.path.join(os.path.expanduser("~"), ".config", "cadia", "token")),
+    os.path.join(".streamlit", "secrets.toml"),
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+)
+
+# Providers tried in order; override with e.g. CADIA_CREDENTIALS=env,file
+DEFAULT_ORDER = os.environ.get("CADIA_CREDENTIALS", "streamlit,env,file")
+
+_TOML_SECRET = re.compile(rf'^\s*{SECRET_NAME}\s*=\s*["\']([^"\']+)["\']', re.MULTILINE)
+
+
+class EnvCredentials:
+    """
+    Reads the token from an environment variable.
+    """
+
+    def __init__(self, variable: str = TOKEN_ENV_VAR):
+        self.variable = variable
+
+    def token(self) -> Optional[str]:
+        return os.environ.get(self.variable) or None
+
+
+class FileCredentials:
+    """
+    Reads the token from the first existing file: either a file holding just the
+    token, or a secrets.toml with a ZOO_API_KEY entry.
+    """
+
+    def __init__(self, paths: Sequence[str] = DEFAULT_TOKEN_FILES):
+        self.paths = list(paths)
+
+    def token(self) -> Optional[str]:
+        for path in self.paths:
+            try:
+                with open(path, "r", encoding="utf-8") as handle:
+                    content = handle.read()
+            except OSError:
+                continue
+            token = self._from_toml(content) if path.endswith(".toml") else content.strip()
+            if token:
+                return token
+        return None
+
+    @staticmethod
+    def _from_toml(content: str) -> Optional[str]:
+        try:
+            import tomllib
+        except ImportError:
+            # Python < 3.11: a top-level string entry is all we need
+            match = _TOML_SECRET.search(content)
+            return match.group(1) if match else None
+        try:
+            value = tomllib.loads(content).get(SECRET_NAME)
+        except tomllib.TOMLDecodeError:
+            return None
+        return value if isinstance(value, str) else None
+
+
+class StreamlitCredentials:
+    """
+    Reads the token from st.secrets, but only inside a process that already
+    imported Streamlit; the CLI never pays Streamlit's import cost for a secret.
+    """
+
+    def token(self) -> Optional[str]:
+        if "streamlit" not in sys.modules:
+            return None
+        import streamlit as st
+        try:
+            return st.secrets[SECRET_NAME]
+        except (KeyError, AttributeError, FileNotFoundError):
+            return None
+
+
+class ChainedCredentials:
+    """
+    Returns the first token any of its providers has.
+    """
+
+    def __init__(self, providers: List[object]):
+        self.providers = providers
+
+    def token(self) -> Optional[str]:
+        for provider in self.providers:
+            token = provider.token()
+            if token:
+                return token
+        return None
+
+
+PROVIDERS = {
+    "streamlit": StreamlitCredentials,
+    "env": EnvCredentials,
+    "file": FileCredentials,
+}
+
+_default_credentials: Optional[object] = None
+_default_credentials_lock = threading.Lock()
+
+
+def get_credentials() -> object:
+    """
+    Returns the process-wide credentials provider, built from CADIA_CREDENTIALS on first use.
+    """
+    global _default_credentials
+    with _default_credentials_lock:
+        if _default_credentials is None:
+            names = [name.strip() for name in DEFAULT_ORDER.split(",") if name.strip()]
+            _default_credentials = ChainedCredentials([PROVIDERS[name]() for name in names])
+        return _default_credentials
+
+
+def set_credentials(provider: object) -> None:
+    """
+    Replaces the credentials provider; anything with a token() method works.
+    """
+    global _default_credentials
+    with _default_credentials_lock:
+        _default_credentials = provider
+
+
+def get_api_token() -> str:
+    """
+    Returns the Zoo API token from the configured providers.
+    """
+    token = get_credentials().token()
+    if not token:
+        raise ValueError(
+            f"Zoo API token not found. Add {SECRET_NAME} to .streamlit/secrets.toml, "
+            f"set {TOKEN_ENV_VAR}, or put the token in {DEFAULT_TOKEN_FILES[0]}"
+        )
+    return token
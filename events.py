@@ -0,0 +1,383 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type
+
+from metrics import generations, registry
+
+logger = logging.getLogger("cadia")
+
+# POST events to these URLs (comma-separated) as JSON, e.g. for chat notifications
+DEFAULT_WEBHOOK_URLS = os.environ.get("CADIA_WEBHOOK_URLS", "")
+
+# Event kinds sent to webhooks; everything else stays in-process
+DEFAULT_WEBHOOK_EVENTS = os.environ.get("CADIA_WEBHOOK_EVENTS", "completed,failed")
+
+# Events waiting for webhook delivery; beyond this they are dropped rather than slow generation down
+WEBHOOK_QUEUE_SIZE = int(os.environ.get("CADIA_WEBHOOK_QUEUE", 1000))
+WEBHOOK_TIMEOUT = float(os.environ.get("CADIA_WEBHOOK_TIMEOUT", 5.0))
+
+events_published = registry.counter("cadia_events_total", "Generation events published, by kind.")
+webhooks_dropped = registry.counter("cadia_webhook_dropped_total", "Webhook deliveries dropped, by reason.")
+
+
+class Event:
+    """
+    Something that happened to one generation request. Every event carries the
+    prompt, the requested formats and, once known, the remote job ID; progress
+    and message are what a progress bar would show.
+    """
+
+    kind = "event"
+    fields: Tuple[str, ...] = ()
+    progress: Optional[float] = None
+    message = ""
+
+    def __init__(self, prompt: str, formats: List[str], job_id: Optional[str] = None, **fields: Any):
+        self.prompt = prompt
+        self.formats = formats
+        self.job_id = job_id
+        self.ts = time.time()
+        for name, value in fields.items():
+            setattr(self, name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        record = {
+            "event": self.kind,
+            "ts": self.ts,
+            "prompt": self.prompt,
+            "formats": self.formats,
+            "job_id": self.job_id,
+            "progress": self.progress,
+            "message": self.message,
+        }
+        record.update((name, getattr(self, name)) for name in self.fields)
+        return record
+
+    def __repr__(self) -> str:
+        return f"<{type(self).__name__} {self.job_id or '-'} {self.message!r}>"
+
+
+class Queued(Event):
+    """
+    Waiting for API capacity; position is the place in the admission queue.
+    """
+
+    kind = "queued"
+    fields = ("position",)
+    progress = 0.0
+    position: int = 0
+
+    @property
+    def message(self) -> str:
+        return f"API is busy: position {self.position} in queue..."
+
+
+class Joined(Event):
+    """
+    An identical request is already in flight; this one shares its result.
+    """
+
+    kind = "joined"
+    progress = 0.0
+    message = "An identical design is already being generated; sharing its result..."
+
+
+class Submitted(Event):
+    """
+    A remote job exists: it was just submitted, or reattached from the journal.
+    """
+
+    kind = "submitted"
+    fields = ("reattached",)
+    progress = 0.0
+    message = "Design prompt submitted to the API..."
+    reattached = False
+
+
+class Running(Event):
+    """
+    Remote work is under way; stage is "generation" or "conversion".
+    """
+
+    kind = "running"
+    fields = ("stage",)
+    stage = "generation"
+
+    @property
+    def message(self) -> str:
+        if self.stage == "conversion":
+            return "Converting to additional formats..."
+        return "Generating your CAD model... (this may take a minute)"
+
+
+class Polled(Event):
+    """
+    A status poll came back; progress is estimated from recent job durations.
+    """
+
+    kind = "polled"
+    fields = ("elapsed", "polls")
+    elapsed: float = 0.0
+    polls: int = 0
+    message = "Generating your CAD model... (this may take a minute)"
+
+
+class Downloaded(Event):
+    """
+    Payloads of size bytes are in hand; source is "api", "cache" or "conversion".
+    """
+
+    kind = "downloaded"
+    fields = ("source", "size")
+    source = "api"
+    size = 0
+
+    @property
+    def message(self) -> str:
+        return f"Received {', '.join(ext.upper() for ext in self.formats)} ({self.size:,} bytes)"
+
+
+class Written(Event):
+    """
+    A payload of size bytes was saved to path.
+    """
+
+    kind = "written"
+    fields = ("path", "size")
+    path = ""
+    size = 0
+
+    @property
+    def message(self) -> str:
+        return f"Saved {self.path}"
+
+
+class Completed(Event):
+    """
+    The request finished; source is "api", "shared", "conversion" or "cache".
+    """
+
+    kind = "completed"
+    fields = ("source", "size", "timings")
+    progress = 1.0
+    message = "CAD model completed! Preparing download..."
+    source = "api"
+    size = 0
+    timings: Optional[Dict[str, float]] = None
+
+
+class Failed(Event):
+    """
+    The request failed with error.
+    """
+
+    kind = "failed"
+    fields = ("error", "timings")
+    error = ""
+    timings: Optional[Dict[str, float]] = None
+
+    @property
+    def message(self) -> str:
+        return f"Failed: {self.error}"
+
+
+EventHandler = Callable[[Event], None]
+
+
+class EventBus:
+    """
+    Fans every published event out to process-wide subscribers (metrics,
+    webhooks, consoles). Handlers run on the publishing thread and must not block.
+    """
+
+    def __init__(self):
+        self._subscribers: List[Tuple[EventHandler, Optional[frozenset]]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, handler: EventHandler, kinds: Optional[Iterable[str]] = None) -> Callable[[], None]:
+        """
+        Sends events (only those of the given kinds, if set) to handler. Returns a function that unsubscribes it.
+        """
+        with self._lock:
+            self._subscribers.append((handler, frozenset(kinds) if kinds else None))
+        return functools.partial(self.unsubscribe, handler)
+
+    def unsubscribe(self, handler: EventHandler) -> None:
+        with self._lock:
+            self._subscribers = [entry for entry in self._subscribers if entry[0] is not handler]
+
+    def publish(self, event: Event) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for handler, kinds in subscribers:
+            if kinds is not None and event.kind not in kinds:
+                continue
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("Event subscriber failed")
+
+    def stream(self, kinds: Optional[Iterable[str]] = None) -> "EventStream":
+        """
+        Returns an async iterator over events published from now on. Must be called
+        inside a running event loop; close the stream to unsubscribe.
+        """
+        stream = EventStream()
+        stream.unsubscribe = self.subscribe(stream, kinds)
+        return stream
+
+
+class EventStream:
+    """
+    Async iterator over events delivered from any thread; also usable directly as an
+    on_event handler. Iteration ends once close() is called and the backlog is drained.
+    """
+
+    _CLOSED = object()
+
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.unsubscribe: Optional[Callable[[], None]] = None
+
+    def __call__(self, event: Event) -> None:
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    def close(self) -> None:
+        if self.unsubscribe:
+            self.unsubscribe()
+            self.unsubscribe = None
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, self._CLOSED)
+
+    def __aiter__(self) -> "EventStream":
+        return self
+
+    async def __anext__(self) -> Event:
+        event = await self._queue.get()
+        if event is self._CLOSED:
+            raise StopAsyncIteration
+        return event
+
+
+class Emitter:
+    """
+    Publishes the events of one request to the bus and to the caller's own handler.
+    Events always reach them on the caller's event loop, even when they originate
+    on the client pool or poller threads.
+    """
+
+    def __init__(self, prompt: str, formats: List[str], handler: Optional[EventHandler] = None,
+                 bus: Optional[EventBus] = None):
+        self.prompt = prompt
+        self.formats = formats
+        self.handler = handler
+        self.bus = bus or get_bus()
+        self.job_id: Optional[str] = None
+        self.failed = False
+        try:
+            self._loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+
+    def emit(self, event_type: Type[Event], **fields: Any) -> Event:
+        fields.setdefault("job_id", self.job_id)
+        formats = fields.pop("formats", self.formats)
+        event = event_type(self.prompt, formats, **fields)
+        if event_type is Failed:
+            self.failed = True
+        events_published.inc(labels={"kind": event.kind})
+        self.bus.publish(event)
+        if self.handler:
+            try:
+                self.handler(event)
+            except Exception:
+                logger.exception("Event handler failed")
+        return event
+
+    def emit_threadsafe(self, event_type: Type[Event], **fields: Any) -> None:
+        if self._loop is None:
+            self.emit(event_type, **fields)
+        else:
+            self._loop.call_soon_threadsafe(functools.partial(self.emit, event_type, **fields))
+
+
+def progress_handler(callback: Callable[[float, str], None]) -> EventHandler:
+    """
+    Adapts a (fraction, message) progress callback, such as a progress bar, to events.
+    """
+    def handle(event: Event) -> None:
+        if event.progress is not None:
+            callback(event.progress, event.message)
+    return handle
+
+
+def record_metrics(event: Event) -> None:
+    # Generation outcomes feed the Prometheus counters and the structured event log
+    timings = getattr(event, "timings", None) or {}
+    if event.kind == "completed":
+        generations.inc(labels={"status": "completed", "source": event.source})
+        registry.emit("generation_completed", format=",".join(event.formats), job_id=event.job_id,
+                      source=event.source, bytes=event.size, **timings)
+    else:
+        generations.inc(labels={"status": "failed"})
+        registry.emit("generation_failed", format=",".join(event.formats), job_id=event.job_id,
+                      error=event.error, **timings)
+
+
+class WebhookSubscriber:
+    """
+    POSTs events as JSON to a URL from a background thread. Delivery is best effort:
+    a slow or failing endpoint drops events instead of holding up generation.
+    """
+
+    def __init__(self, url: str, queue_size: int = WEBHOOK_QUEUE_SIZE, timeout: float = WEBHOOK_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+        self._queue: "queue.Queue[Event]" = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name="cad-webhook", daemon=True)
+        self._thread.start()
+
+    def __call__(self, event: Event) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            webhooks_dropped.inc(labels={"reason": "queue_full"})
+
+    def _run(self) -> None:
+        import httpx
+
+        with httpx.Client(timeout=self.timeout) as client:
+            while True:
+                event = self._queue.get()
+                try:
+                    body = json.dumps(event.to_dict(), default=str)
+                    client.post(self.url, content=body, headers={"Content-Type": "application/json"})
+                except Exception:
+                    webhooks_dropped.inc(labels={"reason": "error"})
+                    logger.warning("Webhook delivery to %s failed", self.url, exc_info=True)
+
+
+_default_bus: Optional[EventBus] = None
+_default_bus_lock = threading.Lock()
+
+
+def get_bus() -> EventBus:
+    """
+    Returns the process-wide event bus, with the metrics and configured webhook subscribers attached.
+    """
+    global _default_bus
+    with _default_bus_lock:
+        if _default_bus is None:
+            _default_bus = EventBus()
+            _default_bus.subscribe(record_metrics, kinds=("completed", "failed"))
+            kinds = [kind.strip() for kind in DEFAULT_WEBHOOK_EVENTS.split(",") if kind.strip()]
+            for url in (url.strip() for url in DEFAULT_WEBHOOK_URLS.split(",")):
+                if url:
+                    _default_bus.subscribe(WebhookSubscriber(url), kinds=kinds)
+        return _default_bus
@@ -0,0 +1,489 @@
+import asyncio
+import logging
+import os
+import time
+import weakref
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from artifacts import path_codec, strip_suffix, write_payload
+from cache import cache_key, get_cache
+from clients import get_pool
+from coalesce import get_registry
+from credentials import get_api_token
+from events import (
+    Completed,
+    Downloaded,
+    Emitter,
+    EventHandler,
+    Failed,
+    Joined,
+    Polled,
+    Queued,
+    Running,
+    Submitted,
+    Written,
+)
+from journal import get_journal
+from metrics import cache_requests, estimator, polls_per_job, timed
+from poller import get_poller
+from ratelimit import PRIORITY_NORMAL, QueueCallback
+from kittycad.client import Client
+
+logger = logging.getLogger("cadia")
+
+# kittycad.models takes over a second to import, so it is only loaded once a
+# request actually goes to the API; cache hits never pay for it
+if TYPE_CHECKING:
+    from kittycad.models import TextToCad
+
+# Upper bound on generations in flight on a single event loop
+MAX_CONCURRENT_JOBS = int(os.environ.get("CADIA_MAX_CONCURRENT_JOBS", 256))
+
+# asyncio primitives are bound to one loop, so keep a semaphore per loop
+_job_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+# Outputs are written in slices of this size
+WRITE_CHUNK_SIZE = 1024 * 1024
+
+# Every export format the API can produce (the values of kittycad's FileExportFormat),
+# kept as plain strings so resolving a format does not import kittycad.models
+EXPORT_FORMATS = ("fbx", "glb", "gltf", "obj", "ply", "step", "stl")
+
+
+def _job_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _job_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _job_semaphores[loop] = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+    return semaphore
+
+
+def get_client() -> Client:
+    # The token comes from the configured credentials providers (Streamlit, env, file);
+    # reuse the pooled client for it instead of building one per call
+    return get_pool().client(get_api_token())
+
+
+def resolve_format(output_file: Optional[str], output_format: Optional[str] = None) -> tuple:
+    # Determine file format from the explicit format or the output file extension (part.step.gz is STEP)
+    file_ext = output_format or os.path.splitext(strip_suffix(output_file or ""))[1].lstrip('.')
+    if not file_ext:
+        file_ext = "step"  # Default format
+
+    # Default to STEP if extension is not supported
+    file_ext = file_ext.lower()
+    return file_ext, file_ext if file_ext in EXPORT_FORMATS else "step"
+
+
+def write_file(output_file: str, data: bytes, chunk_size: int = WRITE_CHUNK_SIZE) -> None:
+    """
+    Writes a payload to disk as raw bytes, in chunks, without copying it. A file
+    name ending in .gz or .zst gets the payload compressed as it is written.
+    """
+    with timed("write"), open(output_file, "wb") as output_file_handle:
+        write_payload(output_file_handle, data, path_codec(output_file), chunk_size)
+
+
+async def asubmit(client: Client, prompt: str, output_format: str,
+                  timings: Optional[Dict[str, float]] = None, priority: int = PRIORITY_NORMAL,
+                  on_queue: Optional[QueueCallback] = None) -> "TextToCad":
+    """
+    Submits a text-to-CAD job and returns the initial job record. The submission
+    waits its turn for API capacity; on_queue receives its queue position meanwhile.
+    """
+    from kittycad.api.ml import create_text_to_cad
+    from kittycad.models import Error, FileExportFormat, TextToCadCreateBody
+
+    # Prompt the API to generate a 3D model from text
+    with timed("submit", timings):
+        response = await get_pool().acall(
+            create_text_to_cad,
+            "POST",
+            client,
+            priority=priority,
+            on_queue=on_queue,
+            output_format=FileExportFormat(output_format),
+            body=TextToCadCreateBody(
+                prompt=prompt,
+            ),
+        )
+
+    if isinstance(response, Error) or response is None:
+        raise Exception(f"Error: {response}")
+
+    return response
+
+
+async def aresume_or_submit(client: Client, prompt: str, output_format: str,
+                            owner: Optional[str] = None, reuse_completed: bool = False,
+                            timings: Optional[Dict[str, float]] = None, priority: int = PRIORITY_NORMAL,
+                            on_queue: Optional[QueueCallback] = None,
+                            emitter: Optional[Emitter] = None) -> "TextToCad":
+    """
+    Reattaches to a journaled job for the same prompt and format if one is still
+    running (or finished but never collected, with reuse_completed), otherwise
+    submits a new job and journals its ID before anyone starts polling it.
+    """
+    from kittycad.api.ml import get_text_to_cad_model_for_user
+    from kittycad.models import TextToCad
+
+    journal = get_journal()
+    key = cache_key(prompt, output_format)
+    statuses = ("submitted", "completed") if reuse_completed else ("submitted",)
+    entry = await asyncio.to_thread(journal.find, key, statuses)
+
+    if entry is not None:
+        with timed("reattach", timings):
+            response = await get_pool().acall(
+                get_text_to_cad_model_for_user,
+                "GET",
+                client,
+                priority=priority,
+                id=entry["remote_id"],
+            )
+        if isinstance(response, TextToCad):
+            if emitter:
+                emitter.job_id = entry["remote_id"]
+                emitter.emit(Submitted, reattached=True)
+            return response
+        # The API no longer knows the job; fall through and pay for a new one
+        await asyncio.to_thread(journal.mark, entry["remote_id"], "failed", f"Reattach failed: {response}")
+
+    result = await asubmit(client, prompt, output_format, timings=timings, priority=priority, on_queue=on_queue)
+    await asyncio.to_thread(journal.record_submitted, str(result.id), key, prompt, output_format, owner)
+    if emitter:
+        emitter.job_id = str(result.id)
+        emitter.emit(Submitted)
+    return result
+
+
+async def await_completion(client: Client, result: "TextToCad",
+                           emitter: Optional[Emitter] = None,
+                           deadline: Optional[float] = None,
+                           timings: Optional[Dict[str, float]] = None) -> "TextToCad":
+    """
+    Waits for a submitted job to finish. Polling is done by the shared background
+    poller, which backs off adaptively and gives up after the deadline (seconds).
+    Remote time and poll count are recorded in timings when given.
+    """
+    if result.completed_at is not None:
+        return result
+
+    poller = get_poller()
+    deadline = deadline or poller.deadline
+    polls = 0
+
+    # Updates arrive on the poller thread; the emitter hands them back to the caller's loop
+    def on_update(_: "TextToCad", elapsed: float) -> None:
+        nonlocal polls
+        polls += 1
+        if emitter:
+            emitter.emit_threadsafe(Polled, progress=estimator.fraction(elapsed), elapsed=elapsed, polls=polls)
+
+    if emitter:
+        emitter.emit(Running, progress=0.0)
+
+    started = time.monotonic()
+    with timed("remote", timings):
+        result = await asyncio.wrap_future(poller.track(client, result, deadline=deadline, on_update=on_update))
+
+    # Feed the rolling estimate that drives everyone's progress bars
+    estimator.record(time.monotonic() - started)
+    polls_per_job.observe(polls)
+    if timings is not None:
+        timings["polls"] = polls
+    return result
+
+
+def collect_outputs(result: "TextToCad") -> Dict[str, bytes]:
+    """
+    Returns every file a finished job produced, keyed by extension.
+    """
+    from kittycad.models import ApiCallStatus
+
+    if result.status == ApiCallStatus.FAILED:
+        # Print out the error message
+        raise Exception(f"Text-to-CAD failed: {result.error}")
+
+    if result.status != ApiCallStatus.COMPLETED or result.outputs is None:
+        raise Exception("Text-to-CAD completed but returned no files.")
+
+    # Prefer the "source.<ext>" file when several share an extension
+    outputs: Dict[str, bytes] = {}
+    for name in sorted(result.outputs, key=lambda name: not name.startswith("source.")):
+        outputs.setdefault(os.path.splitext(name)[1].lstrip('.').lower(), result.outputs[name])
+    return outputs
+
+
+def extract_output(result: "TextToCad", file_ext: str) -> bytes:
+    """
+    Returns the payload for the requested extension from a finished job.
+    """
+    outputs = collect_outputs(result)
+    if file_ext not in outputs:
+        # Fallback to any available output
+        if not outputs:
+            raise Exception("No output files available")
+        file_ext = next(iter(outputs))
+
+    # Base64Data is already a bytes subclass, so hand it over without copying
+    return outputs[file_ext]
+
+
+async def aconvert(client: Client, source: bytes, output_format: str, src_format: str = "step") -> bytes:
+    """
+    Converts an existing CAD payload to another format with the file conversion API.
+    """
+    from kittycad.api.api_calls import get_async_operation
+    from kittycad.api.file import create_file_conversion
+    from kittycad.models import ApiCallStatus, FileConversion, FileExportFormat, FileImportFormat
+
+    response = await get_pool().acall(
+        create_file_conversion,
+        "POST",
+        client,
+        output_format=FileExportFormat(output_format),
+        src_format=FileImportFormat(src_format),
+        body=source,
+    )
+
+    # Large conversions finish asynchronously; back off like the job poller does
+    poller = get_poller()
+    delay = poller.initial_interval
+    started = time.monotonic()
+    while isinstance(response, FileConversion) and response.completed_at is None:
+        if time.monotonic() - started > poller.deadline:
+            raise Exception(f"Conversion to {output_format.upper()} timed out")
+        await asyncio.sleep(delay)
+        delay = min(poller.max_interval, delay * poller.backoff)
+        response = await get_pool().acall(get_async_operation, "GET", client, id=response.id)
+
+    if not isinstance(response, FileConversion):
+        raise Exception(f"Error: {response}")
+
+    if response.status == ApiCallStatus.FAILED or not response.outputs:
+        raise Exception(f"Conversion to {output_format.upper()} failed: {response.error}")
+
+    return next(iter(response.outputs.values()))
+
+
+def cache_meta(prompt: str, output_format: str, result: "TextToCad") -> dict:
+    return {
+        "prompt": prompt,
+        "format": output_format,
+        "model_version": result.model_version,
+        "job_id": str(result.id),
+    }
+
+
+async def acache_outputs(prompt: str, outputs: Dict[str, bytes], result: "TextToCad") -> None:
+    """
+    Caches every output a finished job returned, not just the one asked for, so a
+    later request for another of its formats skips the API.
+    """
+    cache = get_cache()
+    for ext, payload in outputs.items():
+        if ext in EXPORT_FORMATS:
+            await asyncio.to_thread(cache.put, cache_key(prompt, ext), payload, cache_meta(prompt, ext, result))
+
+
+async def _agenerate_outputs(prompt: str, export_format: str, emitter: Emitter, use_cache: bool = True,
+                             owner: Optional[str] = None,
+                             priority: int = PRIORITY_NORMAL) -> Tuple[Dict[str, bytes], dict]:
+    # Run one remote job and cache every output it returns, not just the one asked for.
+    # Returns the outputs and the job's ID and timings, which joined callers share too
+    journal = get_journal()
+
+    async def produce() -> Tuple[Dict[str, bytes], dict]:
+        client = get_client()
+        timings: Dict[str, float] = {}
+        result = None
+
+        # Positions arrive on the client pool's thread while the API is saturated
+        def on_queue(position: int) -> None:
+            emitter.emit_threadsafe(Queued, position=position)
+
+        try:
+            async with _job_semaphore():
+                result = await aresume_or_submit(client, prompt, export_format, owner=owner,
+                                                 reuse_completed=use_cache, timings=timings,
+                                                 priority=priority, on_queue=on_queue, emitter=emitter)
+                result = await await_completion(client, result, emitter, timings=timings)
+
+            with timed("decode", timings):
+                outputs = collect_outputs(result)
+            emitter.emit(Downloaded, formats=list(outputs), size=sum(len(payload) for payload in outputs.values()))
+
+            # Remember the results so the next identical request skips the API
+            with timed("cache_write", timings):
+                await acache_outputs(prompt, outputs, result)
+            await asyncio.to_thread(journal.mark, str(result.id), "completed")
+        except Exception as e:
+            # Only a remote failure is final; a local timeout or crash leaves the job to reattach
+            if result is not None and result.completed_at is not None:
+                await asyncio.to_thread(journal.mark, str(result.id), "failed", str(e))
+            emitter.emit(Failed, error=str(e), timings=timings)
+            raise
+
+        return outputs, {"job_id": str(result.id), "timings": timings}
+
+    joined = False
+
+    def on_join() -> None:
+        nonlocal joined
+        joined = True
+        emitter.emit(Joined)
+
+    # Identical prompts already in flight (any session, any thread) share one remote job
+    outputs, info = await get_registry().run(cache_key(prompt, export_format), produce, on_join=on_join)
+    return outputs, dict(info, shared=joined)
+
+
+async def agenerate_cad_formats(prompt: str, formats: List[str], use_cache: bool = True,
+                                on_event: Optional[EventHandler] = None,
+                                owner: Optional[str] = None, priority: int = PRIORITY_NORMAL) -> Dict[str, bytes]:
+    """
+    Generates a design once and returns it in every requested format, keyed by
+    extension. Formats the job did not return are converted from its STEP source.
+    Remote jobs are journaled under owner so they can be reattached after a crash,
+    and compete for API capacity at the given priority. on_event receives this
+    request's events on the calling loop, in addition to the bus subscribers.
+    """
+    requested = []
+    for name in formats:
+        export_format = resolve_format(None, name)[1]
+        if export_format not in requested:
+            requested.append(export_format)
+
+    emitter = Emitter(prompt, requested, on_event)
+    try:
+        return await _agenerate_formats(prompt, requested, emitter, use_cache, owner, priority)
+    except Exception as e:
+        # A failed remote job has already reported itself, with its timings
+        if not emitter.failed:
+            emitter.emit(Failed, error=str(e))
+        raise
+
+
+async def _agenerate_formats(prompt: str, requested: List[str], emitter: Emitter, use_cache: bool,
+                             owner: Optional[str], priority: int) -> Dict[str, bytes]:
+    # Serve previously generated results straight from disk
+    cache = get_cache()
+    artifacts: Dict[str, bytes] = {}
+    if use_cache:
+        for export_format in requested:
+            cached = await asyncio.to_thread(cache.get, cache_key(prompt, export_format))
+            cache_requests.inc(labels={"result": "miss" if cached is None else "hit"})
+            if cached is not None:
+                artifacts[export_format] = cached
+
+    missing = [export_format for export_format in requested if export_format not in artifacts]
+    if use_cache and missing and "step" not in artifacts:
+        cached = await asyncio.to_thread(cache.get, cache_key(prompt, "step"))
+        if cached is not None:
+            artifacts["step"] = cached
+    if artifacts:
+        emitter.emit(Downloaded, source="cache", formats=list(artifacts),
+                     size=sum(len(payload) for payload in artifacts.values()))
+
+    # A cached STEP source is enough to convert from; otherwise run one generation
+    source, info = "cache", {}
+    if missing and "step" not in artifacts:
+        outputs, info = await _agenerate_outputs(prompt, missing[0], emitter, use_cache=use_cache,
+                                                 owner=owner, priority=priority)
+        for ext, payload in outputs.items():
+            artifacts.setdefault(ext, payload)
+        missing = [export_format for export_format in missing if export_format not in artifacts]
+        source = "shared" if info["shared"] else "api"
+
+    if missing:
+        if "step" not in artifacts:
+            raise Exception("No STEP source available to convert from")
+        emitter.emit(Running, stage="conversion", progress=0.95)
+
+        client = get_client()
+        step_source = artifacts["step"]
+        converted = await asyncio.gather(*(aconvert(client, step_source, export_format) for export_format in missing))
+        for export_format, payload in zip(missing, converted):
+            artifacts[export_format] = payload
+            await asyncio.to_thread(cache.put, cache_key(prompt, export_format), payload, {
+                "prompt": prompt,
+                "format": export_format,
+                "converted_from": "step",
+            })
+        emitter.emit(Downloaded, source="conversion", formats=missing,
+                     size=sum(len(payload) for payload in converted))
+        if source == "cache":
+            source = "conversion"
+
+    results = {export_format: artifacts[export_format] for export_format in requested}
+    emitter.emit(Completed, source=source, size=sum(len(payload) for payload in results.values()),
+                 job_id=info.get("job_id", emitter.job_id), timings=info.get("timings"))
+    return results
+
+
+async def agenerate_cad(prompt: str, output_file: str = "output.step", use_cache: bool = True,
+                        on_event: Optional[EventHandler] = None, output_format: Optional[str] = None,
+                        in_memory: bool = False, owner: Optional[str] = None) -> Union[str, bytes]:
+    """
+    Coroutine version of generate_cad. Many calls can share one event loop; at most
+    MAX_CONCURRENT_JOBS of them talk to the API at once per loop. Remote jobs are
+    journaled under owner, and a written file marks only owner's jobs delivered.
+    """
+    _, export_format = resolve_format(output_file, output_format)
+    emitter = Emitter(prompt, [export_format], on_event)
+
+    # Cache hits for files are copied on disk without loading them into memory
+    if use_cache and not in_memory:
+        key = cache_key(prompt, export_format)
+        if await asyncio.to_thread(get_cache().copy_to, key, output_file):
+            cache_requests.inc(labels={"result": "hit"})
+            await asyncio.to_thread(get_journal().mark_delivered, [key], owner)
+            size = os.path.getsize(output_file)
+            emitter.emit(Completed, source="cache", size=size)
+            emitter.emit(Written, path=output_file, size=size)
+            return output_file
+
+    artifacts = await agenerate_cad_formats(prompt, [export_format], use_cache=use_cache, on_event=on_event,
+                                            owner=owner)
+    final_result = artifacts[export_format]
+
+    if in_memory:
+        return final_result
+
+    # Save the data as raw bytes; STL in particular is not text
+    await asyncio.to_thread(write_file, output_file, final_result)
+    await asyncio.to_thread(get_journal().mark_delivered, [cache_key(prompt, export_format)], owner)
+    emitter.emit(Written, path=output_file, size=len(final_result))
+    return output_file
+
+
+async def aresume_unfinished(out_dir: str, owner: Optional[str] = None) -> List[str]:
+    """
+    Reattaches to every journaled job of owner that never reached its user and
+    writes the outputs to out_dir. Returns the paths written.
+    """
+    entries = await asyncio.to_thread(get_journal().unfinished, owner)
+    if not entries:
+        return []
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, f"resumed_{entry['remote_id'][:8]}.{entry['format']}") for entry in entries]
+    results = await asyncio.gather(
+        *(agenerate_cad(entry["prompt"], path, output_format=entry["format"], owner=owner)
+          for entry, path in zip(entries, paths)),
+        return_exceptions=True,
+    )
+    written = []
+    for path, result in zip(paths, results):
+        if isinstance(result, BaseException):
+            logger.warning("Could not recover %s: %s", path, result)
+        else:
+            written.append(path)
+    return written
+
+
+def generate_cad_formats(prompt: str, formats: List[str], use_cache: bool = True) -> Dict[str, bytes]:
+    """
+    Generates a CAD design once and returns it in several formats, keyed by extension.
+    """
+    return asyncio.run(agenerate_cad_formats(prompt, formats, use_cache=use_cache))
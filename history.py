@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from artifacts import gzip_payload, read_payload, write_file_atomic, zip_bundle
+
+# Persistent data (history database and artifact blobs), unlike the evictable result cache
+DEFAULT_DATA_DIR = os.environ.get(
+    "CADIA_DATA_DIR", os.path.join(os.path.expanduser("~"), ".local", "share", "cadia")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    format TEXT NOT NULL,
+    file_name TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    timings TEXT,
+    artifact_sha256 TEXT,
+    artifact_size INTEGER,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS generations_created_at ON generations (created_at);
+CREATE INDEX IF NOT EXISTS generations_job_id ON generations (job_id);
+CREATE INDEX IF NOT EXISTS generations_artifact ON generations (artifact_sha256);
+
+-- Full-text index over prompts, kept in sync with the generations table
+CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts USING fts5(
+    prompt, content='generations', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS generations_fts_insert AFTER INSERT ON generations BEGIN
+    INSERT INTO generations_fts (rowid, prompt) VALUES (new.id, new.prompt);
+END;
+CREATE TRIGGER IF NOT EXISTS generations_fts_delete AFTER DELETE ON generations BEGIN
+    INSERT INTO generations_fts (generations_fts, rowid, prompt) VALUES ('delete', old.id, old.prompt);
+END;
+"""
+
+
+def _fts_query(text: str) -> str:
+    # Quote every term so user input can't be parsed as FTS syntax; last term matches as a prefix
+    terms = ['"' + term.replace('"', '""') + '"' for term in text.split()]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+class HistoryStore:
+    """
+    SQLite record of every generation, with artifacts kept as compressed,
+    content-addressed blobs.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DATA_DIR):
+        self.directory = directory
+        self.blob_directory = os.path.join(directory, "blobs")
+        os.makedirs(self.blob_directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "history.sqlite3"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_directory, digest[:2], digest)
+
+    def put_blob(self, data: bytes) -> str:
+        """
+        Stores an artifact, compressed, under the sha256 of its raw bytes and returns
+        the digest. Identical artifacts are stored once.
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return digest
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_file_atomic(path, data)
+        return digest
+
+    def read_blob(self, digest: str, compressed: bool = False) -> Optional[bytes]:
+        """
+        Returns an artifact's raw bytes, or with compressed its gzip encoding (as
+        served for .gz downloads, straight from disk when stored as gzip).
+        """
+        try:
+            return gzip_payload(self.blob_path(digest)) if compressed else read_payload(self.blob_path(digest))
+        except FileNotFoundError:
+            return None
+
+    def bundle(self, members: Dict[str, str]) -> bytes:
+        """
+        Returns a zip of the blobs in members, a mapping of file name to digest.
+        """
+        return zip_bundle((name, self.blob_path(digest)) for name, digest in members.items())
+
+    def record(self, job_id: str, prompt: str, output_format: str, status: str,
+               data: Optional[bytes] = None, file_name: Optional[str] = None,
+               error: Optional[str] = None, timings: Optional[Dict[str, float]] = None,
+               created_at: Optional[float] = None, finished_at: Optional[float] = None) -> int:
+        """
+        Adds one generation (one format of one job) to the history and returns its row ID.
+        """
+        digest = self.put_blob(data) if data is not None else None
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT INTO generations (job_id, prompt, format, file_name, status, error, timings,"
+                " artifact_sha256, artifact_size, created_at, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id, prompt, output_format, file_name, status, error,
+                    json.dumps(timings) if timings else None,
+                    digest, len(data) if data is not None else None,
+                    created_at or time.time(), finished_at,
+                ),
+            )
+            return cursor.lastrowid
+
+    def page(self, query: Optional[str] = None, before: Optional[int] = None,
+             limit: int = 20) -> List[dict]:
+        """
+        Returns up to limit entries, newest first. Pass the last row's id as before
+        to fetch the next page; query filters by prompt text.
+        """
+        sql = "SELECT g.* FROM generations g"
+        clauses, params = [], []
+        if query and query.strip():
+            sql += " JOIN generations_fts f ON f.rowid = g.id"
+            clauses.append("generations_fts MATCH ?")
+            params.append(_fts_query(query))
+        if before is not None:
+            clauses.append("g.id < ?")
+            params.append(before)
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY g.id DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["timings"] = json.loads(entry["timings"]) if entry["timings"] else {}
+            entries.append(entry)
+        return entries
+
+    def completed_jobs(self) -> List[dict]:
+        """
+        Returns {"job_id", "prompt"} for every job with stored artifacts, oldest first.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT job_id, prompt, MAX(id) AS last_id FROM generations"
+                " WHERE status = 'completed' AND artifact_sha256 IS NOT NULL"
+                " GROUP BY job_id ORDER BY last_id"
+            ).fetchall()
+        return [{"job_id": row["job_id"], "prompt": row["prompt"]} for row in rows]
+
+    def job_artifacts(self, job_id: str) -> List[dict]:
+        """
+        Returns the stored artifacts of one job, one entry per format.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM generations WHERE job_id = ? AND artifact_sha256 IS NOT NULL ORDER BY id",
+                (job_id,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM generations").fetchone()[0]
+
+
+_default_history: Optional[HistoryStore] = None
+_default_history_lock = threading.Lock()
+
+
+def get_history() -> HistoryStore:
+    """
+    Returns the process-wide history store, creating it on first use.
+    """
+    global _default_history
+    with _default_history_lock:
+        if _default_history is None:
+            _default_history = HistoryStore()
+        return _default_history
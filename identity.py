@@ -0,0 +1,100 @@
+import hashlib
+import hmac
+import os
+import secrets
+import tempfile
+import uuid
+from typing import Optional
+
+from history import DEFAULT_DATA_DIR
+from scheduler import SESSION_PREFIX
+
+# Query parameter carrying the browser session's signed ID, so reloads and new tabs
+# find their jobs again
+SESSION_PARAM = "sid"
+
+
+def load_secret(directory: str, name: str, variable: str) -> bytes:
+    """
+    Returns the signing key in environment variable `variable`, or else the one kept
+    in file `name` in directory, generating it on first use. Every process sharing
+    the data directory then signs alike.
+    """
+    secret = os.environ.get(variable)
+    if secret:
+        return secret.encode("utf-8")
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(secrets.token_hex(32).encode("ascii"))
+            # link() fails if another process got there first; its key wins
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(tmp_path)
+    with open(path, "rb") as handle:
+        return handle.read().strip()
+
+
+class SessionSigner:
+    """
+    Issues and checks the IDs of anonymous browser sessions. An ID is only accepted
+    with the server's signature, so a client can drop its ID but never pick one,
+    and cannot take over another session's jobs.
+    """
+
+    def __init__(self, secret: Optional[bytes] = None, directory: str = DEFAULT_DATA_DIR):
+        self._secret = secret or load_secret(directory, "session_secret", "CADIA_SESSION_SECRET")
+
+    def issue(self) -> str:
+        """
+        Returns a new signed session token, "<id>.<signature>".
+        """
+        session_id = uuid.uuid4().hex
+        return f"{session_id}.{self._sign(session_id)}"
+
+    def verify(self, token: Optional[str]) -> Optional[str]:
+        """
+        Returns the session ID of a token issued by issue(), or None if it is not one.
+        """
+        session_id, _, signature = (token or "").partition(".")
+        # Compared as bytes: a crafted non-ASCII token is simply invalid
+        if not session_id or not hmac.compare_digest(signature.encode("utf-8"),
+                                                     self._sign(session_id).encode("ascii")):
+            return None
+        return session_id
+
+    def _sign(self, session_id: str) -> str:
+        return hmac.new(self._secret, f"session:{session_id}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+_default_signer: Optional[SessionSigner] = None
+
+
+def current_user() -> str:
+    """
+    Returns the identity the running Streamlit session's jobs belong to: the
+    signed-in user's email with Streamlit authentication (st.login), otherwise
+    SESSION_PREFIX and the session's server-signed ID from the SESSION_PARAM query
+    parameter, issuing a new one when it is missing or forged. Quotas and weights
+    are charged to scheduler.account() of it, so dropping the ID resets nothing.
+    """
+    import streamlit as st
+
+    global _default_signer
+    user = st.experimental_user
+    if user.get("is_logged_in") and user.get("email"):
+        return user["email"]
+
+    if _default_signer is None:
+        _default_signer = SessionSigner()
+    session_id = _default_signer.verify(st.query_params.get(SESSION_PARAM))
+    if session_id is None:
+        token = _default_signer.issue()
+        st.query_params[SESSION_PARAM] = token
+        session_id = _default_signer.verify(token)
+    return SESSION_PREFIX + session_id
@@ -0,0 +1,468 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from cache import cache_key
+from events import Event
+from generator import agenerate_cad_formats
+from history import get_history
+from journal import get_journal
+from mesh import analyze_stl
+from preview import build_preview
+from ratelimit import PRIORITY_INTERACTIVE
+from scheduler import (
+    JOBS_PER_HOUR,
+    MAX_CONCURRENT,
+    QUOTA_WINDOW,
+    USER_WEIGHTS,
+    FairScheduler,
+    account,
+    parse_weights,
+    quota_message,
+    quota_rejections,
+)
+from similarity import note_generation
+from workqueue import get_queue
+
+# Generations allowed to run at once across every session on this server
+DEFAULT_MAX_ACTIVE_JOBS = int(os.environ.get("CADIA_MAX_ACTIVE_JOBS", 16))
+
+# Finished jobs (and their payloads) are dropped after this many seconds
+DEFAULT_RETENTION = float(os.environ.get("CADIA_JOB_RETENTION", 3600))
+
+# "local" runs generations inside the web server process; "queue" only enqueues
+# them for worker processes (python worker.py) to run
+EXECUTION_MODE = os.environ.get("CADIA_EXECUTION", "local")
+
+logger = logging.getLogger("cadia")
+
+
+class Job:
+    """
+    A generation request tracked by the JobManager.
+    """
+
+    def __init__(self, prompt: str, formats: List[str], file_name: str, use_cache: bool,
+                 owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.prompt = prompt
+        self.formats = formats
+        self.file_name = file_name
+        self.use_cache = use_cache
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = "Waiting for a free generation slot..."
+        self.results: Mapping[str, bytes] = {}
+        self.analysis: Optional[dict] = None
+        self.preview: Optional[bytes] = None
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.stage = "queued"
+        self.remote_id: Optional[str] = None
+        self.polls = 0
+        self.source: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def apply(self, event: Event) -> None:
+        """
+        Follows the generation's events; page reruns read the state they leave behind.
+        """
+        self.stage = event.kind
+        if event.progress is not None:
+            self.progress = event.progress
+        if event.message:
+            self.message = event.message
+        if event.job_id:
+            self.remote_id = event.job_id
+        if event.kind == "polled":
+            self.polls = event.polls
+        elif event.kind == "completed":
+            self.source = event.source
+
+
+class StoredResults(Mapping):
+    """
+    A finished queued job's outputs, keyed by extension. Payloads stay in the history
+    store and are read only when one is used, so downloads served by the artifact
+    server never load them into the front-end.
+    """
+
+    def __init__(self, digests: Dict[str, str]):
+        self._digests = digests
+
+    def __getitem__(self, ext: str) -> bytes:
+        data = get_history().read_blob(self._digests[ext])
+        if data is None:
+            raise Exception(f"The stored {ext.upper()} output is no longer available")
+        return data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._digests)
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+
+class JobManager:
+    """
+    Runs generations on a background event loop so script runs never block on them.
+    Waiting jobs get the max_active slots in the order the fair scheduler picks,
+    within each user's quotas.
+    """
+
+    def __init__(self, max_active: int = DEFAULT_MAX_ACTIVE_JOBS, retention: float = DEFAULT_RETENTION,
+                 scheduler: Optional[FairScheduler] = None):
+        self.max_active = max_active
+        self.retention = retention
+        self.scheduler = scheduler or FairScheduler()
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        # Jobs holding a slot; only touched on the loop thread
+        self._active = 0
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="cad-job-manager", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def submit(self, prompt: str, formats: List[str], file_name: str = "my_design",
+               use_cache: bool = True, owner: Optional[str] = None) -> str:
+        """
+        Queues a generation of one design in one or more formats and returns its job ID
+        immediately. Raises an Exception when owner's hourly quota is used up.
+        """
+        return self.submit_many([{"prompt": prompt, "formats": formats, "file_name": file_name,
+                                  "use_cache": use_cache}], owner)[0]
+
+    def submit_many(self, requests: List[dict], owner: Optional[str] = None) -> List[str]:
+        """
+        Queues several generations (dicts of submit()'s arguments) and returns their job
+        IDs. All of them are charged to owner's hourly quota at once: when they do not
+        all fit, none is queued and an Exception says why.
+        """
+        self.scheduler.admit(owner, len(requests))
+        return [self._queue(Job(request["prompt"], request["formats"], request.get("file_name", "my_design"),
+                                request.get("use_cache", True), owner))
+                for request in requests]
+
+    def _queue(self, job: Job) -> str:
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self.scheduler.push(job.owner, job)
+        self._loop.call_soon_threadsafe(self._dispatch)
+        return job.id
+
+    def reattach(self, owner: str) -> List[str]:
+        """
+        Queues a job for each of owner's journaled generations that is still running
+        remotely or finished without being downloaded. They resume polling (or come
+        straight from the cache) instead of being submitted again. They were paid
+        for already, so they do not count against the quota.
+
+        Generations that already have a job here (from another tab, or an earlier
+        reattach) return that job's ID instead, so each is polled and recorded once.
+        """
+        with self._lock:
+            live = {
+                cache_key(job.prompt, ext): job.id
+                for job in self._jobs.values() if job.owner == owner and job.status != "failed"
+                for ext in job.formats
+            }
+        job_ids = []
+        for entry in get_journal().unfinished(owner):
+            job_id = live.get(entry["key"])
+            if job_id is None:
+                job_id = live[entry["key"]] = self._queue(
+                    Job(entry["prompt"], [entry["format"]], "recovered_design", True, owner))
+            if job_id not in job_ids:
+                job_ids.append(job_id)
+        return job_ids
+
+    def delivered(self, job_id: str) -> None:
+        """
+        Records that a job's files reached its user, so it is not recovered again.
+        """
+        job = self.get(job_id)
+        if job is not None:
+            get_journal().mark_delivered([cache_key(job.prompt, ext) for ext in job.results], job.owner)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, job_ids: List[str]) -> List[Job]:
+        with self._lock:
+            return [self._jobs[job_id] for job_id in job_ids if job_id in self._jobs]
+
+    def stats(self) -> dict:
+        """
+        Returns job counts by status across all sessions.
+        """
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        counts["max_active"] = self.max_active
+        return counts
+
+    def quota(self, owner: Optional[str]) -> dict:
+        """
+        Returns owner's quota status (see FairScheduler.status).
+        """
+        return self.scheduler.status(owner)
+
+    def overview(self) -> List[dict]:
+        """
+        Returns the quota status of every recently active user, busiest first.
+        """
+        return self.scheduler.overview()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id in [job.id for job in self._jobs.values() if job.done and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    def _dispatch(self) -> None:
+        # Runs on the loop thread: hand free slots to the jobs the scheduler picks
+        while self._active < self.max_active:
+            job = self.scheduler.pop()
+            if job is None:
+                return
+            self._active += 1
+            self._loop.create_task(self._execute(job))
+
+    async def _execute(self, job: Job) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        job.timings["queued"] = job.started_at - job.created_at
+        job.message = "Submitting your design prompt to the API..."
+        status = "failed"
+        try:
+            await run_job(job, priority=PRIORITY_INTERACTIVE)
+            status = "completed"
+        except Exception as e:
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            # Outputs reach the history before the job reads as done, so its
+            # download links resolve as soon as they are shown
+            await asyncio.to_thread(record_job, job, status)
+            job.status = status
+            self._active -= 1
+            self.scheduler.finished(job.owner)
+            self._dispatch()
+
+
+async def run_job(job: Job, priority: int = PRIORITY_INTERACTIVE) -> None:
+    """
+    Generates job's outputs and, for an STL, its mesh analysis and preview. Progress
+    lands on the job as it happens; errors propagate to the caller, which sets the
+    final status once the outputs are recorded.
+    """
+    job.results = await agenerate_cad_formats(
+        job.prompt,
+        job.formats,
+        use_cache=job.use_cache,
+        on_event=job.apply,
+        owner=job.owner,
+        priority=priority,
+    )
+    job.timings["generation"] = time.time() - job.started_at
+
+    # Measure and decimate the mesh once here so page reruns only display it
+    if "stl" in job.results:
+        job.message = "Analyzing mesh..."
+        analysis_started = time.time()
+        try:
+            job.analysis = await asyncio.to_thread(analyze_stl, job.results["stl"])
+        except ValueError:
+            job.analysis = None
+        # A mesh the decimator cannot handle still keeps its analysis
+        job.message = "Preparing 3D preview..."
+        try:
+            job.preview = await asyncio.to_thread(build_preview, job.results["stl"])
+        except ValueError:
+            job.preview = None
+        job.timings["analysis"] = time.time() - analysis_started
+    job.progress = 1.0
+
+
+def record_job(job: Job, status: Optional[str] = None) -> None:
+    # History is best effort: a full disk must not turn a finished job into a failure
+    status = status or job.status
+    try:
+        history = get_history()
+        for ext in job.results or job.formats:
+            history.record(
+                job.id,
+                job.prompt,
+                ext,
+                status,
+                data=job.results.get(ext),
+                file_name=f"{job.file_name}.{ext}",
+                error=job.error,
+                timings=job.timings,
+                created_at=job.created_at,
+                finished_at=job.finished_at,
+            )
+        if status == "completed":
+            note_generation(job.prompt, job.id)
+    except Exception:
+        logger.exception("Failed to record job %s in history", job.id)
+
+
+class QueuedJobManager:
+    """
+    The JobManager interface for a front-end that only enqueues: jobs go to the
+    shared work queue, worker processes (worker.py) run them, and their state and
+    outputs are read back from the queue and the history store.
+    """
+
+    def __init__(self, queue=None, retention: float = DEFAULT_RETENTION,
+                 jobs_per_hour: int = JOBS_PER_HOUR, max_concurrent: int = MAX_CONCURRENT):
+        self.queue = queue or get_queue()
+        self.retention = retention
+        # Quotas are counted from the queue itself, so every front-end sharing it agrees;
+        # workers enforce max_concurrent when leasing
+        self.jobs_per_hour = jobs_per_hour
+        self.max_concurrent = max_concurrent
+        self.weights = parse_weights(USER_WEIGHTS)
+        # Finished jobs never change, so their state is loaded once; outputs stay on disk
+        self._finished: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str, formats: List[str], file_name: str = "my_design",
+               use_cache: bool = True, owner: Optional[str] = None) -> str:
+        return self.submit_many([{"prompt": prompt, "formats": formats, "file_name": file_name,
+                                  "use_cache": use_cache}], owner)[0]
+
+    def submit_many(self, requests: List[dict], owner: Optional[str] = None) -> List[str]:
+        # The quota is counted and charged in the queue transaction that adds the tasks
+        job_ids = self.queue.enqueue_many(requests, owner=owner, priority=PRIORITY_INTERACTIVE,
+                                          limit=self.jobs_per_hour, since=time.time() - QUOTA_WINDOW)
+        if job_ids is None:
+            quota_rejections.inc()
+            raise Exception(quota_message(self.quota(owner), len(requests)))
+        return job_ids
+
+    def reattach(self, owner: str) -> List[str]:
+        """
+        Returns owner's queued, running and undownloaded jobs. The queue already keeps
+        them, so nothing new is queued and every tab gets the same job IDs.
+        """
+        return self.queue.undelivered(owner)
+
+    def delivered(self, job_id: str) -> None:
+        job = self.get(job_id)
+        if job is not None:
+            self.queue.mark_delivered(job_id)
+            get_journal().mark_delivered([cache_key(job.prompt, ext) for ext in job.results], job.owner)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        jobs = self.jobs([job_id])
+        return jobs[0] if jobs else None
+
+    def jobs(self, job_ids: List[str]) -> List[Job]:
+        with self._lock:
+            self._prune()
+            finished = {job_id: self._finished[job_id] for job_id in job_ids if job_id in self._finished}
+        tasks = {task["id"]: task for task in self.queue.tasks([job_id for job_id in job_ids if job_id not in finished])}
+        jobs = []
+        for job_id in job_ids:
+            if job_id in finished:
+                jobs.append(finished[job_id])
+            elif job_id in tasks:
+                jobs.append(self._load(tasks[job_id]))
+        return jobs
+
+    def stats(self) -> dict:
+        counts = self.queue.stats()
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("leased", 0),
+            "completed": counts.get("completed", 0),
+            "failed": counts.get("failed", 0),
+            "max_active": None,
+        }
+
+    def quota(self, owner: Optional[str]) -> dict:
+        now = time.time()
+        charged = account(owner)
+        usage = self.queue.usage(now - QUOTA_WINDOW, charged).get(charged) or {}
+        return self._status(charged, usage, now)
+
+    def overview(self) -> List[dict]:
+        now = time.time()
+        statuses = [dict(self._status(charged, usage, now), owner=charged)
+                    for charged, usage in self.queue.usage(now - QUOTA_WINDOW).items()]
+        return sorted(statuses, key=lambda status: (-status["running"], -status["waiting"], -status["used"]))
+
+    def _status(self, charged: str, usage: dict, now: float) -> dict:
+        # The FairScheduler.status fields, from the queue's counts for one account
+        return {
+            "used": usage.get("submitted") or 0,
+            "limit": self.jobs_per_hour,
+            "resets_in": usage["oldest"] + QUOTA_WINDOW - now if usage.get("oldest") else None,
+            "running": usage.get("leased") or 0,
+            "max_concurrent": self.max_concurrent,
+            "waiting": usage.get("queued") or 0,
+            "weight": self.weights.get(charged, 1.0),
+        }
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.retention
+        for job_id in [job.id for job in self._finished.values() if job.finished_at < cutoff]:
+            del self._finished[job_id]
+
+    def _load(self, task: dict) -> Job:
+        job = Job(task["prompt"], task["formats"], task["file_name"], task["use_cache"], task["owner"])
+        job.id = task["id"]
+        job.status = {"leased": "running"}.get(task["status"], task["status"])
+        for name in ("progress", "message", "stage", "remote_id", "polls", "error", "analysis", "preview",
+                     "timings", "created_at", "started_at", "finished_at"):
+            setattr(job, name, task[name])
+        if job.status == "completed":
+            # Worker processes stored the outputs in the shared history
+            history = get_history()
+            job.results = StoredResults({
+                artifact["format"]: artifact["artifact_sha256"] for artifact in history.job_artifacts(job.id)
+                if os.path.exists(history.blob_path(artifact["artifact_sha256"]))
+            })
+            note_generation(job.prompt, job.id)
+        if job.done:
+            with self._lock:
+                self._finished[job.id] = job
+        return job
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """
+    Returns the process-wide job manager for EXECUTION_MODE, creating it on first use.
+    Every page of the web app shares it, so the generation cap holds server-wide.
+    """
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = QueuedJobManager() if EXECUTION_MODE == "queue" else JobManager()
+        return _default_manager
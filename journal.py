@@ -0,0 +1,143 @@
+import getpass
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from history import DEFAULT_DATA_DIR
+
+# Journaled jobs older than this are not reattached; the API may no longer hold them
+DEFAULT_MAX_AGE = float(os.environ.get("CADIA_JOURNAL_MAX_AGE", 24 * 3600))
+
+# submitted: remote job running or unknown; completed: outputs cached but not yet
+# handed to the user; delivered: written to disk or downloaded; failed: remote failure
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS remote_jobs (
+    remote_id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    format TEXT NOT NULL,
+    owner TEXT,
+    status TEXT NOT NULL,
+    error TEXT,
+    submitted_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS remote_jobs_key ON remote_jobs (key, status);
+CREATE INDEX IF NOT EXISTS remote_jobs_owner ON remote_jobs (owner, status);
+"""
+
+
+def default_owner() -> str:
+    """
+    Returns the identity used for jobs started outside the web app.
+    """
+    override = os.environ.get("CADIA_USER")
+    if override:
+        return override
+    try:
+        return getpass.getuser()
+    except Exception:
+        return "cli"
+
+
+class JobJournal:
+    """
+    Durable record of every remote job ID, written before polling starts so a
+    crashed or rerun process can reattach instead of paying for the job again.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DATA_DIR, max_age: float = DEFAULT_MAX_AGE):
+        self.max_age = max_age
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, "journal.sqlite3"), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # Each journal write must survive a power cut, not just a process crash
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+
+    def record_submitted(self, remote_id: str, key: str, prompt: str, output_format: str,
+                         owner: Optional[str] = None) -> None:
+        """
+        Durably records a freshly submitted remote job.
+        """
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO remote_jobs (remote_id, key, prompt, format, owner, status,"
+                " submitted_at, updated_at) VALUES (?, ?, ?, ?, ?, 'submitted', ?, ?)",
+                (remote_id, key, prompt, output_format, owner or default_owner(), now, now),
+            )
+
+    def mark(self, remote_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE remote_jobs SET status = ?, error = ?, updated_at = ? WHERE remote_id = ?",
+                (status, error, time.time(), remote_id),
+            )
+
+    def mark_delivered(self, keys: Iterable[str], owner: Optional[str] = None) -> None:
+        """
+        Marks owner's completed jobs for the given cache keys as handed to them.
+        Without an owner, the jobs are those recorded without one (default_owner()),
+        as in record_submitted(); other users' jobs for the same keys stay unfinished.
+        """
+        owner = owner or default_owner()
+        now = time.time()
+        with self._lock, self._db:
+            for key in keys:
+                self._db.execute(
+                    "UPDATE remote_jobs SET status = 'delivered', updated_at = ?"
+                    " WHERE key = ? AND owner = ? AND status = 'completed'", (now, key, owner),
+                )
+
+    def find(self, key: str, statuses: Iterable[str] = ("submitted",)) -> Optional[dict]:
+        """
+        Returns the newest recent job for a cache key in one of the given statuses.
+        """
+        statuses = list(statuses)
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT * FROM remote_jobs WHERE key = ? AND status IN ({placeholders})"
+                " AND submitted_at >= ? ORDER BY submitted_at DESC LIMIT 1",
+                [key, *statuses, time.time() - self.max_age],
+            ).fetchone()
+        return dict(row) if row else None
+
+    def unfinished(self, owner: Optional[str] = None) -> List[dict]:
+        """
+        Returns recent jobs that are still running or were never delivered,
+        newest first and one per cache key.
+        """
+        owner = owner or default_owner()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM remote_jobs WHERE owner = ? AND status IN ('submitted', 'completed')"
+                " AND submitted_at >= ? ORDER BY submitted_at DESC",
+                (owner, time.time() - self.max_age),
+            ).fetchall()
+        entries, seen = [], set()
+        for row in rows:
+            if row["key"] not in seen:
+                seen.add(row["key"])
+                entries.append(dict(row))
+        return entries
+
+
+_default_journal: Optional[JobJournal] = None
+_default_journal_lock = threading.Lock()
+
+
+def get_journal() -> JobJournal:
+    """
+    Returns the process-wide job journal, creating it on first use.
+    """
+    global _default_journal
+    with _default_journal_lock:
+        if _default_journal is None:
+            _default_journal = JobJournal()
+        return _default_journal
@@ -0,0 +1,277 @@
+import base64
+import datetime
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+from mesh import STL_HEADER_SIZE, STL_TRIANGLE_DTYPE
+
+# Every mock job belongs to this user
+MOCK_USER_ID = "00000000-0000-0000-0000-00000000cad1"
+
+
+def sphere_triangles(triangles: int, radius: float = 25.0) -> np.ndarray:
+    """
+    Returns a closed UV sphere with roughly the requested number of triangles.
+    """
+    rings = max(3, int(np.sqrt(max(triangles, 8) / 2)))
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, rings, endpoint=False)
+    ring_points = np.stack([
+        np.outer(np.sin(theta), np.cos(phi)),
+        np.outer(np.sin(theta), np.sin(phi)),
+        np.repeat(np.cos(theta)[:, None], rings, axis=1),
+    ], axis=-1).reshape(-1, 3)
+    points = np.vstack([[0, 0, 1], ring_points, [0, 0, -1]]) * radius
+
+    # Index 0 is the north pole, the last index the south pole, rings in between
+    ring = np.arange(rings)
+    following = (ring + 1) % rings
+    faces = [np.stack([np.zeros(rings, int), 1 + ring, 1 + following], axis=1)]
+    for row in range(len(theta) - 1):
+        top, bottom = 1 + row * rings, 1 + (row + 1) * rings
+        faces.append(np.stack([top + ring, bottom + ring, bottom + following], axis=1))
+        faces.append(np.stack([top + ring, bottom + following, top + following], axis=1))
+    last = 1 + (len(theta) - 1) * rings
+    faces.append(np.stack([last + ring, np.full(rings, len(points) - 1), last + following], axis=1))
+    return points[np.vstack(faces)].astype(np.float32)
+
+
+def stl_bytes(triangles: np.ndarray) -> bytes:
+    records = np.zeros(len(triangles), dtype=STL_TRIANGLE_DTYPE)
+    records["vertices"] = triangles
+    header = b"mock zoo text-to-cad".ljust(STL_HEADER_SIZE - 4, b" ")
+    return header + np.uint32(len(triangles)).tobytes() + records.tobytes()
+
+
+def step_bytes(triangles: np.ndarray, name: str = "mock_part") -> bytes:
+    """
+    Writes the mesh as an ISO 10303-21 faceted B-rep, so STEP payloads have a
+    realistic structure and size.
+    """
+    vertices, faces = np.unique(triangles.reshape(-1, 3), axis=0, return_inverse=True)
+    faces = faces.reshape(-1, 3)
+    lines = [
+        "ISO-10303-21;",
+        "HEADER;",
+        "FILE_DESCRIPTION(('Mock text-to-CAD output'),'2;1');",
+        f"FILE_NAME('{name}.step','{datetime.datetime.now(datetime.timezone.utc).isoformat()}',(''),(''),'','mock','');",
+        "FILE_SCHEMA(('AUTOMOTIVE_DESIGN { 1 0 10303 214 1 1 1 1 }'));",
+        "ENDSEC;",
+        "DATA;",
+    ]
+    for index, (x, y, z) in enumerate(vertices, 1):
+        lines.append(f"#{index}=CARTESIAN_POINT('',({x:.6f},{y:.6f},{z:.6f}));")
+    entity = len(vertices)
+    face_ids = []
+    for a, b, c in faces + 1:
+        lines.append(f"#{entity + 1}=POLY_LOOP('',(#{a},#{b},#{c}));")
+        lines.append(f"#{entity + 2}=FACE_OUTER_BOUND('',#{entity + 1},.T.);")
+        lines.append(f"#{entity + 3}=FACE('',(#{entity + 2}));")
+        face_ids.append(f"#{entity + 3}")
+        entity += 3
+    lines.append(f"#{entity + 1}=CLOSED_SHELL('',({','.join(face_ids)}));")
+    lines.append(f"#{entity + 2}=FACETED_BREP('{name}',#{entity + 1});")
+    lines.append(f"#{entity + 3}=SHAPE_REPRESENTATION('{name}',(#{entity + 2}),$);")
+    lines += ["ENDSEC;", "END-ISO-10303-21;", ""]
+    return "\n".join(lines).encode("ascii")
+
+
+class MockZooServer:
+    """
+    Local stand-in for the Zoo text-to-CAD and file conversion endpoints.
+
+    Job durations follow a log-normal distribution around latency_median seconds;
+    failure_rate of jobs finish as failed and throttle_rate of requests get a 429.
+    Outputs are a sphere of output_triangles triangles as STEP and STL.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_median: float = 2.0,
+                 latency_sigma: float = 0.5, failure_rate: float = 0.0, throttle_rate: float = 0.0,
+                 output_triangles: int = 5000, seed: Optional[int] = None):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.counts = {"submit": 0, "poll": 0, "convert": 0, "throttled": 0}
+        self._random = random.Random(seed)
+        self._jobs: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+        # Payloads are built once and shared by every job
+        mesh = sphere_triangles(output_triangles)
+        self._outputs = {
+            "step": base64.urlsafe_b64encode(step_bytes(mesh)).decode("ascii"),
+            "stl": base64.urlsafe_b64encode(stl_bytes(mesh)).decode("ascii"),
+        }
+
+        handler = type("MockHandler", (_MockHandler,), {"mock": self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockZooServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-zoo", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            for name in self.counts:
+                self.counts[name] = 0
+            self._jobs.clear()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+    def _throttled(self) -> bool:
+        with self._lock:
+            throttled = self._random.random() < self.throttle_rate
+            if throttled:
+                self.counts["throttled"] += 1
+        return throttled
+
+    def _create(self, kind: str, fields: dict, latency_scale: float = 1.0) -> dict:
+        with self._lock:
+            duration = self._random.lognormvariate(np.log(self.latency_median), self.latency_sigma) * latency_scale
+            job = {
+                "kind": kind,
+                "id": str(uuid.uuid4()),
+                "created": time.time(),
+                "duration": duration,
+                "failed": self._random.random() < self.failure_rate,
+                **fields,
+            }
+            self._jobs[job["id"]] = job
+        return job
+
+    def _record(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+
+        now = time.time()
+        done = now - job["created"] >= job["duration"]
+        stamp = lambda seconds: datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).isoformat()
+        record = {
+            "id": job["id"],
+            "created_at": stamp(job["created"]),
+            "started_at": stamp(job["created"]),
+            "updated_at": stamp(now),
+            "completed_at": stamp(job["created"] + job["duration"]) if done else None,
+            "user_id": MOCK_USER_ID,
+            "output_format": job["output_format"],
+            "status": "in_progress",
+            "outputs": None,
+        }
+        if job["kind"] == "text_to_cad":
+            record.update(model="cad", model_version="mock-1", prompt=job["prompt"])
+        else:
+            record.update(src_format=job["src_format"])
+
+        if done and job["failed"]:
+            record.update(status="failed", error="Mock failure injected by the failure rate")
+        elif done:
+            record["status"] = "completed"
+            if job["kind"] == "text_to_cad":
+                record["outputs"] = {"source.step": self._outputs["step"], "source.stl": self._outputs["stl"]}
+            else:
+                fmt = job["output_format"]
+                record["outputs"] = {f"output.{fmt}": self._outputs.get(fmt, self._outputs["step"])}
+        return record
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock: MockZooServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send(status, {"error_code": str(status), "message": message, "request_id": str(uuid.uuid4())}, headers)
+
+    def _segments(self) -> Tuple[str, ...]:
+        return tuple(segment for segment in urlparse(self.path).path.split("/") if segment)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.mock._throttled():
+            return self._error(429, "Too many requests", {"Retry-After": "1"})
+
+        segments = self._segments()
+        if segments[:2] == ("ai", "text-to-cad") and len(segments) == 3:
+            self.mock._count("submit")
+            prompt = json.loads(body or b"{}").get("prompt", "")
+            job = self.mock._create("text_to_cad", {"output_format": segments[2], "prompt": prompt})
+            return self._send(201, self.mock._record(job["id"]))
+        if segments[:2] == ("file", "conversion") and len(segments) == 4:
+            self.mock._count("convert")
+            job = self.mock._create("file_conversion", {"src_format": segments[2], "output_format": segments[3]},
+                                    latency_scale=0.1)
+            return self._send(201, self.mock._record(job["id"]))
+        self._error(404, "Not found")
+
+    def do_GET(self):
+        if self.mock._throttled():
+            return self._error(429, "Too many requests", {"Retry-After": "1"})
+
+        segments = self._segments()
+        if segments[:2] in (("user", "text-to-cad"), ("async", "operations")) and len(segments) == 3:
+            self.mock._count("poll")
+            record = self.mock._record(segments[2])
+            if record is None:
+                return self._error(404, "No such job")
+            return self._send(200, record)
+        self._error(404, "Not found")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local mock of the Zoo text-to-CAD API.")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=8787, help="Port to listen on.")
+    parser.add_argument("--latency", type=float, default=2.0, help="Median job duration in seconds.")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Log-normal spread of job durations.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of jobs that fail.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered with 429.")
+    parser.add_argument("--triangles", type=int, default=5000, help="Triangles in every generated model.")
+    args = parser.parse_args()
+
+    server = MockZooServer(args.host, args.port, args.latency, args.sigma, args.failure_rate,
+                           args.throttle_rate, args.triangles).start()
+    print(f"Mock Zoo API listening on {server.url}; point the app at it with ZOO_HOST={server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,72 @@
+import streamlit as st
+import datetime
+
+from artifact_server import get_artifact_server
+from history import get_history
+
+# Rows fetched per "Load more" click
+PAGE_SIZE = 20
+
+st.set_page_config(
+    page_title="Project CADIA - History",
+    page_icon="🏗️",
+    layout="wide",
+)
+
+st.title("📜 Generation History")
+st.markdown("Every design generated on this server. Past files download straight from storage without regenerating.")
+
+history = get_history()
+# With the artifact endpoint enabled, past files download through signed links, not session memory
+server = get_artifact_server()
+query = st.text_input("Search prompts", placeholder="e.g. gear, bracket with holes")
+compress = st.toggle("Compressed downloads", help="Download .gz files, served as stored without decompressing")
+
+# Restart paging whenever the search changes; only row metadata is kept between reruns
+if st.session_state.get("history_query") != query:
+    st.session_state["history_query"] = query
+    st.session_state["history_rows"] = history.page(query, limit=PAGE_SIZE)
+    st.session_state["history_exhausted"] = len(st.session_state["history_rows"]) < PAGE_SIZE
+
+rows = st.session_state["history_rows"]
+st.caption(f"Showing {len(rows)} of {history.count()} recorded generations")
+
+for row in rows:
+    created = datetime.datetime.fromtimestamp(row["created_at"]).strftime("%Y-%m-%d %H:%M")
+    prompt_col, info_col, action_col = st.columns([6, 3, 2])
+    with prompt_col:
+        st.markdown(f"**{row['prompt']}**")
+        st.caption(f"{created} • job {row['job_id'][:8]}")
+    with info_col:
+        total = sum(row["timings"].values())
+        st.markdown(f"`{row['format'].upper()}` • {row['status']}")
+        if row["artifact_size"]:
+            st.caption(f"{row['artifact_size'] / 1024:,.0f} KB • {total:.1f} s")
+        elif row["error"]:
+            st.caption(row["error"][:120])
+    with action_col:
+        file_name = row["file_name"] or f"design.{row['format']}"
+        download_name = f"{file_name}.gz" if compress else file_name
+        if server and row["artifact_sha256"]:
+            st.link_button("📥 Download", server.blob_link(
+                row["artifact_sha256"], download_name, size=row["artifact_size"], compressed=compress
+            ), use_container_width=True)
+        elif row["artifact_sha256"]:
+            data = history.read_blob(row["artifact_sha256"], compressed=compress)
+            if data is not None:
+                st.download_button(
+                    label="📥 Download",
+                    data=data,
+                    file_name=download_name,
+                    mime="application/gzip" if compress else "application/octet-stream",
+                    use_container_width=True,
+                    key=f"history_download_{row['id']}",
+                )
+    st.divider()
+
+if not st.session_state["history_exhausted"]:
+    if st.button("Load more", use_container_width=True):
+        more = history.page(query, before=rows[-1]["id"], limit=PAGE_SIZE)
+        st.session_state["history_rows"] = rows + more
+        st.session_state["history_exhausted"] = len(more) < PAGE_SIZE
+        st.rerun()
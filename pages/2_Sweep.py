@@ -0,0 +1,245 @@
+import streamlit as st
+
+from artifact_server import get_artifact_server
+from artifacts import zip_bundle
+from history import get_history
+from identity import current_user
+from jobs import get_job_manager
+from metrics import estimator
+from scheduler import quota_summary
+from sweep import MAX_VARIANTS, expand, mesh_columns, parse_values, template_fields
+
+st.set_page_config(
+    page_title="Project CADIA - Parameter Sweep",
+    page_icon="🏗️",
+    layout="wide",
+)
+
+st.title("🧪 Parameter Sweep")
+st.markdown(
+    "Write a prompt with `{placeholders}`, give each one a list or range of values, and every variant "
+    "is generated side by side. Variants generated before come straight from stored results."
+)
+
+job_manager = get_job_manager()
+# With the artifact endpoint enabled, downloads are signed links instead of bytes in session memory
+server = get_artifact_server()
+
+# Jobs belong to the same user as on the main page, so they show up in its recovery too
+user_id = current_user()
+
+template = st.text_input(
+    "Prompt template",
+    "A gear with {teeth} teeth, {thickness}mm thick, with a 10mm diameter center hole",
+    help="Wrap each parameter in braces, e.g. {teeth}",
+)
+
+try:
+    fields = template_fields(template)
+except Exception as e:
+    st.error(str(e))
+    fields = []
+
+with st.form("sweep_form"):
+    specs = {}
+    for column, field in zip(st.columns(max(len(fields), 1)), fields):
+        with column:
+            specs[field] = st.text_input(
+                f"Values for {{{field}}}",
+                key=f"sweep_values_{field}",
+                placeholder="20,24,28 or 5:10:2.5",
+                help="Comma-separated values, or an inclusive range start:stop:step",
+            )
+    option_col1, option_col2 = st.columns(2)
+    with option_col1:
+        mode = st.radio(
+            "Combine values",
+            ["grid", "zip"],
+            format_func={"grid": "Every combination", "zip": "Pair values in order"}.get,
+            horizontal=True,
+        )
+    with option_col2:
+        formats = st.multiselect(
+            "Output formats",
+            ["step", "stl"],
+            default=["step", "stl"],
+            help="Include STL to compare triangle counts, volume and size across variants",
+        )
+    run_button = st.form_submit_button(f"🚀 Run sweep (up to {MAX_VARIANTS} variants)", disabled=not fields)
+
+# Expand the sweep and queue one job per variant; the job manager caps how many run at once
+if run_button:
+    try:
+        params = {field: parse_values(spec) for field, spec in specs.items()}
+        variants = expand(template, params, mode)
+    except Exception as e:
+        st.error(str(e))
+    else:
+        # The whole sweep is charged to the quota at once: all of it is queued or none
+        try:
+            job_ids = job_manager.submit_many(
+                [{"prompt": variant["prompt"], "formats": formats or ["step"], "file_name": variant["name"]}
+                 for variant in variants],
+                owner=user_id,
+            )
+        except Exception as e:
+            st.error(str(e))
+        else:
+            st.session_state.setdefault("sweeps", []).append({
+                "template": template,
+                "fields": fields,
+                "variants": [dict(variant, job_id=job_id) for variant, job_id in zip(variants, job_ids)],
+            })
+
+
+def sweep_rows(sweep, jobs):
+    rows = []
+    for variant in sweep["variants"]:
+        job = jobs.get(variant["job_id"])
+        row = dict(variant["values"])
+        if job is None:
+            row.update(status="expired")
+            rows.append(row)
+            continue
+        row.update(
+            status=job.status,
+            progress=int(job.progress * 100),
+            source={"cache": "stored", None: ""}.get(job.source, job.source) if job.done else "",
+            seconds=round(sum(job.timings.values()), 1) if job.done else None,
+        )
+        row.update(mesh_columns(job.analysis))
+        if job.error:
+            row["error"] = job.error
+        rows.append(row)
+    return rows
+
+
+def render_sweep(index, sweep):
+    jobs = {job.id: job for job in job_manager.jobs([variant["job_id"] for variant in sweep["variants"]])}
+    done = sum(1 for job in jobs.values() if job.done)
+    st.markdown(f"### Sweep {index + 1}: `{sweep['template']}`")
+    st.progress(done / len(sweep["variants"]), text=f"{done} of {len(sweep['variants'])} variants finished")
+    if done < len(sweep["variants"]):
+        st.caption(f"Recent designs took about {estimator.estimate():.0f} seconds each; results appear as they arrive.")
+
+    rows = sweep_rows(sweep, jobs)
+    st.dataframe(
+        rows,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "progress": st.column_config.ProgressColumn("progress", min_value=0, max_value=100, format="%d%%"),
+            "volume_mm3": st.column_config.NumberColumn("volume (mm³)", format="%.1f"),
+            "surface_area_mm2": st.column_config.NumberColumn("surface area (mm²)", format="%.1f"),
+            "size_mm": "size (mm)",
+            "seconds": st.column_config.NumberColumn("seconds", format="%.1f"),
+        },
+    )
+
+    # Per-variant downloads, plus every finished variant in one zip
+    finished = [(variant, jobs[variant["job_id"]]) for variant in sweep["variants"]
+                if variant["job_id"] in jobs and jobs[variant["job_id"]].status == "completed"]
+    if not finished:
+        return
+    pick_col, download_col = st.columns([2, 3])
+    with pick_col:
+        choice = st.selectbox(
+            "Variant",
+            range(len(finished)),
+            format_func=lambda position: finished[position][0]["name"],
+            key=f"sweep_pick_{index}",
+        )
+    variant, job = finished[choice]
+    links = sweep_links(index, variant, job, finished, len(finished) == len(sweep["variants"])) if server else None
+    with download_col:
+        columns = st.columns(len(job.results) + 1)
+        for column, (ext, payload) in zip(columns, job.results.items()):
+            with column:
+                if links:
+                    st.link_button(f"📥 {ext.upper()}", links[ext], use_container_width=True)
+                    continue
+                st.download_button(
+                    label=f"📥 {ext.upper()}",
+                    data=payload,
+                    file_name=f"{variant['name']}.{ext}",
+                    mime="application/octet-stream",
+                    use_container_width=True,
+                    key=f"sweep_download_{index}_{job.id}_{ext}",
+                    on_click=job_manager.delivered,
+                    args=(job.id,),
+                )
+        with columns[-1]:
+            if len(finished) == len(sweep["variants"]):
+                if links and "bundle" in links:
+                    st.link_button("📦 All (.zip)", links["bundle"], use_container_width=True)
+                elif not links:
+                    st.download_button(
+                        label="📦 All (.zip)",
+                        data=sweep_bundle(tuple(job.id for _, job in finished), finished),
+                        file_name=f"sweep_{index + 1}.zip",
+                        mime="application/zip",
+                        use_container_width=True,
+                        key=f"sweep_bundle_{index}",
+                    )
+
+
+def sweep_links(index, variant, job, finished, complete):
+    # Signed links for the picked variant's files and, once every variant is done, the
+    # whole sweep zipped from stored blobs; None if any output is missing from the history
+    history = get_history()
+    stored = {}
+    for finished_variant, finished_job in finished:
+        for artifact in history.job_artifacts(finished_job.id):
+            stored[(finished_job.id, artifact["format"])] = artifact
+    if any((finished_job.id, ext) not in stored for _, finished_job in finished for ext in finished_job.results):
+        return None
+
+    links = {
+        ext: server.blob_link(stored[(job.id, ext)]["artifact_sha256"], f"{variant['name']}.{ext}",
+                              size=stored[(job.id, ext)]["artifact_size"], ref=job.id)
+        for ext in job.results
+    }
+    if complete:
+        members = [
+            (f"{finished_variant['name']}.{ext}", history.blob_path(stored[(finished_job.id, ext)]["artifact_sha256"]))
+            for finished_variant, finished_job in finished for ext in finished_job.results
+        ]
+        key = "sweep:" + ",".join(finished_job.id for _, finished_job in finished)
+        try:
+            links["bundle"] = server.bundle_link(key, f"sweep_{index + 1}.zip", members)
+        except Exception as e:
+            st.caption(f"The sweep zip is unavailable: {e}")
+    return links
+
+
+@st.cache_data(max_entries=8, show_spinner="Bundling the sweep...")
+def sweep_bundle(job_ids, _finished):
+    # Keyed on the finished job IDs; their outputs never change
+    return zip_bundle(
+        (f"{variant['name']}.{ext}", payload) for variant, job in _finished for ext, payload in job.results.items()
+    )
+
+
+sweeps = st.session_state.get("sweeps", [])
+polling = any(
+    not job.done
+    for sweep in sweeps
+    for job in job_manager.jobs([variant["job_id"] for variant in sweep["variants"]])
+)
+
+
+@st.fragment(run_every=2 if polling else None)
+def render_sweeps():
+    st.caption("Your usage: " + quota_summary(job_manager.quota(user_id)))
+    for index in reversed(range(len(sweeps))):
+        render_sweep(index, sweeps[index])
+        st.divider()
+
+    # Everything finished: stop the refresh timer with one full rerun
+    if polling and all(
+        job.done for sweep in sweeps for job in job_manager.jobs([variant["job_id"] for variant in sweep["variants"]])
+    ):
+        st.rerun()
+
+
+render_sweeps()
@@ -0,0 +1,74 @@
+import streamlit as st
+import hmac
+import os
+
+from jobs import get_job_manager
+from scheduler import JOBS_PER_HOUR, MAX_CONCURRENT
+
+st.set_page_config(
+    page_title="Project CADIA - Admin",
+    page_icon="🏗️",
+    layout="wide",
+)
+
+st.title("🛠️ Server Overview")
+
+# With CADIA_ADMIN_TOKEN set, the page asks for it before showing anything
+admin_token = os.environ.get("CADIA_ADMIN_TOKEN")
+if admin_token:
+    entered = st.text_input("Admin token", type="password")
+    if not hmac.compare_digest(entered.encode("utf-8"), admin_token.encode("utf-8")):
+        if entered:
+            st.error("That token is not valid.")
+        st.stop()
+
+job_manager = get_job_manager()
+st.caption(
+    f"Each user may submit {JOBS_PER_HOUR} designs per hour and run {MAX_CONCURRENT} at once; "
+    "waiting jobs are scheduled fairly between users by weight."
+)
+
+
+@st.fragment(run_every=5)
+def render_overview():
+    stats = job_manager.stats()
+    users = job_manager.overview()
+
+    waiting_col, running_col, users_col, finished_col = st.columns(4)
+    waiting_col.metric("Waiting", stats["queued"])
+    running_col.metric(
+        "Generating",
+        f"{stats['running']} / {stats['max_active']}" if stats["max_active"] else stats["running"],
+    )
+    users_col.metric("Active users", sum(1 for user in users if user["running"] or user["waiting"]))
+    finished_col.metric("Finished", stats["completed"] + stats["failed"], help=f"{stats['failed']} failed")
+
+    st.markdown("### Per-user usage")
+    if not users:
+        st.info("No one has submitted a design in the last hour.")
+        return
+    st.dataframe(
+        [
+            {
+                "user": user["owner"] or "(anonymous)",
+                "used": user["used"],
+                "limit": user["limit"],
+                "generating": user["running"],
+                "waiting": user["waiting"],
+                "weight": user["weight"],
+                "resets_in_min": round(user["resets_in"] / 60) if user["resets_in"] else None,
+            }
+            for user in users
+        ],
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "used": st.column_config.ProgressColumn(
+                "used this hour", min_value=0, max_value=max(user["limit"] for user in users), format="%d"
+            ),
+            "resets_in_min": st.column_config.NumberColumn("quota frees up in (min)", format="%d"),
+        },
+    )
+
+
+render_overview()
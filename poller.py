@@ -0,0 +1,228 @@
+import asyncio
+import concurrent.futures
+import os
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from clients import get_pool
+from kittycad.client import Client
+
+# kittycad.models is slow to import; it is loaded by the first poll instead
+if TYPE_CHECKING:
+    from kittycad.models import TextToCad
+
+# Polling schedule: start short, back off exponentially, never exceed the cap
+DEFAULT_INITIAL_INTERVAL = float(os.environ.get("CADIA_POLL_INITIAL", 1.0))
+DEFAULT_MAX_INTERVAL = float(os.environ.get("CADIA_POLL_MAX", 15.0))
+DEFAULT_BACKOFF = 1.5
+DEFAULT_JITTER = 0.25
+DEFAULT_DEADLINE = float(os.environ.get("CADIA_POLL_DEADLINE", 600.0))
+
+# Cap on status requests in flight at once across all tracked jobs
+DEFAULT_MAX_IN_FLIGHT = int(os.environ.get("CADIA_POLL_MAX_IN_FLIGHT", 64))
+
+# Update callbacks receive the latest job record and the seconds elapsed since tracking began
+UpdateCallback = Callable[["TextToCad", float], None]
+
+
+class _TrackedJob:
+    def __init__(self, job_id: str, client: Client, result: "TextToCad", deadline: float, interval: float):
+        self.job_id = job_id
+        self.client = client
+        self.result = result
+        self.started = time.monotonic()
+        self.deadline_at = self.started + deadline
+        self.deadline = deadline
+        self.interval = interval
+        self.next_due = self.started + interval
+        self.polls = 0
+        # One future per track() caller, so a caller that cancels leaves the others waiting
+        self.waiters: List[Tuple[concurrent.futures.Future, Optional[UpdateCallback]]] = []
+
+
+class JobPoller:
+    """
+    Polls many text-to-CAD jobs from one background thread. Each job gets its own
+    adaptive interval, so status calls scale with active jobs rather than callers.
+    """
+
+    def __init__(self, initial_interval: float = DEFAULT_INITIAL_INTERVAL,
+                 max_interval: float = DEFAULT_MAX_INTERVAL, backoff: float = DEFAULT_BACKOFF,
+                 jitter: float = DEFAULT_JITTER, deadline: float = DEFAULT_DEADLINE,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+        self.deadline = deadline
+        self.max_in_flight = max_in_flight
+        self.polls_issued = 0
+
+        self._jobs: Dict[str, _TrackedJob] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, client: Client, result: "TextToCad", deadline: Optional[float] = None,
+              on_update: Optional[UpdateCallback] = None) -> concurrent.futures.Future:
+        """
+        Starts tracking a submitted job and returns a future resolving to the finished
+        job record. Tracking the same job twice shares one poll stream, but every caller
+        gets its own future: cancelling it detaches only that caller, and a job nobody
+        is waiting for any more stops being polled.
+        """
+        job_id = str(result.id)
+        self._ensure_started()
+
+        waiter: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                job = _TrackedJob(job_id, client, result, deadline or self.deadline, self.initial_interval)
+                self._jobs[job_id] = job
+            job.waiters.append((waiter, on_update))
+        waiter.add_done_callback(lambda _: self._detach(job, waiter))
+
+        # Already-finished jobs (e.g. served from the API's own cache) need no polling
+        if result.completed_at is not None:
+            self._finish(job, result=result)
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return waiter
+
+    def stats(self) -> dict:
+        """
+        Returns the number of tracked jobs and status requests issued so far.
+        """
+        with self._lock:
+            return {"active_jobs": len(self._jobs), "polls_issued": self.polls_issued}
+
+    def _detach(self, job: _TrackedJob, waiter: concurrent.futures.Future) -> None:
+        with self._lock:
+            job.waiters = [entry for entry in job.waiters if entry[0] is not waiter]
+            if not job.waiters and self._jobs.get(job.job_id) is job:
+                del self._jobs[job.job_id]
+
+    def _finish(self, job: _TrackedJob, result: Optional["TextToCad"] = None,
+                error: Optional[Exception] = None) -> None:
+        with self._lock:
+            waiters = [entry[0] for entry in job.waiters]
+            if self._jobs.get(job.job_id) is job:
+                del self._jobs[job.job_id]
+        for waiter in waiters:
+            try:
+                if error is not None:
+                    waiter.set_exception(error)
+                else:
+                    waiter.set_result(result)
+            except concurrent.futures.InvalidStateError:
+                # That caller cancelled in the meantime
+                pass
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="cad-job-poller", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._wakeup = asyncio.Event()
+        self._ready.set()
+        self._loop.run_until_complete(self._main())
+
+    async def _main(self) -> None:
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        running = set()
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                jobs = list(self._jobs.values())
+            due = [job for job in jobs if job.next_due <= now]
+
+            for job in due:
+                # Push the next poll out before issuing this one so it is not picked twice
+                job.next_due = float("inf")
+                task = asyncio.ensure_future(self._poll(job, in_flight))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+            # Sleep until the next job is due or a new job arrives
+            upcoming = [job.next_due for job in jobs if job.next_due != float("inf")]
+            timeout = max(0.0, min(upcoming) - time.monotonic()) if upcoming else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, job: _TrackedJob, in_flight: asyncio.Semaphore) -> None:
+        from kittycad.api.ml import get_text_to_cad_model_for_user
+        from kittycad.models import Error
+
+        try:
+            async with in_flight:
+                self.polls_issued += 1
+                job.polls += 1
+                response = await get_pool().acall(
+                    get_text_to_cad_model_for_user,
+                    "GET",
+                    job.client,
+                    id=job.result.id,
+                )
+        except httpx.TransportError:
+            # Network hiccups are retried on the normal schedule
+            response = job.result
+        except Exception as e:
+            self._finish(job, error=e)
+            return
+
+        if isinstance(response, Error) or response is None:
+            self._finish(job, error=Exception(f"Error: {response}"))
+            return
+
+        job.result = response
+        elapsed = time.monotonic() - job.started
+        for _, listener in list(job.waiters):
+            if listener is None:
+                continue
+            try:
+                listener(response, elapsed)
+            except Exception:
+                pass
+
+        if response.completed_at is not None:
+            self._finish(job, result=response)
+            return
+
+        if time.monotonic() >= job.deadline_at:
+            self._finish(job, error=Exception(f"CAD generation timed out after {job.deadline:.0f} seconds"))
+            return
+
+        # Exponential backoff with jitter, capped, and never past the deadline
+        job.interval = min(self.max_interval, job.interval * self.backoff)
+        delay = job.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        job.next_due = min(time.monotonic() + delay, job.deadline_at)
+        self._wakeup.set()
+
+
+_default_poller: Optional[JobPoller] = None
+_default_poller_lock = threading.Lock()
+
+
+def get_poller() -> JobPoller:
+    """
+    Returns the process-wide job poller shared by every caller.
+    """
+    global _default_poller
+    with _default_poller_lock:
+        if _default_poller is None:
+            _default_poller = JobPoller()
+        return _default_poller
@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import os
+import struct
+from typing import Optional, Tuple
+
+import numpy as np
+
+from cache import get_cache
+from mesh import _vertex_keys, load_stl
+
+# Upper bound on vertices sent to the browser for one preview
+DEFAULT_VERTEX_BUDGET = int(os.environ.get("CADIA_PREVIEW_VERTICES", 30000))
+
+# Payload layout: magic, vertex count, face count, then float32 xyz and uint32 indices
+PREVIEW_MAGIC = b"CADP"
+PREVIEW_HEADER = struct.Struct("<4sII")
+
+
+def index_mesh(triangles: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Welds identical vertices and returns (positions, faces) for a triangle soup.
+    """
+    keys = _vertex_keys(triangles).ravel()
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    positions = np.asarray(triangles, dtype=np.float32).reshape(-1, 3)[first]
+    return positions, inverse.reshape(-1, 3).astype(np.uint32)
+
+
+def decimate(positions: np.ndarray, faces: np.ndarray,
+             max_vertices: int = DEFAULT_VERTEX_BUDGET) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduces an indexed mesh to at most max_vertices by vertex clustering: vertices
+    in the same grid cell are merged into their centroid and collapsed faces dropped.
+    """
+    if len(positions) <= max_vertices:
+        return positions, faces
+
+    low = positions.min(axis=0)
+    extent = np.maximum(positions.max(axis=0) - low, 1e-9)
+
+    # Surfaces occupy roughly resolution^2 cells, so start there and shrink until under budget
+    resolution = max(2, int(np.sqrt(max_vertices)))
+    while True:
+        cells = np.minimum((positions - low) / extent * resolution, resolution - 1).astype(np.int64)
+        cell_ids = (cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2]
+        unique_cells, cluster = np.unique(cell_ids, return_inverse=True)
+        if len(unique_cells) <= max_vertices or resolution <= 2:
+            break
+        resolution = max(2, int(resolution * np.sqrt(max_vertices / len(unique_cells)) * 0.95))
+
+    # Cluster centroid per axis via weighted bincount
+    counts = np.bincount(cluster)
+    clustered = np.stack([
+        np.bincount(cluster, weights=positions[:, axis]) / counts for axis in range(3)
+    ], axis=1).astype(np.float32)
+
+    remapped = cluster[faces]
+    keep = (remapped[:, 0] != remapped[:, 1]) & (remapped[:, 1] != remapped[:, 2]) & (remapped[:, 0] != remapped[:, 2])
+    return clustered, remapped[keep].astype(np.uint32)
+
+
+def encode_preview(positions: np.ndarray, faces: np.ndarray) -> bytes:
+    """
+    Packs a mesh as little-endian float32 positions and uint32 indices.
+    """
+    return b"".join([
+        PREVIEW_HEADER.pack(PREVIEW_MAGIC, len(positions), len(faces)),
+        np.ascontiguousarray(positions, dtype="<f4").tobytes(),
+        np.ascontiguousarray(faces, dtype="<u4").tobytes(),
+    ])
+
+
+def build_preview(stl: bytes, max_vertices: int = DEFAULT_VERTEX_BUDGET) -> bytes:
+    """
+    Returns the binary preview payload for an STL, reusing a cached one when the
+    same artifact was previewed before.
+    """
+    digest = hashlib.sha256(stl).hexdigest()
+    key = hashlib.sha256(f"preview:{digest}:{max_vertices}".encode("utf-8")).hexdigest()
+    cache = get_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    positions, faces = index_mesh(load_stl(stl))
+    payload = encode_preview(*decimate(positions, faces, max_vertices))
+    cache.put(key, payload, meta={"preview_of": digest, "max_vertices": max_vertices})
+    return payload
+
+
+def preview_html(payload: bytes, height: int = 420) -> str:
+    """
+    Returns a self-contained three.js viewer that decodes the binary payload in the browser.
+    """
+    encoded = base64.b64encode(payload).decode("ascii")
+    return f"""
+<div id="viewer" style="width: 100%; height: {height}px; border-radius: 8px; background: #F3F4F6;"></div>
+<script type="importmap">
+{{"imports": {{
+    "three": "https://unpkg.com/three@0.160.0/build/three.module.js",
+    "three/addons/": "https://unpkg.com/three@0.160.0/examples/jsm/"
+}}}}
+</script>
+<script type="module">
+import * as THREE from "three";
+import {{ OrbitControls }} from "three/addons/controls/OrbitControls.js";
+
+const raw = Uint8Array.from(atob("{encoded}"), c => c.charCodeAt(0)).buffer;
+const header = new DataView(raw, 0, {PREVIEW_HEADER.size});
+const vertexCount = header.getUint32(4, true);
+const faceCount = header.getUint32(8, true);
+const positions = new Float32Array(raw, {PREVIEW_HEADER.size}, vertexCount * 3);
+const indices = new Uint32Array(raw, {PREVIEW_HEADER.size} + vertexCount * 12, faceCount * 3);
+
+const geometry = new THREE.BufferGeometry();
+geometry.setAttribute("position", new THREE.BufferAttribute(positions, 3));
+geometry.setIndex(new THREE.BufferAttribute(indices, 1));
+geometry.computeVertexNormals();
+geometry.center();
+geometry.computeBoundingSphere();
+
+const container = document.getElementById("viewer");
+const renderer = new THREE.WebGLRenderer({{ antialias: true }});
+renderer.setSize(container.clientWidth, container.clientHeight);
+renderer.setClearColor(0xF3F4F6);
+container.appendChild(renderer.domElement);
+
+const scene = new THREE.Scene();
+scene.add(new THREE.HemisphereLight(0xffffff, 0x94A3B8, 1.2));
+const light = new THREE.DirectionalLight(0xffffff, 1.5);
+light.position.set(1, 2, 3);
+scene.add(light);
+scene.add(new THREE.Mesh(geometry, new THREE.MeshStandardMaterial({{ color: 0x3B82F6, metalness: 0.1, roughness: 0.6 }})));
+
+const radius = geometry.boundingSphere.radius || 1;
+const camera = new THREE.PerspectiveCamera(45, container.clientWidth / container.clientHeight, radius / 100, radius * 100);
+camera.position.set(radius * 1.8, radius * 1.4, radius * 1.8);
+const controls = new OrbitControls(camera, renderer.domElement);
+controls.enableDamping = true;
+
+(function animate() {{
+    requestAnimationFrame(animate);
+    controls.update();
+    renderer.render(scene, camera);
+}})();
+</script>
+"""
+
+
+def preview_stats(payload: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Returns (vertices, faces) from a preview payload header.
+    """
+    if len(payload) < PREVIEW_HEADER.size:
+        return None
+    magic, vertices, faces = PREVIEW_HEADER.unpack_from(payload)
+    return (vertices, faces) if magic == PREVIEW_MAGIC else None
@@ -0,0 +1,67 @@
+import re
+import unicodedata
+
+# Spelled-out counts that mean the same as their digits ("two holes" == "2 holes")
+NUMBER_WORDS = {
+    "zero": "0", "one": "1", "two": "2", "three": "3", "four": "4", "five": "5",
+    "six": "6", "seven": "7", "eight": "8", "nine": "9", "ten": "10", "eleven": "11",
+    "twelve": "12", "fifteen": "15", "twenty": "20",
+}
+
+# Every spelling of a unit maps to one symbol
+UNIT_SYMBOLS = {
+    "mm": "mm", "millimeter": "mm", "millimeters": "mm", "millimetre": "mm", "millimetres": "mm",
+    "cm": "cm", "centimeter": "cm", "centimeters": "cm", "centimetre": "cm", "centimetres": "cm",
+    "m": "m", "meter": "m", "meters": "m", "metre": "m", "metres": "m",
+    "in": "in", "inch": "in", "inches": "in", '"': "in",
+    "ft": "ft", "foot": "ft", "feet": "ft", "'": "ft",
+    "deg": "deg", "degree": "deg", "degrees": "deg", "°": "deg",
+}
+
+# Words that never change the design
+FILLER_WORDS = {"a", "an", "the", "please"}
+
+_NUMBER = r"(?:\d+(?:\.\d+)?|\.\d+)"
+_THOUSANDS = re.compile(r"\b\d{1,3}(?:,\d{3})+\b")
+_NUMBER_WORD = re.compile(r"\b(" + "|".join(NUMBER_WORDS) + r")\b")
+_UNIT = re.compile(
+    rf"({_NUMBER})\s*("
+    + "|".join(sorted((re.escape(unit) for unit in UNIT_SYMBOLS), key=len, reverse=True))
+    + r")(?![a-z])"
+)
+_DIMENSION = re.compile(rf"({_NUMBER})\s*(?:x|by)\s*(?=\.?\d)")
+_NUMBER_TOKEN = re.compile(_NUMBER)
+_PUNCTUATION = re.compile(r"[,;:!?()\[\]{}]|\.(?!\d)")
+
+
+def _number(match: "re.Match") -> str:
+    # 20.0 -> 20, 0.50 -> 0.5, .5 -> 0.5, 007 -> 7
+    whole, _, fraction = match.group(0).partition(".")
+    whole = whole.lstrip("0") or "0"
+    fraction = fraction.rstrip("0")
+    return f"{whole}.{fraction}" if fraction else whole
+
+
+def canonicalize_prompt(prompt: str) -> str:
+    """
+    Returns the canonical spelling of a prompt: casing, whitespace, number formats,
+    dimension notation and unit spellings are normalized and filler words dropped,
+    so "A 20mm Cube" and "a cube of 20 millimeters" come closer and "a 20 mm cube"
+    and "20 mm cube" become identical. Word order is left alone; it can change the design.
+    """
+    text = unicodedata.normalize("NFKC", prompt).casefold()
+    text = text.replace("×", " x ").replace("″", '"').replace("′", "'")
+    text = _THOUSANDS.sub(lambda match: match.group(0).replace(",", ""), text)
+    text = _NUMBER_WORD.sub(lambda match: NUMBER_WORDS[match.group(1)], text)
+    text = _NUMBER_TOKEN.sub(_number, text)
+    text = _DIMENSION.sub(r"\1 x ", text)
+    text = _UNIT.sub(lambda match: f"{match.group(1)} {UNIT_SYMBOLS[match.group(2)]}", text)
+    text = _PUNCTUATION.sub(" ", text)
+    return " ".join(word for word in text.split() if word not in FILLER_WORDS)
+
+
+def prompt_numbers(prompt: str) -> tuple:
+    """
+    Returns the sorted numbers in a canonical prompt; designs with different numbers differ.
+    """
+    return tuple(sorted(_NUMBER_TOKEN.findall(prompt)))
@@ -0,0 +1,236 @@
+import asyncio
+import email.utils
+import heapq
+import itertools
+import os
+import random
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from metrics import registry
+
+# Sustained requests per second and burst size for job submissions and for status polls
+DEFAULT_SUBMIT_RATE = float(os.environ.get("CADIA_SUBMIT_RATE", 2.0))
+DEFAULT_SUBMIT_BURST = int(os.environ.get("CADIA_SUBMIT_BURST", 10))
+DEFAULT_POLL_RATE = float(os.environ.get("CADIA_POLL_RATE", 20.0))
+DEFAULT_POLL_BURST = int(os.environ.get("CADIA_POLL_BURST", 40))
+
+# Requests allowed to wait for a token before new ones are rejected outright
+DEFAULT_MAX_QUEUE = int(os.environ.get("CADIA_ADMISSION_QUEUE", 1000))
+
+# Retries for throttled or failed API calls, with exponential backoff between them
+DEFAULT_MAX_RETRIES = int(os.environ.get("CADIA_API_MAX_RETRIES", 5))
+DEFAULT_RETRY_BASE = 1.0
+DEFAULT_RETRY_CAP = 60.0
+
+# Lower values are served first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 10
+PRIORITY_BATCH = 20
+
+# Status codes worth retrying. Submissions are not idempotent, so they are only
+# retried when the API says it did not accept the request
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+RETRY_STATUSES_UNSAFE = {429, 503}
+
+# Queue callbacks receive the caller's 1-based position while it waits
+QueueCallback = Callable[[int], None]
+
+admission_wait = registry.histogram("cadia_admission_wait_seconds", "Time spent waiting for an API token.")
+admission_queue = registry.gauge("cadia_admission_queue_depth", "Requests waiting for an API token.")
+admission_rejected = registry.counter("cadia_admission_rejected_total", "Requests rejected because the queue was full.")
+api_retries = registry.counter("cadia_api_retries_total", "API calls retried, by status code.")
+
+
+class QueueFullError(Exception):
+    """
+    Raised when more requests are waiting for the API than the queue allows.
+    """
+
+
+class TokenBucket:
+    """
+    Token bucket with a bounded priority queue of waiters. Not thread-safe: every
+    call must come from the one event loop that owns the bucket.
+    """
+
+    def __init__(self, name: str, rate: float, burst: int, max_queue: int = DEFAULT_MAX_QUEUE):
+        # A zero rate would never refill (and divide by zero when scheduling waiters)
+        if rate <= 0:
+            raise Exception(f"The {name} rate must be positive (CADIA_{name.upper()}_RATE), not {rate}")
+        if burst < 1:
+            raise Exception(f"The {name} burst must be at least 1 (CADIA_{name.upper()}_BURST), not {burst}")
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_queue = max_queue
+        self.tokens = float(burst)
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, on_queue: Optional[QueueCallback] = None) -> float:
+        """
+        Waits for a token and returns the seconds spent waiting.
+        """
+        started = time.monotonic()
+        if not self._waiters and self._take():
+            self._admit(0.0)
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            admission_rejected.inc(labels={"bucket": self.name})
+            raise QueueFullError(f"Too many requests waiting for the API ({self.name} queue is full)")
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._sequence), future, on_queue]
+        heapq.heappush(self._waiters, entry)
+        self._publish_positions()
+        self._schedule()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if not future.done() or future.cancelled():
+                self._discard(entry)
+            else:
+                # Cancelled after _dispatch granted the token: hand it to the next waiter
+                self._refund()
+            raise
+
+        waited = time.monotonic() - started
+        self._admit(waited)
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """
+        Stops handing out tokens for a while, e.g. after the API answered 429.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+        self._schedule()
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "avg_wait_s": self.total_wait / self.admitted if self.admitted else 0.0,
+            "paused_s": max(0.0, self._paused_until - time.monotonic()),
+        }
+
+    def _admit(self, waited: float) -> None:
+        self.admitted += 1
+        self.total_wait += waited
+        admission_wait.observe(waited, {"bucket": self.name})
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _take(self) -> bool:
+        self._refill()
+        if time.monotonic() < self._paused_until or self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def _refund(self) -> None:
+        self._refill()
+        self.tokens = min(self.burst, self.tokens + 1)
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+
+    def _discard(self, entry: list) -> None:
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._publish_positions()
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        released = False
+        while self._waiters and self._take():
+            _, _, future, _ = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+            released = True
+        if released:
+            self._publish_positions()
+        self._schedule()
+
+    def _schedule(self) -> None:
+        # One timer, set for when the next token (or the end of a pause) is due
+        if not self._waiters or self._timer is not None:
+            return
+        self._refill()
+        delay = max((1 - self.tokens) / self.rate, self._paused_until - time.monotonic(), 0.0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+
+    def _publish_positions(self) -> None:
+        admission_queue.set(len(self._waiters), {"bucket": self.name})
+        for position, (_, _, _, on_queue) in enumerate(sorted(self._waiters, key=lambda entry: entry[:2]), 1):
+            if on_queue:
+                try:
+                    on_queue(position)
+                except Exception:
+                    pass
+
+
+class AdmissionController:
+    """
+    Client-side admission for the Zoo API: submissions and status polls draw from
+    separate buckets, and throttled or failed calls are retried with backoff.
+    """
+
+    def __init__(self, submit_rate: float = DEFAULT_SUBMIT_RATE, submit_burst: int = DEFAULT_SUBMIT_BURST,
+                 poll_rate: float = DEFAULT_POLL_RATE, poll_burst: int = DEFAULT_POLL_BURST,
+                 max_queue: int = DEFAULT_MAX_QUEUE, max_retries: int = DEFAULT_MAX_RETRIES):
+        self.max_retries = max_retries
+        self.buckets: Dict[str, TokenBucket] = {
+            "submit": TokenBucket("submit", submit_rate, submit_burst, max_queue),
+            "poll": TokenBucket("poll", poll_rate, poll_burst, max_queue),
+        }
+
+    def bucket_for(self, method: str) -> TokenBucket:
+        # Reads are status polls; anything that creates work is a submission
+        return self.buckets["poll" if method.upper() == "GET" else "submit"]
+
+    def retry_delay(self, response: httpx.Response, method: str, attempt: int) -> Optional[float]:
+        """
+        Returns how long to wait before retrying a response, or None if it is final.
+        """
+        retryable = RETRY_STATUSES if method.upper() == "GET" else RETRY_STATUSES_UNSAFE
+        if response.status_code not in retryable or attempt >= self.max_retries:
+            return None
+        backoff = min(DEFAULT_RETRY_CAP, DEFAULT_RETRY_BASE * 2 ** attempt) * random.uniform(0.5, 1.0)
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        return max(backoff, retry_after or 0.0)
+
+    def stats(self) -> dict:
+        return {name: bucket.stats() for name, bucket in self.buckets.items()}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a Retry-After header given either as seconds or as an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,226 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from metrics import registry
+
+# Generations one user may submit per rolling QUOTA_WINDOW; recovered jobs are not counted
+JOBS_PER_HOUR = int(os.environ.get("CADIA_USER_JOBS_PER_HOUR", 60))
+
+# Generations of one user running at once; the rest wait their turn
+MAX_CONCURRENT = int(os.environ.get("CADIA_USER_MAX_CONCURRENT", 4))
+
+# Relative shares of the generation slots by signed-in user, "alice@example.com=2,bob@example.com=0.5";
+# everyone else has 1
+USER_WEIGHTS = os.environ.get("CADIA_USER_WEIGHTS", "")
+
+QUOTA_WINDOW = 3600.0
+
+# Jobs without an owner (API callers, scripts) share one bucket
+ANONYMOUS = ""
+
+# Anonymous browser sessions own their jobs as "session:<id>" (see identity.current_user),
+# but all of them are charged to ANONYMOUS: a new session ID buys no quota or share
+SESSION_PREFIX = "session:"
+
+waiting_jobs = registry.gauge("cadia_scheduler_waiting", "Jobs waiting for a generation slot.")
+quota_rejections = registry.counter("cadia_scheduler_rejections_total", "Submissions refused by the hourly quota.")
+wait_seconds = registry.histogram("cadia_scheduler_wait_seconds", "Time jobs waited for a generation slot.")
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """
+    Parses CADIA_USER_WEIGHTS: "alice@example.com=2,bob@example.com=0.5" ->
+    {"alice@example.com": 2.0, "bob@example.com": 0.5}.
+    """
+    weights = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        owner, _, weight = part.partition("=")
+        try:
+            weights[owner.strip()] = float(weight)
+        except ValueError:
+            raise Exception(f"Invalid user weight: {part.strip()}")
+        if weights[owner.strip()] <= 0:
+            raise Exception(f"User weights must be positive: {part.strip()}")
+    return weights
+
+
+def account(owner: Optional[str]) -> str:
+    """
+    Returns the account owner's quota, concurrency and weight are charged to: the
+    signed-in user, or ANONYMOUS for scripts and every anonymous browser session.
+    """
+    if not owner or owner.startswith(SESSION_PREFIX):
+        return ANONYMOUS
+    return owner
+
+
+def quota_message(status: dict, count: int = 1) -> str:
+    """
+    Explains from a status() dict why count more submissions do not fit the hourly quota.
+    """
+    remaining = max(status["limit"] - status["used"], 0)
+    if remaining:
+        return (f"This needs {count} designs, but only {remaining} of your "
+                f"{status['limit']} designs this hour are left.")
+    minutes = max(1, round((status["resets_in"] or 0) / 60))
+    return (f"You have used all {status['limit']} designs of your hourly quota; "
+            f"more become available in about {minutes} minute{'s' if minutes != 1 else ''}")
+
+
+def quota_summary(status: dict) -> str:
+    """
+    Renders a status() dict as one line for the user it belongs to.
+    """
+    parts = [
+        f"{status['used']} of {status['limit']} designs this hour",
+        f"{status['running']} of {status['max_concurrent']} generating",
+    ]
+    if status["waiting"]:
+        parts.append(f"{status['waiting']} waiting their turn")
+    if status["used"] >= status["limit"] and status["resets_in"]:
+        parts.append(f"more available in {max(1, round(status['resets_in'] / 60))} min")
+    return " · ".join(parts)
+
+
+class FairScheduler:
+    """
+    Orders waiting jobs between users with weighted fair queuing and enforces
+    per-user quotas: submissions per rolling hour (refused beyond it) and jobs
+    running at once (the rest wait). Users are accounts (see account()), so
+    anonymous sessions share one quota and share.
+
+    Start-time fair queuing: each job is tagged with a virtual start time,
+    max(virtual clock, the tag its owner's previous job ends at), and every job
+    advances its owner's tags by 1 / weight. The runnable job with the lowest tag
+    goes next, so one user's batch of 50 prompts interleaves with everyone else's
+    instead of running ahead of them, and a user returning after a quiet spell
+    gets no banked credit to burst with.
+    """
+
+    def __init__(self, jobs_per_hour: int = JOBS_PER_HOUR, max_concurrent: int = MAX_CONCURRENT,
+                 weights: Optional[Dict[str, float]] = None, window: float = QUOTA_WINDOW):
+        self.jobs_per_hour = jobs_per_hour
+        self.max_concurrent = max_concurrent
+        self.weights = parse_weights(USER_WEIGHTS) if weights is None else weights
+        self.window = window
+        self._lock = threading.Lock()
+        # owner -> FIFO of (start tag, queued at, item)
+        self._waiting: Dict[str, Deque[Tuple[float, float, Any]]] = {}
+        self._finish_tags: Dict[str, float] = {}
+        self._running: Dict[str, int] = {}
+        self._submitted: Dict[str, Deque[float]] = {}
+        self._virtual_time = 0.0
+
+    def weight(self, owner: Optional[str]) -> float:
+        return self.weights.get(account(owner), 1.0)
+
+    def admit(self, owner: Optional[str], count: int = 1) -> None:
+        """
+        Charges count submissions to owner's hourly quota, or raises an Exception
+        (charging nothing) when they do not fit.
+        """
+        owner = account(owner)
+        now = time.time()
+        with self._lock:
+            submitted = self._recent(owner, now)
+            if len(submitted) + count > self.jobs_per_hour:
+                quota_rejections.inc()
+                raise Exception(quota_message(self._status(owner, now), count))
+            submitted.extend([now] * count)
+
+    def push(self, owner: Optional[str], item: Any) -> None:
+        """
+        Adds a job to owner's queue.
+        """
+        owner = account(owner)
+        with self._lock:
+            start = max(self._virtual_time, self._finish_tags.get(owner, 0.0))
+            self._finish_tags[owner] = start + 1.0 / self.weight(owner)
+            self._waiting.setdefault(owner, deque()).append((start, time.time(), item))
+            waiting_jobs.set(self._waiting_count())
+
+    def pop(self) -> Optional[Any]:
+        """
+        Returns the next job to run and counts it as running for its owner, or None
+        when nothing is waiting or every waiting owner is at their concurrency limit.
+        """
+        with self._lock:
+            best = None
+            for owner, queue in self._waiting.items():
+                if self._running.get(owner, 0) >= self.max_concurrent:
+                    continue
+                if best is None or queue[0][0] < self._waiting[best][0][0]:
+                    best = owner
+            if best is None:
+                return None
+            start, queued_at, item = self._waiting[best].popleft()
+            if not self._waiting[best]:
+                del self._waiting[best]
+            self._virtual_time = max(self._virtual_time, start)
+            self._running[best] = self._running.get(best, 0) + 1
+            waiting_jobs.set(self._waiting_count())
+        wait_seconds.observe(time.time() - queued_at)
+        return item
+
+    def finished(self, owner: Optional[str]) -> None:
+        """
+        Frees one of owner's running slots.
+        """
+        owner = account(owner)
+        with self._lock:
+            self._running[owner] = max(self._running.get(owner, 0) - 1, 0)
+            if not self._running[owner]:
+                del self._running[owner]
+
+    def status(self, owner: Optional[str]) -> dict:
+        """
+        Returns owner's quota status: {"used", "limit", "resets_in", "running",
+        "max_concurrent", "waiting", "weight"}.
+        """
+        with self._lock:
+            return self._status(account(owner), time.time())
+
+    def overview(self) -> List[dict]:
+        """
+        Returns status() plus "owner" for every user with recent, running or waiting
+        jobs, busiest first.
+        """
+        now = time.time()
+        with self._lock:
+            owners = set(self._waiting) | set(self._running) | set(self._submitted)
+            statuses = [dict(self._status(owner, now), owner=owner) for owner in owners]
+            # Forget users with nothing left in the window
+            for status in statuses:
+                if not (status["used"] or status["running"] or status["waiting"]):
+                    self._submitted.pop(status["owner"], None)
+                    self._finish_tags.pop(status["owner"], None)
+        statuses = [status for status in statuses if status["used"] or status["running"] or status["waiting"]]
+        return sorted(statuses, key=lambda status: (-status["running"], -status["waiting"], -status["used"]))
+
+    def _recent(self, owner: str, now: float) -> Deque[float]:
+        # Caller holds the lock
+        submitted = self._submitted.setdefault(owner, deque())
+        while submitted and submitted[0] <= now - self.window:
+            submitted.popleft()
+        return submitted
+
+    def _status(self, owner: str, now: float) -> dict:
+        # Caller holds the lock
+        submitted = self._recent(owner, now)
+        return {
+            "used": len(submitted),
+            "limit": self.jobs_per_hour,
+            "resets_in": submitted[0] + self.window - now if submitted else None,
+            "running": self._running.get(owner, 0),
+            "max_concurrent": self.max_concurrent,
+            "waiting": len(self._waiting.get(owner, ())),
+            "weight": self.weight(owner),
+        }
+
+    def _waiting_count(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
@@ -0,0 +1,254 @@
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from history import DEFAULT_DATA_DIR
+from metrics import registry
+
+logger = logging.getLogger("cadia")
+
+# Scratch files for downloads being prepared (zip bundles and the like)
+DEFAULT_SCRATCH_DIR = os.environ.get("CADIA_SCRATCH_DIR", os.path.join(DEFAULT_DATA_DIR, "scratch"))
+
+# Total bytes the scratch directory may hold; beyond it, kept files are evicted
+# oldest-first and new work is refused if that is not enough
+DEFAULT_QUOTA = int(os.environ.get("CADIA_SCRATCH_QUOTA", 2 * 1024 ** 3))
+
+# Temp files older than this that no block in this process is using were left
+# behind by a crash and are removed
+DEFAULT_MAX_AGE = float(os.environ.get("CADIA_SCRATCH_MAX_AGE", 3600))
+
+# How often the janitor enforces the age and size limits
+DEFAULT_CLEANUP_INTERVAL = float(os.environ.get("CADIA_SCRATCH_CLEANUP_INTERVAL", 60))
+
+# Temp files carry this prefix; every other name is a kept file
+TEMP_PREFIX = "tmp-"
+
+scratch_bytes = registry.gauge("cadia_scratch_bytes", "Bytes in the scratch directory, by kind.")
+scratch_files = registry.gauge("cadia_scratch_files", "Files in the scratch directory, by kind.")
+scratch_quota = registry.gauge("cadia_scratch_quota_bytes", "Configured scratch directory quota.")
+scratch_evictions = registry.counter("cadia_scratch_evictions_total", "Scratch files removed, by reason.")
+scratch_rejections = registry.counter("cadia_scratch_rejections_total", "Scratch reservations refused for lack of space.")
+
+
+class ScratchSpace:
+    """
+    A directory for files that only exist while work is in progress, with lifetimes
+    that cannot leak.
+
+    file() hands out a temp path that is deleted when its block exits, however it
+    exits. keep() turns a finished temp file into a named file that lives until a
+    deadline (extended by touch()); deadlines are stored as the file's mtime, so
+    they hold across processes sharing the directory. A janitor thread removes
+    expired kept files and temp files orphaned by crashes, and every reservation
+    is checked against the quota first.
+    """
+
+    def __init__(self, directory: str = DEFAULT_SCRATCH_DIR, quota: int = DEFAULT_QUOTA,
+                 max_age: float = DEFAULT_MAX_AGE, cleanup_interval: float = DEFAULT_CLEANUP_INTERVAL):
+        self.directory = directory
+        self.quota = quota
+        self.max_age = max_age
+        self.cleanup_interval = cleanup_interval
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        # Temp files open in a block of this process, with the bytes reserved for each.
+        # They are never evicted, and count at their reservation until they outgrow it
+        self._reserved: Dict[str, int] = {}
+        self._stopped = threading.Event()
+        self._janitor_thread: Optional[threading.Thread] = None
+        scratch_quota.set(quota)
+
+    def start(self) -> "ScratchSpace":
+        """
+        Starts the janitor on a background thread.
+        """
+        self._janitor_thread = threading.Thread(target=self._janitor, name="cad-scratch-janitor", daemon=True)
+        self._janitor_thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    @contextmanager
+    def file(self, suffix: str = "", reserve: int = 0) -> Iterator[str]:
+        """
+        Yields the path of a new empty temp file, removed when the block exits.
+        reserve is the expected size: room for it is made first (or Exception raised).
+        """
+        with self._lock:
+            self._make_room(reserve)
+            fd, path = tempfile.mkstemp(dir=self.directory, prefix=TEMP_PREFIX, suffix=suffix)
+            os.close(fd)
+            self._reserved[path] = reserve
+        try:
+            yield path
+        finally:
+            with self._lock:
+                self._reserved.pop(path, None)
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def keep(self, path: str, name: str, ttl: float) -> str:
+        """
+        Moves a finished temp file (from file()) to the kept file name, replacing any
+        previous one, and keeps it for ttl seconds. Returns the new path.
+        """
+        target = self._named(name)
+        os.replace(path, target)
+        self.touch(name, ttl)
+        return target
+
+    def touch(self, name: str, ttl: float) -> Optional[str]:
+        """
+        Keeps a kept file for at least another ttl seconds. Returns its path, or None
+        if it has already been removed.
+        """
+        target = self._named(name)
+        deadline = time.time() + ttl
+        try:
+            current = os.stat(target).st_mtime
+            if current < deadline:
+                os.utime(target, (deadline, deadline))
+        except FileNotFoundError:
+            return None
+        return target
+
+    def path(self, name: str) -> Optional[str]:
+        """
+        Returns the path of a kept file that has not expired, or None.
+        """
+        target = self._named(name)
+        try:
+            return target if os.stat(target).st_mtime >= time.time() else None
+        except FileNotFoundError:
+            return None
+
+    def usage(self) -> dict:
+        """
+        Returns {"bytes", "files", "temp_bytes", "kept_bytes", "quota"} for the directory;
+        temp files being written count at their reservation.
+        """
+        entries = self._entries()
+        temp = [entry for entry in entries if entry[3]]
+        kept = [entry for entry in entries if not entry[3]]
+        usage = {
+            "bytes": sum(entry[2] for entry in entries),
+            "files": len(entries),
+            "temp_bytes": sum(entry[2] for entry in temp),
+            "kept_bytes": sum(entry[2] for entry in kept),
+            "quota": self.quota,
+        }
+        scratch_bytes.set(usage["temp_bytes"], labels={"kind": "temp"})
+        scratch_bytes.set(usage["kept_bytes"], labels={"kind": "kept"})
+        scratch_files.set(len(temp), labels={"kind": "temp"})
+        scratch_files.set(len(kept), labels={"kind": "kept"})
+        return usage
+
+    def cleanup(self) -> int:
+        """
+        Removes expired kept files and orphaned temp files, then evicts kept files
+        oldest-deadline-first while the directory is over quota. Returns how many
+        files were removed.
+        """
+        with self._lock:
+            removed = self._expire()
+            removed += self._make_room(0, strict=False)
+        self.usage()
+        return removed
+
+    def _named(self, name: str) -> str:
+        if not name or name.startswith(TEMP_PREFIX) or os.path.basename(name) != name:
+            raise Exception(f"Invalid scratch file name: {name}")
+        return os.path.join(self.directory, name)
+
+    def _entries(self) -> List[tuple]:
+        # (path, mtime, size, is_temp) for every file in the directory; a file being
+        # written in this process is as big as its reservation at least
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            size = max(stat.st_size, self._reserved.get(entry.path, 0))
+            entries.append((entry.path, stat.st_mtime, size, entry.name.startswith(TEMP_PREFIX)))
+        return entries
+
+    def _remove(self, path: str, reason: str) -> bool:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        scratch_evictions.inc(labels={"reason": reason})
+        return True
+
+    def _expire(self) -> int:
+        # Caller holds the lock
+        now = time.time()
+        removed = 0
+        for path, mtime, _, is_temp in self._entries():
+            if is_temp:
+                if path not in self._reserved and mtime < now - self.max_age:
+                    removed += self._remove(path, "orphaned")
+            elif mtime < now:
+                removed += self._remove(path, "expired")
+        return removed
+
+    def _make_room(self, reserve: int, strict: bool = True) -> int:
+        # Caller holds the lock. Evicts kept files until reserve more bytes fit; with
+        # strict, raises if they still do not. Files still being written count at
+        # their reservation, so concurrent reservations cannot overcommit the quota
+        entries = self._entries()
+        total = sum(entry[2] for entry in entries)
+        if total + reserve <= self.quota:
+            return 0
+        removed = self._expire()
+        entries = self._entries()
+        total = sum(entry[2] for entry in entries)
+        # Temp files belong to work in progress; only kept files can make room
+        in_use = sum(entry[2] for entry in entries if entry[3])
+        if not strict or in_use + reserve <= self.quota:
+            for path, _, size, is_temp in sorted(entries, key=lambda entry: entry[1]):
+                if total + reserve <= self.quota:
+                    break
+                if not is_temp and self._remove(path, "quota"):
+                    total -= size
+                    removed += 1
+        if strict and total + reserve > self.quota:
+            scratch_rejections.inc()
+            raise Exception(
+                f"Scratch space is full ({total / 1024 ** 2:,.0f} of {self.quota / 1024 ** 2:,.0f} MB in use "
+                "by downloads being prepared); try again in a few minutes"
+            )
+        return removed
+
+    def _janitor(self) -> None:
+        while not self._stopped.wait(self.cleanup_interval):
+            try:
+                removed = self.cleanup()
+                if removed:
+                    logger.info("Removed %d scratch files", removed)
+            except Exception:
+                logger.exception("Scratch cleanup failed")
+
+
+_default_scratch: Optional[ScratchSpace] = None
+_default_scratch_lock = threading.Lock()
+
+
+def get_scratch() -> ScratchSpace:
+    """
+    Returns the process-wide scratch space, starting its janitor on first use.
+    """
+    global _default_scratch
+    with _default_scratch_lock:
+        if _default_scratch is None:
+            _default_scratch = ScratchSpace().start()
+        return _default_scratch
@@ -0,0 +1,282 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from prompts import canonicalize_prompt, prompt_numbers
+
+# Prompts are compared as TF-IDF vectors of hashed character n-grams
+NGRAM_SIZE = 3
+HASH_BUCKETS = 1 << 20
+
+# Cosine similarity from which a stored design counts as near-identical
+DEFAULT_THRESHOLD = float(os.environ.get("CADIA_SIMILARITY_THRESHOLD", 0.9))
+
+# Prompts added since the last rebuild are scored by brute force; past this many the postings are rebuilt
+DEFAULT_MERGE_THRESHOLD = 2048
+
+# Query n-grams found in more than this fraction of prompts (and more than MIN_DF_CUTOFF of
+# them) only rerank candidates; looking up their postings would touch most of the index
+DEFAULT_MAX_DF = 0.05
+MIN_DF_CUTOFF = 256
+
+# Candidates reranked with every n-gram of the query
+RERANK_CANDIDATES = 64
+
+_HASH_MULTIPLIER = np.uint64(1000003)
+
+
+def ngram_counts(texts: Sequence[str], ngram: int = NGRAM_SIZE,
+                 buckets: int = HASH_BUCKETS) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Returns (text index, hashed n-gram, count) for every distinct n-gram of every
+    text, padded with a space at both ends so word boundaries count.
+    """
+    padded = [f" {text} " for text in texts]
+    lengths = np.fromiter((len(text) for text in padded), dtype=np.int64, count=len(padded))
+    codes = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    windows = len(codes) - ngram + 1
+    if windows <= 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # Rolling polynomial hash of each window, then drop windows that straddle two texts
+    hashes = np.zeros(windows, dtype=np.uint64)
+    for offset in range(ngram):
+        hashes = hashes * _HASH_MULTIPLIER + codes[offset:offset + windows]
+    hashes ^= hashes >> np.uint64(29)
+    owner = np.repeat(np.arange(len(padded)), lengths)[:windows]
+    valid = np.arange(windows) + ngram <= np.cumsum(lengths)[owner]
+
+    keys = owner[valid] * buckets + (hashes[valid] % np.uint64(buckets)).astype(np.int64)
+    keys, counts = np.unique(keys, return_counts=True)
+    return keys // buckets, keys % buckets, counts
+
+
+class PromptIndex:
+    """
+    In-memory similarity index over past prompts. Each distinct canonical prompt is
+    one document holding a reference (e.g. the job that produced it); searching
+    returns the most similar documents by cosine similarity of character n-gram
+    TF-IDF vectors, which tolerates typos, reordered words and extra phrasing.
+
+    Postings are kept sorted by n-gram, so a lookup touches only the documents
+    sharing a rare n-gram with the query; the best of those are then reranked exactly.
+    """
+
+    def __init__(self, ngram: int = NGRAM_SIZE, buckets: int = HASH_BUCKETS,
+                 merge_threshold: int = DEFAULT_MERGE_THRESHOLD, max_df: float = DEFAULT_MAX_DF):
+        self.ngram = ngram
+        self.buckets = buckets
+        self.merge_threshold = merge_threshold
+        self.max_df = max_df
+        self.prompts: List[str] = []
+        self.refs: List[Any] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._df = np.zeros(buckets, dtype=np.int32)
+        self._lock = threading.Lock()
+
+        # (document, n-gram, count) triples sorted by document, for the documents in the
+        # postings and for those added since, which are searched by brute force
+        empty = np.zeros(0, dtype=np.int64)
+        self._merged = 0
+        self._docs, self._grams, self._counts = empty, empty, empty
+        self._pending_docs, self._pending_grams, self._pending_counts = empty, empty, empty
+
+        # Postings of the merged documents, sorted by n-gram, with normalized TF-IDF weights
+        self._post_grams, self._post_docs = empty, empty
+        self._post_weights = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.prompts)
+
+    def add(self, prompt: str, ref: Any = None) -> None:
+        self.add_many([prompt], [ref])
+
+    def add_many(self, prompts: Sequence[str], refs: Sequence[Any]) -> None:
+        """
+        Adds prompts with their references. A prompt whose canonical form is already
+        indexed only replaces that document's reference.
+        """
+        with self._lock:
+            fresh: List[str] = []
+            for prompt, ref in zip(prompts, refs):
+                canonical = canonicalize_prompt(prompt)
+                doc = self._doc_ids.get(canonical)
+                if doc is not None:
+                    self.prompts[doc], self.refs[doc] = prompt, ref
+                    continue
+                self._doc_ids[canonical] = len(self.prompts)
+                self.prompts.append(prompt)
+                self.refs.append(ref)
+                fresh.append(canonical)
+            if not fresh:
+                return
+
+            docs, grams, counts = ngram_counts(fresh, self.ngram, self.buckets)
+            self._pending_docs = np.concatenate([self._pending_docs, docs + len(self.prompts) - len(fresh)])
+            self._pending_grams = np.concatenate([self._pending_grams, grams])
+            self._pending_counts = np.concatenate([self._pending_counts, counts])
+            self._df += np.bincount(grams, minlength=self.buckets).astype(np.int32)
+            if len(self.prompts) - self._merged > self.merge_threshold:
+                self._merge()
+
+    def rebuild(self) -> None:
+        """
+        Folds every document added since the last rebuild into the postings.
+        """
+        with self._lock:
+            if len(self.prompts) > self._merged:
+                self._merge()
+
+    def search(self, prompt: str, limit: int = 5, threshold: float = 0.0,
+               match_numbers: bool = False) -> List[dict]:
+        """
+        Returns up to limit entries {"score", "prompt", "ref"}, most similar first,
+        scoring at least threshold. With match_numbers, only prompts with the same
+        numbers as the query qualify; "20 mm cube" is not a near-duplicate of "25 mm cube".
+        """
+        canonical = canonicalize_prompt(prompt)
+        _, query_grams, query_counts = ngram_counts([canonical], self.ngram, self.buckets)
+        if not len(query_grams):
+            return []
+
+        with self._lock:
+            total = len(self.prompts)
+            if not total:
+                return []
+            query_weights = (1 + np.log(query_counts)) * self._idf(total, query_grams)
+            query_weights /= np.linalg.norm(query_weights)
+
+            candidates = self._candidates(query_grams, query_weights, total)
+            scores = self._rerank(candidates, query_grams, query_weights, total)
+            order = np.argsort(-scores, kind="stable")
+            prompts, refs = list(self.prompts), list(self.refs)
+
+        numbers = prompt_numbers(canonical) if match_numbers else None
+        results = []
+        for index in order:
+            score = float(scores[index])
+            if score < threshold or len(results) >= limit:
+                break
+            doc = int(candidates[index])
+            if numbers is not None and prompt_numbers(canonicalize_prompt(prompts[doc])) != numbers:
+                continue
+            results.append({"score": score, "prompt": prompts[doc], "ref": refs[doc]})
+        return results
+
+    def _idf(self, total: int, grams: np.ndarray) -> np.ndarray:
+        return np.log((total + 1) / (self._df[grams] + 1.0)) + 1
+
+    def _candidates(self, query_grams: np.ndarray, query_weights: np.ndarray, total: int) -> np.ndarray:
+        # Rare query n-grams find candidates; common ones would touch most of the index
+        rare = self._df[query_grams] <= max(MIN_DF_CUTOFF, self.max_df * total)
+        if not rare.any():
+            rare[:] = True
+        grams, weights = query_grams[rare], query_weights[rare]
+
+        starts = np.searchsorted(self._post_grams, grams, side="left")
+        lengths = np.searchsorted(self._post_grams, grams, side="right") - starts
+        positions = _ranges(starts, lengths)
+        partial = np.bincount(
+            self._post_docs[positions],
+            weights=self._post_weights[positions] * np.repeat(weights, lengths),
+            minlength=self._merged,
+        )
+        best = partial.nonzero()[0]
+        if len(best) > RERANK_CANDIDATES:
+            best = best[np.argpartition(-partial[best], RERANK_CANDIDATES)[:RERANK_CANDIDATES]]
+
+        recent = np.unique(self._pending_docs[np.isin(self._pending_grams, grams)])
+        return np.concatenate([best, recent])
+
+    def _rerank(self, candidates: np.ndarray, query_grams: np.ndarray, query_weights: np.ndarray,
+                total: int) -> np.ndarray:
+        # Exact cosine similarity of each candidate with the full query vector
+        owners, grams, counts = [], [], []
+        for docs, doc_grams, doc_counts in ((self._docs, self._grams, self._counts),
+                                            (self._pending_docs, self._pending_grams, self._pending_counts)):
+            starts = np.searchsorted(docs, candidates, side="left")
+            lengths = np.searchsorted(docs, candidates, side="right") - starts
+            positions = _ranges(starts, lengths)
+            owners.append(np.repeat(np.arange(len(candidates)), lengths))
+            grams.append(doc_grams[positions])
+            counts.append(doc_counts[positions])
+        owners, grams, counts = np.concatenate(owners), np.concatenate(grams), np.concatenate(counts)
+
+        weights = (1 + np.log(counts)) * self._idf(total, grams)
+        norms = np.sqrt(np.bincount(owners, weights=weights ** 2, minlength=len(candidates)))
+
+        # Query n-grams are sorted, so each document n-gram finds its query weight by bisection
+        slots = np.minimum(np.searchsorted(query_grams, grams), len(query_grams) - 1)
+        shared = np.where(query_grams[slots] == grams, query_weights[slots], 0.0)
+        dots = np.bincount(owners, weights=weights * shared, minlength=len(candidates))
+        return dots / np.maximum(norms, 1e-12)
+
+    def _merge(self) -> None:
+        # Fold pending documents into the postings, recomputing every weight with current IDF
+        docs = np.concatenate([self._docs, self._pending_docs])
+        grams = np.concatenate([self._grams, self._pending_grams])
+        counts = np.concatenate([self._counts, self._pending_counts])
+        total = len(self.prompts)
+
+        weights = (1 + np.log(counts)) * self._idf(total, grams)
+        weights /= np.sqrt(np.bincount(docs, weights=weights ** 2, minlength=total))[docs]
+
+        order = np.argsort(grams, kind="stable")
+        self._post_grams, self._post_docs = grams[order], docs[order]
+        self._post_weights = weights[order].astype(np.float32)
+        self._docs, self._grams, self._counts = docs, grams, counts
+        empty = np.zeros(0, dtype=np.int64)
+        self._pending_docs, self._pending_grams, self._pending_counts = empty, empty, empty
+        self._merged = total
+
+
+def _ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    # Concatenation of arange(start, start + length) for every pair, without a Python loop
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+
+
+_default_index: Optional[PromptIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_index() -> PromptIndex:
+    """
+    Returns the process-wide prompt index, built from the generation history on first use.
+    """
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            from history import get_history
+
+            index = PromptIndex()
+            jobs = get_history().completed_jobs()
+            index.add_many([job["prompt"] for job in jobs], [job["job_id"] for job in jobs])
+            index.rebuild()
+            _default_index = index
+        return _default_index
+
+
+def note_generation(prompt: str, ref: Any) -> None:
+    """
+    Adds a finished generation to the prompt index, if the index has been loaded;
+    otherwise it is read from the history when the index is first built.
+    """
+    with _default_index_lock:
+        index = _default_index
+    if index is not None:
+        index.add(prompt, ref)
+
+
+def find_similar(prompt: str, threshold: float = DEFAULT_THRESHOLD, limit: int = 3) -> List[dict]:
+    """
+    Returns stored prompts near-identical to prompt: the same numbers and a similarity
+    of at least threshold. Prompts with the same canonical form are left out, since
+    the result cache already serves those without asking.
+    """
+    canonical = canonicalize_prompt(prompt)
+    matches = get_index().search(prompt, limit=limit + 1, threshold=threshold, match_numbers=True)
+    return [match for match in matches if canonicalize_prompt(match["prompt"]) != canonical][:limit]
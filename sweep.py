@@ -0,0 +1,228 @@
+import asyncio
+import csv
+import itertools
+import os
+import re
+import string
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Dict, List, Optional, Sequence
+
+from cache import cache_key
+from events import Completed
+from generator import agenerate_cad_formats, write_file
+from journal import get_journal
+from mesh import analyze_stl
+from ratelimit import PRIORITY_BATCH
+
+# Most variants one sweep may expand to; each one is a paid generation unless already stored
+MAX_VARIANTS = int(os.environ.get("CADIA_SWEEP_MAX_VARIANTS", 100))
+
+# Generations of one sweep in flight at once
+DEFAULT_PARALLELISM = int(os.environ.get("CADIA_SWEEP_PARALLELISM", 8))
+
+# Comparison table columns filled from the STL mesh, in display order
+MESH_COLUMNS = ("triangles", "volume_mm3", "surface_area_mm2", "size_mm", "watertight")
+
+_RANGE = re.compile(r"^\s*(-?[\d.]+)\s*:\s*(-?[\d.]+)\s*(?::\s*(-?[\d.]+)\s*)?$")
+
+
+def template_fields(template: str) -> List[str]:
+    """
+    Returns the placeholder names of a prompt template in order of first use:
+    "gear with {teeth} teeth, {thickness}mm thick" -> ["teeth", "thickness"].
+    """
+    fields: List[str] = []
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError as e:
+        raise Exception(f"Invalid prompt template: {e}")
+    for _, name, _, _ in parsed:
+        if name is None:
+            continue
+        if not name.isidentifier():
+            raise Exception(f"Template placeholders must be plain names, not {{{name}}}")
+        if name not in fields:
+            fields.append(name)
+    return fields
+
+
+def _format_number(value: Decimal) -> str:
+    # 5.0 -> 5, 2.50 -> 2.5, so prompts read the way people type them
+    text = format(value.normalize(), "f")
+    return text.rstrip("0").rstrip(".") if "." in text else text
+
+
+def parse_values(spec: str) -> List[str]:
+    """
+    Expands one parameter's values: a comma-separated list ("20,24,28" or "M3,M4") or an
+    inclusive range "start:stop" / "start:stop:step" ("5:10:2.5" -> 5, 7.5, 10).
+    """
+    match = _RANGE.match(spec)
+    if not match:
+        values = [value.strip() for value in spec.split(",") if value.strip()]
+        if not values:
+            raise Exception("Every parameter needs at least one value")
+        return values
+
+    try:
+        start, stop = Decimal(match.group(1)), Decimal(match.group(2))
+        step = Decimal(match.group(3)) if match.group(3) else Decimal(1)
+    except InvalidOperation:
+        raise Exception(f"Invalid range: {spec}")
+    if step <= 0:
+        raise Exception(f"Range step must be positive: {spec}")
+    if stop < start:
+        step = -step
+    count = int((stop - start) / step) + 1
+    if count > MAX_VARIANTS:
+        raise Exception(f"Range {spec} has {count} values; the limit is {MAX_VARIANTS}")
+    return [_format_number(start + step * index) for index in range(count)]
+
+
+def expand(template: str, params: Dict[str, Sequence[str]], mode: str = "grid") -> List[dict]:
+    """
+    Expands a template into variants {"prompt", "values", "name"}. "grid" takes every
+    combination of the parameter values; "zip" pairs the i-th values of every parameter.
+    """
+    fields = template_fields(template)
+    missing = [field for field in fields if not params.get(field)]
+    if missing:
+        raise Exception(f"No values for {', '.join(missing)}")
+
+    columns = [list(params[field]) for field in fields]
+    if mode == "zip":
+        if len({len(column) for column in columns}) > 1:
+            raise Exception("Paired parameters need the same number of values each")
+        combinations = list(zip(*columns))
+    elif mode == "grid":
+        total = 1
+        for column in columns:
+            total *= len(column)
+        if total > MAX_VARIANTS:
+            raise Exception(f"The sweep has {total} variants; the limit is {MAX_VARIANTS}")
+        combinations = list(itertools.product(*columns))
+    else:
+        raise Exception(f"Unknown sweep mode: {mode}")
+
+    variants = []
+    for combination in combinations[:MAX_VARIANTS]:
+        values = dict(zip(fields, combination))
+        variants.append({"prompt": template.format(**values), "values": values, "name": variant_name(values)})
+    return variants
+
+
+def variant_name(values: Dict[str, str]) -> str:
+    """
+    Returns a file-name-safe stem for a variant: {"teeth": "20", "thickness": "5"} -> teeth-20_thickness-5.
+    """
+    parts = [f"{name}-{value}" for name, value in values.items()]
+    return re.sub(r"[^\w.-]+", "-", "_".join(parts)).strip("-") or "variant"
+
+
+def mesh_columns(analysis: Optional[dict]) -> dict:
+    """
+    Returns the comparison table's mesh columns from an analyze_stl result.
+    """
+    if not analysis:
+        return {column: None for column in MESH_COLUMNS}
+    return {
+        "triangles": analysis["triangles"],
+        "volume_mm3": round(analysis["volume"], 1),
+        "surface_area_mm2": round(analysis["surface_area"], 1),
+        "size_mm": " x ".join(f"{extent:.1f}" for extent in analysis["size"]),
+        "watertight": analysis["watertight"],
+    }
+
+
+async def arun_sweep(variants: List[dict], formats: List[str], out_dir: str,
+                     parallelism: int = DEFAULT_PARALLELISM, use_cache: bool = True,
+                     on_row: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    Generates every variant, at most parallelism at once, writes its files to out_dir
+    and returns one comparison row per variant in sweep order. Variants generated
+    before come from the result cache. on_row receives each row as it finishes.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    limiter = asyncio.Semaphore(parallelism)
+
+    async def one(variant: dict) -> dict:
+        row = dict(variant["values"], variant=variant["name"], status="failed", source=None, seconds=None)
+        sources: List[str] = []
+
+        def on_event(event) -> None:
+            if isinstance(event, Completed):
+                sources.append(event.source)
+
+        async with limiter:
+            started = time.monotonic()
+            try:
+                results = await agenerate_cad_formats(variant["prompt"], formats, use_cache=use_cache,
+                                                      on_event=on_event, priority=PRIORITY_BATCH)
+                for ext, payload in results.items():
+                    await asyncio.to_thread(write_file, os.path.join(out_dir, f"{variant['name']}.{ext}"), payload)
+                # Written out, so --resume and reattaching sessions leave these jobs alone
+                await asyncio.to_thread(get_journal().mark_delivered,
+                                        [cache_key(variant["prompt"], ext) for ext in results])
+                analysis = None
+                if "stl" in results:
+                    try:
+                        analysis = await asyncio.to_thread(analyze_stl, results["stl"])
+                    except ValueError:
+                        pass
+                row.update(status="completed", source=sources[-1] if sources else None, **mesh_columns(analysis))
+            except Exception as e:
+                row["error"] = str(e)
+            row["seconds"] = round(time.monotonic() - started, 1)
+        if on_row:
+            on_row(row)
+        return row
+
+    return list(await asyncio.gather(*(one(variant) for variant in variants)))
+
+
+def table_columns(rows: List[dict]) -> List[str]:
+    """
+    Returns the columns of a set of comparison rows: every key in first-seen order,
+    without those empty in every row.
+    """
+    columns: List[str] = []
+    for row in rows:
+        columns += [column for column in row if column not in columns]
+    return [column for column in columns if any(row.get(column) is not None for row in rows)]
+
+
+def format_table(rows: List[dict]) -> str:
+    """
+    Renders comparison rows as a plain-text table for the terminal.
+    """
+    columns = [column for column in table_columns(rows) if column != "variant"]
+    cells = [["" if row.get(column) is None else str(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[index]) for line in cells]) for index, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    lines += ["  ".join(cell.ljust(width) for cell, width in zip(line, widths)) for line in cells]
+    return "\n".join(lines)
+
+
+def write_table(rows: List[dict], path: str) -> None:
+    """
+    Writes comparison rows to a CSV file.
+    """
+    with open(path, "w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=table_columns(rows), extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def run_sweep(template: str, params: Dict[str, Sequence[str]], formats: List[str], out_dir: str,
+              mode: str = "grid", parallelism: int = DEFAULT_PARALLELISM, use_cache: bool = True,
+              on_row: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """
+    Synchronous entry point for the CLI sweep mode. The comparison table is also
+    written to out_dir/sweep.csv.
+    """
+    variants = expand(template, params, mode)
+    rows = asyncio.run(arun_sweep(variants, formats, out_dir, parallelism, use_cache, on_row))
+    write_table(rows, os.path.join(out_dir, "sweep.csv"))
+    return rows
@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The modules read their configuration from the environment on import, so the
+# suite points them at a scratch data directory and the mock API before any loads
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+WORK_DIR = tempfile.mkdtemp(prefix="cadia-tests-")
+os.environ.update(
+    CADIA_DATA_DIR=os.path.join(WORK_DIR, "data"),
+    CADIA_CACHE_DIR=os.path.join(WORK_DIR, "cache"),
+    CADIA_USER="tester",
+    CADIA_POLL_INITIAL="0.1",
+    CADIA_POLL_MAX="0.2",
+    ZOO_API_TOKEN="mock",
+)
+
+from mock_server import MockZooServer  # noqa: E402
+
+_server = MockZooServer(latency_median=0.3, latency_sigma=0.05, seed=1).start()
+os.environ["ZOO_HOST"] = _server.url
+
+
+@pytest.fixture
+def zoo_server():
+    """
+    The mock text-to-CAD API every test client talks to, with its request counts reset.
+    """
+    _server.reset_counts()
+    return _server
@@ -0,0 +1,125 @@
+import io
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zipfile
+
+import pytest
+
+from artifact_server import ArtifactServer, parse_range
+from history import HistoryStore
+from scratch import ScratchSpace
+
+DATA = bytes(range(256)) * 64
+
+
+@pytest.fixture
+def server(tmp_path):
+    history = HistoryStore(str(tmp_path / "data"))
+    server = ArtifactServer(0, host="127.0.0.1", history=history, secret=b"test-secret",
+                            scratch=ScratchSpace(str(tmp_path / "scratch"))).start()
+    server.digest = history.put_blob(DATA)
+    yield server
+    server.stop()
+
+
+def fetch(url, **headers):
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as error:
+        return error.code, dict(error.headers), error.read()
+
+
+def wait_for(condition, timeout=5.0):
+    # Download callbacks run on the server thread after the last byte is sent
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 19)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    # Multiple ranges and unknown lengths are answered with the whole body
+    assert parse_range("bytes=0-1,5-6", 100) is None
+    assert parse_range("bytes=0-1", None) is None
+    for header in ("bytes=100-", "bytes=-0", "bytes=20-10"):
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
+
+
+def test_signed_link_downloads_the_blob(server):
+    downloaded = []
+    server.on_download(downloaded.append)
+    status, headers, body = fetch(server.blob_link(server.digest, "part.step", size=len(DATA), ref="job-1"))
+    assert status == 200 and body == DATA
+    assert 'filename="part.step"' in headers["Content-Disposition"]
+    assert headers["Accept-Ranges"] == "bytes"
+    assert wait_for(lambda: downloaded == ["job-1"])
+
+
+def test_range_request_resumes_a_download(server):
+    downloaded = []
+    server.on_download(downloaded.append)
+    link = server.blob_link(server.digest, "part.step", size=len(DATA), ref="job-1")
+    status, headers, body = fetch(link, Range="bytes=100-199")
+    assert status == 206 and body == DATA[100:200]
+    assert headers["Content-Range"] == f"bytes 100-199/{len(DATA)}"
+    status, _, body = fetch(link, Range=f"bytes={len(DATA) - 10}-")
+    assert status == 206 and body == DATA[-10:]
+    # Only the request that reaches the end counts as a finished download
+    assert wait_for(lambda: downloaded) and downloaded == ["job-1"]
+
+
+def test_unsatisfiable_range_is_refused(server):
+    status, headers, _ = fetch(server.blob_link(server.digest, "part.step", size=len(DATA)),
+                               Range=f"bytes={len(DATA)}-")
+    assert status == 416 and headers["Content-Range"] == f"bytes */{len(DATA)}"
+
+
+def test_stale_if_range_gets_the_whole_file(server):
+    status, _, body = fetch(server.blob_link(server.digest, "part.step", size=len(DATA)),
+                            Range="bytes=0-9", **{"If-Range": '"something-else"'})
+    assert status == 200 and body == DATA
+
+
+def test_tampered_links_are_forbidden(server):
+    link = server.blob_link(server.digest, "part.step", size=len(DATA))
+    assert fetch(link.replace("part.step", "other.step"))[0] == 403
+    assert fetch(link.replace("size=", "size=1"))[0] == 403
+    assert fetch(link.replace("sig=", "sig=0"))[0] == 403
+    other = ArtifactServer(server.port, history=server.history, secret=b"another-secret", scratch=server.scratch)
+    assert fetch(other.blob_link(server.digest, "part.step"))[0] == 403
+
+
+def test_expired_and_unknown_links(server):
+    server.link_ttl = -10
+    assert fetch(server.blob_link(server.digest, "part.step"))[0] == 410
+    server.link_ttl = 60
+    assert fetch(server.blob_link("0" * 64, "part.step"))[0] == 404
+    assert fetch(f"{server.url}/other/{server.digest}/part.step")[0] == 404
+
+
+def test_head_sends_no_body(server):
+    request = urllib.request.Request(server.blob_link(server.digest, "part.step", size=len(DATA)), method="HEAD")
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200 and response.read() == b""
+        assert response.headers["Content-Length"] == str(len(DATA))
+
+
+def test_bundle_link_serves_a_spooled_zip(server):
+    link = server.bundle_link("sweep-1", "sweep.zip", [("a.step", DATA), ("b.txt", b"notes")])
+    status, headers, body = fetch(link)
+    assert status == 200 and headers["Content-Type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(body)) as bundle:
+        assert bundle.read("a.step") == DATA and bundle.read("b.txt") == b"notes"
+    # The same key reuses the spooled file
+    assert urllib.parse.urlsplit(server.bundle_link("sweep-1", "sweep.zip", [])).path == \
+        urllib.parse.urlsplit(link).path
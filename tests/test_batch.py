@@ -0,0 +1,50 @@
+import asyncio
+import uuid
+
+import batch
+from batch import arun_batch, load_manifest
+from cache import cache_key, get_cache
+
+
+def test_rows_with_one_prompt_share_a_job(zoo_server, tmp_path):
+    bolt, nut = f"a batch bolt {uuid.uuid4().hex[:8]}", f"a batch nut {uuid.uuid4().hex[:8]}"
+    rows = [{"prompt": bolt, "output": "a.step"}, {"prompt": bolt, "output": "b.step"},
+            {"prompt": nut, "output": "c.stl"}]
+    summary = asyncio.run(arun_batch(rows, str(tmp_path)))
+    assert summary["completed"] == 3
+    assert zoo_server.counts["submit"] == 2
+    assert (tmp_path / "a.step").read_bytes() == (tmp_path / "b.step").read_bytes()
+    # Every output the job returned is cached, not only the one a row asked for
+    assert get_cache().get(cache_key(bolt, "stl")) is not None
+
+
+def test_completed_rows_are_skipped_on_rerun(zoo_server, tmp_path):
+    rows = [{"prompt": f"a batch gear {uuid.uuid4().hex[:8]}", "output": "gear.step"}]
+    asyncio.run(arun_batch(rows, str(tmp_path)))
+    assert asyncio.run(arun_batch(rows, str(tmp_path)))["skipped"] == 1
+    assert zoo_server.counts["submit"] == 1
+    assert load_manifest(str(tmp_path / "manifest.jsonl"))
+
+
+def test_parallelism_bounds_jobs_in_flight(zoo_server, tmp_path, monkeypatch):
+    in_flight, peak = 0, 0
+    submit, complete = batch.aresume_or_submit, batch.await_completion
+
+    async def counted_submit(*args, **kwargs):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        return await submit(*args, **kwargs)
+
+    async def counted_completion(*args, **kwargs):
+        nonlocal in_flight
+        try:
+            return await complete(*args, **kwargs)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(batch, "aresume_or_submit", counted_submit)
+    monkeypatch.setattr(batch, "await_completion", counted_completion)
+    rows = [{"prompt": f"a batch washer {uuid.uuid4().hex[:8]}", "output": f"{index}.step"} for index in range(3)]
+    assert asyncio.run(arun_batch(rows, str(tmp_path), parallelism=2))["completed"] == 3
+    assert peak == 2
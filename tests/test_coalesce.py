@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from coalesce import InFlightRegistry
+
+
+def test_concurrent_callers_share_one_flight():
+    registry = InFlightRegistry()
+    calls = []
+    joined = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"model"
+
+    async def main():
+        return await asyncio.gather(*(registry.run("key", produce, on_join=lambda: joined.append(1))
+                                      for _ in range(5)))
+
+    assert asyncio.run(main()) == [b"model"] * 5
+    assert len(calls) == 1 and len(joined) == 4
+    assert registry.stats() == {"in_flight": 0, "leaders": 1, "coalesced": 4}
+
+
+def test_failure_reaches_every_caller():
+    registry = InFlightRegistry()
+
+    async def produce():
+        await asyncio.sleep(0.05)
+        raise Exception("generation failed")
+
+    async def main():
+        return await asyncio.gather(*(registry.run("key", produce) for _ in range(3)), return_exceptions=True)
+
+    assert [str(result) for result in asyncio.run(main())] == ["generation failed"] * 3
+
+
+def test_cancelled_follower_leaves_the_flight_running():
+    registry = InFlightRegistry()
+
+    async def produce():
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(registry.run("key", produce))
+        await asyncio.sleep(0)
+        quitter = asyncio.ensure_future(registry.run("key", produce))
+        stayer = asyncio.ensure_future(registry.run("key", produce))
+        await asyncio.sleep(0.02)
+        quitter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await quitter
+        return await leader, await stayer
+
+    assert asyncio.run(main()) == ("done", "done")
+
+
+def test_flights_are_shared_across_event_loops():
+    registry = InFlightRegistry()
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.1)
+        return "done"
+
+    async def follow():
+        await asyncio.sleep(0.02)
+        return await asyncio.to_thread(asyncio.run, registry.run("key", produce))
+
+    async def main():
+        return await asyncio.gather(registry.run("key", produce), follow())
+
+    assert asyncio.run(main()) == ["done", "done"] and len(calls) == 1
+
+
+def test_finished_flight_is_not_reused():
+    registry = InFlightRegistry()
+    results = iter(["first", "second"])
+
+    async def produce():
+        return next(results)
+
+    assert asyncio.run(registry.run("key", produce)) == "first"
+    assert asyncio.run(registry.run("key", produce)) == "second"
@@ -0,0 +1,29 @@
+from identity import SessionSigner, load_secret
+
+
+def test_issued_tokens_verify():
+    signer = SessionSigner(secret=b"secret")
+    token = signer.issue()
+    session_id = signer.verify(token)
+    assert session_id and token.startswith(session_id + ".")
+    assert signer.issue() != token
+
+
+def test_chosen_or_forged_ids_are_rejected():
+    signer = SessionSigner(secret=b"secret")
+    session_id = signer.verify(signer.issue())
+    assert signer.verify(session_id) is None
+    assert signer.verify(f"{session_id}.{'0' * 32}") is None
+    assert signer.verify(SessionSigner(secret=b"other").issue()) is None
+    assert signer.verify("") is None and signer.verify(None) is None
+    assert signer.verify(f"{session_id}.{'é' * 32}") is None
+
+
+def test_secret_is_generated_once_and_shared(tmp_path, monkeypatch):
+    monkeypatch.delenv("CADIA_SESSION_SECRET", raising=False)
+    first = load_secret(str(tmp_path), "session_secret", "CADIA_SESSION_SECRET")
+    assert load_secret(str(tmp_path), "session_secret", "CADIA_SESSION_SECRET") == first
+    token = SessionSigner(directory=str(tmp_path)).issue()
+    assert SessionSigner(directory=str(tmp_path)).verify(token)
+    monkeypatch.setenv("CADIA_SESSION_SECRET", "configured")
+    assert load_secret(str(tmp_path), "session_secret", "CADIA_SESSION_SECRET") == b"configured"
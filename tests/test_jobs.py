@@ -0,0 +1,61 @@
+import asyncio
+import time
+import uuid
+
+import pytest
+
+import jobs
+from cache import cache_key
+from jobs import Job, JobManager, QueuedJobManager, run_job
+from journal import get_journal
+from scheduler import FairScheduler
+from workqueue import WorkQueue
+
+REQUESTS = [{"prompt": f"a jobs gear with {teeth} teeth", "formats": ["step"]} for teeth in (20, 24, 28)]
+
+
+def test_sweep_is_queued_whole_or_not_at_all(tmp_path):
+    manager = QueuedJobManager(queue=WorkQueue(str(tmp_path / "queue.sqlite3")), jobs_per_hour=5)
+    job_ids = manager.submit_many(REQUESTS, owner="ann")
+    assert [job.prompt for job in manager.jobs(job_ids)] == [request["prompt"] for request in REQUESTS]
+    with pytest.raises(Exception, match="only 2 of your 5"):
+        manager.submit_many(REQUESTS, owner="ann")
+    assert manager.quota("ann")["used"] == 3 and manager.quota("ann")["waiting"] == 3
+    assert manager.reattach("ann") == job_ids
+    # A new anonymous session is charged to the same account as the last one
+    manager.submit_many(REQUESTS, owner="session:a")
+    with pytest.raises(Exception, match="only 2 of your 5"):
+        manager.submit_many(REQUESTS, owner="session:b")
+    assert manager.quota("session:b")["used"] == 3 and manager.reattach("session:b") == []
+
+
+def test_in_process_manager_charges_the_sweep_up_front():
+    manager = JobManager(scheduler=FairScheduler(jobs_per_hour=2, weights={}))
+    with pytest.raises(Exception, match="only 2 of your 2"):
+        manager.submit_many(REQUESTS, owner="ann")
+    assert manager.quota("ann")["used"] == 0 and manager.stats()["queued"] == 0
+
+
+def test_reattach_reuses_jobs_already_recovering(zoo_server):
+    owner = f"reattach-{uuid.uuid4().hex[:8]}"
+    prompt = f"a {owner} hinge"
+    get_journal().record_submitted("gone", cache_key(prompt, "step"), prompt, "step", owner)
+    manager = JobManager(scheduler=FairScheduler(weights={}))
+    first = manager.reattach(owner)
+    # A second tab, or a reload before the recovered job is downloaded
+    assert manager.reattach(owner) == first and len(first) == 1
+    counts = manager.stats()
+    assert sum(counts[status] for status in ("queued", "running", "completed", "failed")) == 1
+
+
+
+def test_failed_preview_keeps_the_mesh_analysis(zoo_server, monkeypatch):
+    def broken_preview(stl):
+        raise ValueError("cannot decimate")
+
+    monkeypatch.setattr(jobs, "build_preview", broken_preview)
+    job = Job(f"a jobs bracket {uuid.uuid4().hex[:8]}", ["stl"], "bracket", True, "ann")
+    job.started_at = time.time()
+    asyncio.run(run_job(job))
+    assert job.analysis and job.analysis["triangles"] > 0
+    assert job.preview is None and job.progress == 1.0
@@ -0,0 +1,77 @@
+import asyncio
+import os
+import uuid
+
+import generator
+from cache import cache_key
+from journal import JobJournal, get_journal
+
+
+def test_unfinished_lists_running_and_undelivered_jobs(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record_submitted("r1", "k1", "a bolt", "step", owner="ann")
+    journal.record_submitted("r2", "k2", "a nut", "step", owner="ann")
+    journal.record_submitted("r3", "k3", "a gear", "step", owner="ann")
+    journal.mark("r2", "completed")
+    journal.mark("r3", "failed", "boom")
+    assert [entry["remote_id"] for entry in journal.unfinished("ann")] == ["r2", "r1"]
+    assert journal.find("k1")["remote_id"] == "r1"
+    assert journal.find("k2") is None
+    assert journal.find("k2", ("completed",))["remote_id"] == "r2"
+
+
+def test_newest_job_per_key_wins(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record_submitted("old", "k", "a bolt", "step", owner="ann")
+    journal.record_submitted("new", "k", "a bolt", "step", owner="ann")
+    assert [entry["remote_id"] for entry in journal.unfinished("ann")] == ["new"]
+
+
+def test_delivered_is_scoped_to_the_owner(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record_submitted("mine", "k", "a bolt", "step", owner="ann")
+    journal.record_submitted("theirs", "k", "a bolt", "step", owner="bob")
+    journal.mark("mine", "completed")
+    journal.mark("theirs", "completed")
+    journal.mark_delivered(["k"], "ann")
+    assert journal.unfinished("ann") == []
+    assert [entry["remote_id"] for entry in journal.unfinished("bob")] == ["theirs"]
+
+
+def test_jobs_past_max_age_are_not_reattached(tmp_path):
+    journal = JobJournal(str(tmp_path), max_age=-1)
+    journal.record_submitted("r1", "k1", "a bolt", "step", owner="ann")
+    assert journal.unfinished("ann") == [] and journal.find("k1") is None
+
+
+def test_resume_reattaches_instead_of_paying_again(zoo_server, tmp_path):
+    owner = f"resume-{uuid.uuid4().hex[:8]}"
+    prompt = f"a {owner} bracket"
+
+    async def interrupted():
+        # A run that submitted and journaled its job, then died before polling it
+        client = generator.get_client()
+        result = await generator.asubmit(client, prompt, "step")
+        await asyncio.to_thread(get_journal().record_submitted, str(result.id),
+                                cache_key(prompt, "step"), prompt, "step", owner)
+
+    asyncio.run(interrupted())
+    assert [entry["status"] for entry in get_journal().unfinished(owner)] == ["submitted"]
+
+    written = asyncio.run(generator.aresume_unfinished(str(tmp_path), owner=owner))
+    assert len(written) == 1 and os.path.getsize(written[0]) > 0
+    assert zoo_server.counts["submit"] == 1
+    # Written to disk, so it is delivered and nothing is left to resume
+    assert get_journal().unfinished(owner) == []
+    assert asyncio.run(generator.aresume_unfinished(str(tmp_path), owner=owner)) == []
+
+
+def test_cached_but_undelivered_output_is_resumed_from_the_cache(zoo_server, tmp_path):
+    owner = f"resume-{uuid.uuid4().hex[:8]}"
+    prompt = f"a {owner} flange"
+    asyncio.run(generator.agenerate_cad_formats(prompt, ["step"], owner=owner))
+    assert [entry["status"] for entry in get_journal().unfinished(owner)] == ["completed"]
+
+    written = asyncio.run(generator.aresume_unfinished(str(tmp_path), owner=owner))
+    assert len(written) == 1 and zoo_server.counts["submit"] == 1
+    assert get_journal().unfinished(owner) == []
@@ -0,0 +1,41 @@
+import asyncio
+import concurrent.futures
+import time
+
+import pytest
+
+import generator
+from poller import JobPoller
+
+
+def submit(prompt):
+    async def main():
+        return await generator.asubmit(generator.get_client(), prompt, "step")
+    return asyncio.run(main())
+
+
+def test_callers_of_one_job_share_polls_but_not_futures(zoo_server):
+    poller = JobPoller(initial_interval=0.05, max_interval=0.1)
+    result = submit("a poller bolt")
+    updates = []
+    first = poller.track(generator.get_client(), result)
+    second = poller.track(generator.get_client(), result, on_update=lambda job, elapsed: updates.append(elapsed))
+    assert first is not second and poller.stats()["active_jobs"] == 1
+
+    # One caller giving up leaves the other waiting on the same poll stream
+    first.cancel()
+    finished = second.result(timeout=10)
+    assert str(finished.id) == str(result.id) and finished.completed_at is not None
+    assert updates and poller.stats()["active_jobs"] == 0
+
+
+def test_job_nobody_waits_for_stops_being_polled(zoo_server):
+    poller = JobPoller(initial_interval=0.05, max_interval=0.1)
+    waiter = poller.track(generator.get_client(), submit("a poller nut"))
+    waiter.cancel()
+    assert poller.stats()["active_jobs"] == 0
+    with pytest.raises(concurrent.futures.CancelledError):
+        waiter.result()
+    polls = poller.stats()["polls_issued"]
+    time.sleep(0.3)
+    assert poller.stats()["polls_issued"] == polls
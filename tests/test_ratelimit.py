@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+from ratelimit import TokenBucket, parse_retry_after
+
+
+def test_bucket_rejects_settings_that_never_refill():
+    with pytest.raises(Exception, match="CADIA_SUBMIT_RATE"):
+        TokenBucket("submit", rate=0, burst=5)
+    with pytest.raises(Exception, match="CADIA_SUBMIT_BURST"):
+        TokenBucket("submit", rate=1, burst=0)
+
+
+def test_burst_is_admitted_at_once_then_paced():
+    async def main():
+        bucket = TokenBucket("poll", rate=20, burst=2)
+        waits = [await bucket.acquire() for _ in range(3)]
+        return bucket, waits
+
+    bucket, waits = asyncio.run(main())
+    assert waits[:2] == [0.0, 0.0] and waits[2] > 0
+    assert bucket.admitted == 3
+
+
+def test_token_of_a_cancelled_waiter_goes_to_the_next():
+    async def main():
+        bucket = TokenBucket("submit", rate=0.01, burst=1)
+        await bucket.acquire()
+        first = asyncio.ensure_future(bucket.acquire())
+        second = asyncio.ensure_future(bucket.acquire())
+        await asyncio.sleep(0)
+        # The first waiter is granted a token but cancelled before it resumes
+        bucket.tokens = 1.0
+        bucket._dispatch()
+        first.cancel()
+        return await asyncio.wait_for(second, 1), bucket
+
+    waited, bucket = asyncio.run(main())
+    assert waited < 1 and bucket.admitted == 2 and bucket.stats()["queued"] == 0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(None) is None
@@ -0,0 +1,82 @@
+import pytest
+
+from scheduler import ANONYMOUS, FairScheduler, account, parse_weights, quota_message
+
+
+def drain(scheduler):
+    order = []
+    while True:
+        item = scheduler.pop()
+        if item is None:
+            return order
+        order.append(item)
+        scheduler.finished(item[0])
+
+
+def test_batches_interleave_between_users():
+    scheduler = FairScheduler(max_concurrent=10, weights={})
+    for index in range(3):
+        scheduler.push("a", ("a", index))
+    scheduler.push("b", ("b", 0))
+    scheduler.push("b", ("b", 1))
+    assert drain(scheduler) == [("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2)]
+
+
+def test_weights_set_each_users_share():
+    scheduler = FairScheduler(max_concurrent=10, weights={"a": 2.0})
+    for index in range(4):
+        scheduler.push("a", ("a", index))
+        scheduler.push("b", ("b", index))
+    order = [owner for owner, _ in drain(scheduler)[:6]]
+    assert order.count("a") == 4 and order.count("b") == 2
+
+
+def test_concurrency_limit_holds_jobs_back():
+    scheduler = FairScheduler(max_concurrent=2, weights={})
+    for index in range(3):
+        scheduler.push("a", index)
+    assert [scheduler.pop(), scheduler.pop(), scheduler.pop()] == [0, 1, None]
+    assert scheduler.status("a")["running"] == 2 and scheduler.status("a")["waiting"] == 1
+    scheduler.finished("a")
+    assert scheduler.pop() == 2
+
+
+def test_admit_charges_the_whole_count_or_nothing():
+    scheduler = FairScheduler(jobs_per_hour=5, weights={})
+    scheduler.admit("a", 3)
+    with pytest.raises(Exception, match="only 2 of your 5"):
+        scheduler.admit("a", 3)
+    assert scheduler.status("a")["used"] == 3
+    scheduler.admit("a", 2)
+    with pytest.raises(Exception, match="used all 5"):
+        scheduler.admit("a")
+    # Other users have their own quota
+    scheduler.admit("b", 5)
+
+
+def test_anonymous_sessions_share_one_quota():
+    scheduler = FairScheduler(jobs_per_hour=3, weights={})
+    scheduler.admit("session:a", 2)
+    scheduler.admit(None)
+    with pytest.raises(Exception, match="used all 3"):
+        scheduler.admit("session:b")
+    assert account("session:b") == account(None) == ANONYMOUS and account("ann") == "ann"
+
+
+def test_quota_window_expires_submissions():
+    scheduler = FairScheduler(jobs_per_hour=1, weights={}, window=0.0)
+    scheduler.admit("a")
+    scheduler.admit("a")
+
+
+def test_quota_message_names_the_wait():
+    status = {"used": 5, "limit": 5, "resets_in": 90}
+    assert quota_message(status) == ("You have used all 5 designs of your hourly quota; "
+                                     "more become available in about 2 minutes")
+
+
+def test_parse_weights():
+    assert parse_weights("ann@example.com=3, bob=0.5") == {"ann@example.com": 3.0, "bob": 0.5}
+    assert parse_weights("") == {}
+    with pytest.raises(Exception, match="must be positive"):
+        parse_weights("bob=0")
@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+from scratch import TEMP_PREFIX, ScratchSpace
+
+
+def write(path, size):
+    with open(path, "wb") as handle:
+        handle.write(b"x" * size)
+
+
+def test_temp_file_is_removed_however_the_block_exits(tmp_path):
+    scratch = ScratchSpace(str(tmp_path))
+    with pytest.raises(RuntimeError):
+        with scratch.file(suffix=".zip") as path:
+            write(path, 10)
+            raise RuntimeError("interrupted")
+    assert not os.path.exists(path)
+
+
+def test_reservations_count_against_the_quota(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota=1000)
+    with scratch.file(reserve=400), scratch.file(reserve=400):
+        # Both files are still empty, but 800 bytes are promised
+        assert scratch.usage()["temp_bytes"] == 800
+        with pytest.raises(Exception, match="Scratch space is full"):
+            with scratch.file(reserve=400):
+                pass
+    with scratch.file(reserve=1000):
+        pass
+
+
+def test_kept_files_are_evicted_oldest_deadline_first(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota=1000)
+    for name, ttl in (("soon", 60), ("later", 600)):
+        with scratch.file() as path:
+            write(path, 400)
+            scratch.keep(path, name, ttl)
+    with scratch.file(reserve=400):
+        assert scratch.path("soon") is None
+        assert scratch.path("later") is not None
+
+
+def test_work_in_progress_is_never_evicted(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), quota=1000)
+    with scratch.file(reserve=800):
+        with pytest.raises(Exception, match="Scratch space is full"):
+            with scratch.file(reserve=400):
+                pass
+
+
+def test_touch_extends_a_kept_file(tmp_path):
+    scratch = ScratchSpace(str(tmp_path))
+    with scratch.file() as path:
+        scratch.keep(path, "bundle", -1)
+    assert scratch.path("bundle") is None
+    assert scratch.touch("bundle", 60) is not None
+    assert scratch.path("bundle") is not None
+    assert scratch.touch("missing", 60) is None
+
+
+def test_cleanup_removes_expired_and_orphaned_files(tmp_path):
+    scratch = ScratchSpace(str(tmp_path), max_age=60)
+    with scratch.file() as path:
+        scratch.keep(path, "expired", -1)
+    orphan = tmp_path / f"{TEMP_PREFIX}crashed"
+    write(orphan, 10)
+    os.utime(orphan, (time.time() - 120, time.time() - 120))
+    with scratch.file() as live:
+        os.utime(live, (time.time() - 120, time.time() - 120))
+        assert scratch.cleanup() == 2
+        assert os.path.exists(live)
+    assert os.listdir(tmp_path) == []
+
+
+def test_kept_names_cannot_escape_the_directory(tmp_path):
+    scratch = ScratchSpace(str(tmp_path))
+    for name in ("../outside", f"{TEMP_PREFIX}x", ""):
+        with pytest.raises(Exception, match="Invalid scratch file name"):
+            scratch.path(name)
@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+from workqueue import RedisWorkQueue, WorkQueue
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def queue(request, tmp_path, monkeypatch):
+    """
+    An empty work queue of each kind; the Redis one runs on fakeredis (requirements-dev.txt).
+    """
+    if request.param == "sqlite":
+        return WorkQueue(str(tmp_path / "queue.sqlite3"), max_attempts=2)
+    import fakeredis
+    import redis
+
+    server = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis.Redis, "from_url", staticmethod(lambda url: server))
+    return RedisWorkQueue("redis://test", max_attempts=2)
+
+
+def add(queue, *prompts, owner="a", priority=0):
+    return [queue.enqueue(prompt, ["step"], owner=owner, priority=priority) for prompt in prompts]
+
+
+def lease_all(queue, **limits):
+    prompts = []
+    while True:
+        task = queue.lease("worker", 60, **limits)
+        if task is None:
+            return prompts
+        prompts.append(task["prompt"])
+
+
+def test_tasks_lease_by_priority_then_age(queue):
+    add(queue, "first", "second")
+    add(queue, "urgent", priority=-1)
+    task = queue.lease("worker", 60)
+    assert task["prompt"] == "urgent" and task["status"] == "leased" and task["attempts"] == 1
+    assert lease_all(queue) == ["first", "second"]
+
+
+def test_expired_lease_is_requeued(queue):
+    task_id, = add(queue, "bolt")
+    assert queue.lease("crashed", -1)["id"] == task_id
+    task = queue.lease("rescuer", 60)
+    assert task["id"] == task_id and task["attempts"] == 2 and task["worker"] == "rescuer"
+    # The first worker's lease is gone: its late updates are refused
+    assert not queue.heartbeat(task_id, "crashed", 60, progress=0.5)
+    assert not queue.complete(task_id, "crashed")
+    assert queue.complete(task_id, "rescuer", timings={"poll": 1.0})
+    assert queue.get(task_id)["status"] == "completed"
+
+
+def test_task_fails_after_max_attempts(queue):
+    task_id, = add(queue, "bolt")
+    queue.lease("one", -1)
+    queue.lease("two", -1)
+    assert queue.lease("three", 60) is None
+    task = queue.get(task_id)
+    assert task["status"] == "failed" and "Abandoned by 2 workers" in task["error"]
+
+
+def test_released_task_keeps_its_attempts(queue):
+    task_id, = add(queue, "bolt")
+    queue.lease("worker", 60, max_per_owner=1)
+    assert not queue.release(task_id, "someone-else")
+    assert queue.release(task_id, "worker")
+    assert queue.get(task_id)["status"] == "queued" and queue.stats()["queued"] == 1
+    # The released lease no longer counts against the owner's limit
+    task = queue.lease("other", 60, max_per_owner=1)
+    assert task["id"] == task_id and task["attempts"] == 1
+    assert not queue.release(task_id, "worker")
+
+
+def test_heartbeat_publishes_progress(queue):
+    task_id, = add(queue, "bolt")
+    queue.lease("worker", 60)
+    assert queue.heartbeat(task_id, "worker", 60, progress=0.5, stage="polling", ignored="x")
+    task = queue.get(task_id)
+    assert task["progress"] == 0.5 and task["stage"] == "polling"
+
+
+def test_lease_balances_owners_by_weight_and_cap(queue):
+    add(queue, "a0", "a1", "a2", "a3", owner="a")
+    add(queue, "b0", "b1", owner="b")
+    add(queue, "urgent", owner="a", priority=-1)
+    assert lease_all(queue, max_per_owner=3, weights={"a": 2.0}) == ["urgent", "b0", "a0", "a1", "b1"]
+    assert queue.usage(0, "a")["a"]["leased"] == 3
+
+
+def test_finished_leases_free_the_owners_slots(queue):
+    first, = add(queue, "a0")
+    add(queue, "a1")
+    queue.lease("worker", 60, max_per_owner=1)
+    assert queue.lease("worker", 60, max_per_owner=1) is None
+    queue.fail(first, "worker", "boom")
+    assert queue.lease("worker", 60, max_per_owner=1)["prompt"] == "a1"
+
+
+def test_enqueue_many_charges_the_quota_atomically(queue):
+    requests = [{"prompt": f"p{index}", "formats": ["step"]} for index in range(3)]
+    since = time.time() - 60
+    task_ids = queue.enqueue_many(requests, owner="a", limit=5, since=since)
+    assert len(task_ids) == 3
+    assert queue.enqueue_many(requests, owner="a", limit=5, since=since) is None
+    assert queue.usage(since, "a")["a"]["submitted"] == 3
+    # A batch is leased in the order it was submitted
+    assert lease_all(queue) == ["p0", "p1", "p2"]
+    assert queue.enqueue_many(requests, owner="b", limit=5, since=since) is not None
+
+
+def test_undelivered_and_stats(queue):
+    done, waiting = add(queue, "done", "waiting")
+    queue.lease("worker", 60)
+    queue.complete(done, "worker")
+    assert queue.undelivered("a") == [done, waiting]
+    queue.mark_delivered(done)
+    assert queue.undelivered("a") == [waiting]
+    assert queue.stats()["queued"] == 1
+
+
+def test_anonymous_sessions_share_one_account(queue):
+    requests = [{"prompt": f"p{index}", "formats": ["step"]} for index in range(3)]
+    since = time.time() - 60
+    queue.enqueue_many(requests, owner="session:a", limit=4, since=since)
+    assert queue.enqueue_many(requests, owner="session:b", limit=4, since=since) is None
+    add(queue, "b0", owner="session:b")
+    assert lease_all(queue, max_per_owner=2) == ["p0", "p1"]
+    assert queue.usage(since, "")[""]["leased"] == 2
+    # Each session still finds only its own tasks
+    assert len(queue.undelivered("session:a")) == 3 and len(queue.undelivered("session:b")) == 1
@@ -0,0 +1,234 @@
+import argparse
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Optional, Set
+
+from jobs import Job, record_job, run_job
+from scheduler import MAX_CONCURRENT, USER_WEIGHTS, parse_weights
+from workqueue import DEFAULT_LEASE_SECONDS, get_queue
+
+logger = logging.getLogger("cadia")
+
+# Generations one worker process runs at once; they mostly wait on the API, so one
+# process handles many. Add processes (or hosts) for the CPU-bound mesh analysis
+DEFAULT_CONCURRENCY = int(os.environ.get("CADIA_WORKER_CONCURRENCY", 16))
+
+# How long an idle worker waits before looking at the queue again
+DEFAULT_IDLE_INTERVAL = float(os.environ.get("CADIA_WORKER_IDLE_INTERVAL", 1.0))
+
+# Seconds a stopping worker lets its generations finish; the rest are handed back to
+# the queue, and whoever leases them next reattaches to their journaled remote jobs
+DEFAULT_SHUTDOWN_GRACE = float(os.environ.get("CADIA_WORKER_SHUTDOWN_GRACE", 30))
+
+
+class Worker:
+    """
+    Drains the work queue: leases tasks (fairly between users, each up to their
+    concurrency limit), runs their generations on one event loop, renews each
+    lease with heartbeats that also publish the task's progress, and stores the
+    outputs in the history for the front-end to serve.
+
+    If a lease is lost (this worker stalled and another took over), the generation
+    is abandoned. A task retried after a crash reattaches to its journaled remote
+    job instead of paying for a new one, as long as the workers share the data directory.
+    """
+
+    def __init__(self, queue=None, concurrency: int = DEFAULT_CONCURRENCY,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, idle_interval: float = DEFAULT_IDLE_INTERVAL,
+                 worker_id: Optional[str] = None, shutdown_grace: float = DEFAULT_SHUTDOWN_GRACE):
+        self.queue = queue or get_queue()
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = lease_seconds / 3
+        self.idle_interval = idle_interval
+        self.shutdown_grace = shutdown_grace
+        self.id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # Per-user limits and shares, as configured for the front-end
+        self.max_per_owner = MAX_CONCURRENT
+        self.weights = parse_weights(USER_WEIGHTS)
+        self.processed = 0
+        self._stopping: Optional[asyncio.Event] = None
+
+    def stop(self) -> None:
+        """
+        Stops leasing new tasks. run() returns once the ones in flight finish, or after
+        shutdown_grace seconds, when those still running are handed back to the queue.
+        """
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def run(self, drain: bool = False) -> int:
+        """
+        Processes tasks until stop() is called, or with drain, until the queue is empty.
+        Returns the number of tasks processed.
+        """
+        self._stopping = asyncio.Event()
+        slots = asyncio.Semaphore(self.concurrency)
+        running: Set[asyncio.Task] = set()
+        logger.info("Worker %s started", self.id)
+
+        while not self._stopping.is_set():
+            if not await self._acquire(slots):
+                break
+            task = await asyncio.to_thread(self.queue.lease, self.id, self.lease_seconds,
+                                           self.max_per_owner, self.weights)
+            if task is None:
+                slots.release()
+                if drain and not running:
+                    break
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.idle_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            future = asyncio.ensure_future(self._process(task))
+            running.add(future)
+            future.add_done_callback(running.discard)
+            future.add_done_callback(lambda _: slots.release())
+
+        if running:
+            in_flight = list(running)
+            timeout = self.shutdown_grace if self._stopping.is_set() else None
+            _, unfinished = await asyncio.wait(in_flight, timeout=timeout)
+            if unfinished:
+                logger.warning("Handing %d unfinished tasks back to the queue", len(unfinished))
+                for future in unfinished:
+                    future.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        logger.info("Worker %s stopped after %d tasks", self.id, self.processed)
+        return self.processed
+
+    async def _acquire(self, slots: asyncio.Semaphore) -> bool:
+        # Waits for a free slot; False (holding none) if stop() is called first
+        acquire = asyncio.ensure_future(slots.acquire())
+        stopping = asyncio.ensure_future(self._stopping.wait())
+        await asyncio.wait((acquire, stopping), return_when=asyncio.FIRST_COMPLETED)
+        stopping.cancel()
+        if not self._stopping.is_set():
+            return True
+        if acquire.done() and not acquire.cancelled():
+            slots.release()
+        else:
+            acquire.cancel()
+        return False
+
+    async def _process(self, task: dict) -> None:
+        job = Job(task["prompt"], task["formats"], task["file_name"], task["use_cache"], task["owner"])
+        job.id = task["id"]
+        job.created_at = task["created_at"]
+        job.status = "running"
+        job.started_at = time.time()
+        job.timings["queued"] = job.started_at - job.created_at
+        job.message = "Submitting your design prompt to the API..."
+
+        generation = asyncio.ensure_future(run_job(job, priority=task["priority"]))
+        heartbeat = asyncio.ensure_future(self._heartbeat(job, generation))
+        try:
+            await generation
+            job.status = "completed"
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled() and heartbeat.result() is False:
+                logger.warning("Lost the lease on task %s; another worker has it", job.id)
+                return
+            # Shutting down: hand the task straight back instead of waiting out the lease
+            await asyncio.to_thread(self.queue.release, job.id, self.id)
+            raise
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            heartbeat.cancel()
+
+        job.finished_at = time.time()
+        # Outputs go to the shared history before the task is marked done, so a
+        # front-end that sees it completed always finds them
+        await asyncio.to_thread(record_job, job)
+        if job.status == "completed":
+            await asyncio.to_thread(self.queue.complete, job.id, self.id, job.analysis, job.preview, job.timings)
+        else:
+            await asyncio.to_thread(self.queue.fail, job.id, self.id, job.error, job.timings)
+        self.processed += 1
+
+    async def _heartbeat(self, job: Job, generation: asyncio.Future) -> bool:
+        # Renew the lease and publish progress; cancel the generation once the lease is gone
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                held = await asyncio.to_thread(
+                    self.queue.heartbeat, job.id, self.id, self.lease_seconds,
+                    progress=job.progress, message=job.message, stage=job.stage,
+                    remote_id=job.remote_id, polls=job.polls,
+                )
+            except Exception:
+                # A briefly unreachable queue is retried; the lease outlasts a few misses
+                logger.exception("Heartbeat for task %s failed", job.id)
+                continue
+            if not held:
+                generation.cancel()
+                return False
+
+
+def run_worker(concurrency: int = DEFAULT_CONCURRENCY, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+               drain: bool = False) -> int:
+    """
+    Runs one worker in this process until SIGINT/SIGTERM (or, with drain, an empty queue).
+    """
+    worker = Worker(concurrency=concurrency, lease_seconds=lease_seconds)
+
+    async def main() -> int:
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, worker.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        return await worker.run(drain=drain)
+
+    return asyncio.run(main())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run generation workers that drain the shared work queue (CADIA_QUEUE_URL)."
+    )
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Generations each worker process runs at once.")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes to start on this host.")
+    parser.add_argument("--lease", type=float, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds a task stays leased without a heartbeat.")
+    parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty.")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while running.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log structured timing events to stderr.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+    if args.metrics_port:
+        from metrics import serve_metrics
+        serve_metrics(args.metrics_port)
+
+    if args.processes > 1:
+        import multiprocessing
+
+        # Each process runs its own worker; a terminal's Ctrl+C reaches them all
+        context = multiprocessing.get_context("spawn")
+        processes = [
+            context.Process(target=run_worker, args=(args.concurrency, args.lease, args.drain), name=f"cad-worker-{index}")
+            for index in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        signal.signal(signal.SIGTERM, lambda *_: [process.terminate() for process in processes])
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.join()
+    else:
+        run_worker(args.concurrency, args.lease, args.drain)
@@ -0,0 +1,662 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from history import DEFAULT_DATA_DIR
+from metrics import registry
+from scheduler import account
+
+# Where the queue lives: a SQLite file path (the default, in the data directory) or a
+# redis:// URL. SQLite serves any number of workers on one host or a reliable shared
+# filesystem; workers on several hosts should share Redis instead
+DEFAULT_QUEUE_URL = os.environ.get("CADIA_QUEUE_URL", os.path.join(DEFAULT_DATA_DIR, "queue.sqlite3"))
+
+# A leased task whose worker stops heartbeating for this long is handed to another worker
+DEFAULT_LEASE_SECONDS = float(os.environ.get("CADIA_LEASE_SECONDS", 60))
+
+# Leases a task may lose (worker crashes, lost hosts) before it is failed instead of retried
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("CADIA_QUEUE_MAX_ATTEMPTS", 3))
+
+# Finished tasks are deleted after this many seconds
+DEFAULT_RETENTION = float(os.environ.get("CADIA_QUEUE_RETENTION", 24 * 3600))
+
+# Progress fields a worker may update with each heartbeat
+STATE_FIELDS = ("progress", "message", "stage", "remote_id", "polls")
+
+tasks_enqueued = registry.counter("cadia_queue_enqueued_total", "Tasks added to the work queue.")
+leases_expired = registry.counter("cadia_queue_leases_expired_total", "Leases that expired, by outcome.")
+
+# queued: waiting for a worker; leased: a worker is running it; completed / failed: finished.
+# Tasks are leased in (priority, created_at) order. owner is who the task belongs to,
+# account who its quota and share are charged to (scheduler.account of the owner)
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    formats TEXT NOT NULL,
+    file_name TEXT NOT NULL,
+    use_cache INTEGER NOT NULL,
+    owner TEXT,
+    account TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    stage TEXT,
+    remote_id TEXT,
+    polls INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    analysis TEXT,
+    preview BLOB,
+    timings TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    delivered_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, priority, created_at);
+CREATE INDEX IF NOT EXISTS tasks_leases ON tasks (status, lease_expires);
+CREATE INDEX IF NOT EXISTS tasks_owner ON tasks (owner, created_at);
+"""
+
+
+def _decode(row: Dict[str, Any]) -> dict:
+    # Stored rows carry JSON and integer flags; callers get plain Python values
+    task = dict(row)
+    task["formats"] = json.loads(task["formats"])
+    task["use_cache"] = bool(int(task["use_cache"]))
+    task["analysis"] = json.loads(task["analysis"]) if task.get("analysis") else None
+    task["timings"] = json.loads(task["timings"]) if task.get("timings") else {}
+    return task
+
+
+class WorkQueue:
+    """
+    Durable SQLite queue of generation tasks shared by a front-end and any number of
+    worker processes. A worker leases a task for lease_seconds and must renew it with
+    heartbeats; a lease that runs out (the worker died) returns the task to the queue,
+    up to max_attempts times.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_URL, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retention: float = DEFAULT_RETENTION):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retention = retention
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        # Transactions are managed explicitly so leasing can take the write lock up front
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # Queues made before tasks were charged to accounts lack the column
+        if "account" not in {row["name"] for row in self._db.execute("PRAGMA table_info(tasks)")}:
+            self._db.execute("ALTER TABLE tasks ADD COLUMN account TEXT NOT NULL DEFAULT ''")
+            self._db.execute("UPDATE tasks SET account = COALESCE(owner, '')")
+        self._db.execute("CREATE INDEX IF NOT EXISTS tasks_account ON tasks (account, created_at)")
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        # BEGIN IMMEDIATE serializes writers across processes, so two workers never lease one task
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def enqueue(self, prompt: str, formats: List[str], file_name: str = "my_design", use_cache: bool = True,
+                owner: Optional[str] = None, priority: int = 0, task_id: Optional[str] = None) -> str:
+        """
+        Adds a generation task and returns its ID. Finished tasks past the retention are purged.
+        """
+        request = {"prompt": prompt, "formats": formats, "file_name": file_name, "use_cache": use_cache,
+                   "task_id": task_id}
+        return self.enqueue_many([request], owner=owner, priority=priority)[0]
+
+    def enqueue_many(self, requests: List[dict], owner: Optional[str] = None, priority: int = 0,
+                     limit: Optional[int] = None, since: Optional[float] = None) -> Optional[List[str]]:
+        """
+        Adds several generation tasks (dicts of enqueue()'s arguments) in one transaction
+        and returns their IDs. With limit, returns None and adds nothing if owner's account
+        would then have more than limit tasks created since `since`; the count and the
+        inserts are atomic, so front-ends sharing the queue cannot overrun it together.
+        """
+        task_ids = [request.get("task_id") or uuid.uuid4().hex for request in requests]
+        now = time.time()
+        with self._transaction() as db:
+            if limit is not None:
+                submitted = db.execute(
+                    "SELECT COUNT(*) FROM tasks WHERE account = ? AND created_at >= ?", (account(owner), since or 0.0)
+                ).fetchone()[0]
+                if submitted + len(requests) > limit:
+                    return None
+            db.execute(
+                "DELETE FROM tasks WHERE status IN ('completed', 'failed') AND finished_at < ?",
+                (now - self.retention,),
+            )
+            db.executemany(
+                "INSERT INTO tasks (id, prompt, formats, file_name, use_cache, owner, account, priority, status,"
+                " message, stage, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'queued', ?, 'queued', ?)",
+                [(task_id, request["prompt"], json.dumps(request["formats"]), request.get("file_name", "my_design"),
+                  int(request.get("use_cache", True)), owner, account(owner), priority,
+                  "Waiting for a free generation worker...", now)
+                 for task_id, request in zip(task_ids, requests)],
+            )
+        tasks_enqueued.inc(len(requests))
+        return task_ids
+
+    def lease(self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+              max_per_owner: Optional[int] = None, weights: Optional[Dict[str, float]] = None) -> Optional[dict]:
+        """
+        Claims the next task for worker, or returns None when the queue is empty.
+        Tasks whose lease ran out are requeued (or failed) first.
+
+        Within a priority, the account with the fewest tasks leased right now relative
+        to its weight goes next (oldest task first), so one user's backlog does not
+        starve everyone else; accounts already running max_per_owner tasks are skipped.
+        This is not the start-time fair queuing of the in-process FairScheduler: it
+        keeps no virtual tags, so shares are only balanced among tasks running at
+        once, and an account's finished tasks earn it no lower standing later.
+        """
+        now = time.time()
+        share, params = "1.0", [max_per_owner if max_per_owner is not None else 2 ** 31]
+        if weights:
+            share = "CASE t.account " + " ".join("WHEN ? THEN ?" for _ in weights) + " ELSE 1.0 END"
+            for name, weight in weights.items():
+                params += [name, weight]
+        with self._transaction() as db:
+            self._expire(db, now)
+            row = db.execute(
+                "SELECT t.id FROM tasks t LEFT JOIN (SELECT account, COUNT(*) AS running FROM tasks"
+                " WHERE status = 'leased' GROUP BY account) r ON r.account = t.account"
+                " WHERE t.status = 'queued' AND COALESCE(r.running, 0) < ?"
+                f" ORDER BY t.priority, COALESCE(r.running, 0) / ({share}), t.created_at, t.rowid LIMIT 1",
+                params,
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1,"
+                " started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker, now + lease_seconds, now, row["id"]),
+            )
+            return _decode(db.execute("SELECT * FROM tasks WHERE id = ?", (row["id"],)).fetchone())
+
+    def _expire(self, db: sqlite3.Connection, now: float) -> None:
+        expired = db.execute(
+            "SELECT id, attempts FROM tasks WHERE status = 'leased' AND lease_expires < ?", (now,)
+        ).fetchall()
+        for row in expired:
+            if row["attempts"] >= self.max_attempts:
+                db.execute(
+                    "UPDATE tasks SET status = 'failed', worker = NULL, finished_at = ?, error = ? WHERE id = ?",
+                    (now, f"Abandoned by {row['attempts']} workers", row["id"]),
+                )
+                leases_expired.inc(labels={"outcome": "failed"})
+            else:
+                db.execute(
+                    "UPDATE tasks SET status = 'queued', worker = NULL, message = ? WHERE id = ?",
+                    ("A worker stopped responding; waiting for another one...", row["id"]),
+                )
+                leases_expired.inc(labels={"outcome": "requeued"})
+
+    def heartbeat(self, task_id: str, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                  **state: Any) -> bool:
+        """
+        Renews worker's lease on a task and stores its progress (any of STATE_FIELDS).
+        Returns False if the lease was lost, in which case the worker must stop.
+        """
+        fields = {name: value for name, value in state.items() if name in STATE_FIELDS}
+        assignments = "".join(f", {name} = ?" for name in fields)
+        with self._transaction() as db:
+            cursor = db.execute(
+                f"UPDATE tasks SET lease_expires = ?{assignments}"
+                " WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + lease_seconds, *fields.values(), task_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id: str, worker: str, analysis: Optional[dict] = None,
+                 preview: Optional[bytes] = None, timings: Optional[Dict[str, float]] = None) -> bool:
+        """
+        Marks worker's task completed. Outputs themselves live in the history store.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE tasks SET status = 'completed', worker = NULL, progress = 1, stage = 'completed',"
+                " message = ?, analysis = ?, preview = ?, timings = ?, finished_at = ?"
+                " WHERE id = ? AND worker = ? AND status = 'leased'",
+                ("CAD model completed!", json.dumps(analysis) if analysis else None, preview,
+                 json.dumps(timings or {}), time.time(), task_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, task_id: str, worker: str, error: str, timings: Optional[Dict[str, float]] = None) -> bool:
+        """
+        Marks worker's task failed with error.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE tasks SET status = 'failed', worker = NULL, stage = 'failed', message = ?, error = ?,"
+                " timings = ?, finished_at = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (f"Failed: {error}", error, json.dumps(timings or {}), time.time(), task_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def release(self, task_id: str, worker: str) -> bool:
+        """
+        Hands worker's task back to the queue without counting the attempt, e.g. on shutdown.
+        """
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE tasks SET status = 'queued', worker = NULL, attempts = attempts - 1, message = ?"
+                " WHERE id = ? AND worker = ? AND status = 'leased'",
+                ("Waiting for a free generation worker...", task_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def mark_delivered(self, task_id: str) -> None:
+        with self._transaction() as db:
+            db.execute("UPDATE tasks SET delivered_at = ? WHERE id = ?", (time.time(), task_id))
+
+    def get(self, task_id: str) -> Optional[dict]:
+        tasks = self.tasks([task_id])
+        return tasks[0] if tasks else None
+
+    def tasks(self, task_ids: List[str]) -> List[dict]:
+        """
+        Returns the tasks with the given IDs that still exist, in the given order.
+        """
+        if not task_ids:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM tasks WHERE id IN ({','.join('?' * len(task_ids))})", task_ids
+            ).fetchall()
+        found = {row["id"]: _decode(row) for row in rows}
+        return [found[task_id] for task_id in task_ids if task_id in found]
+
+    def undelivered(self, owner: str) -> List[str]:
+        """
+        Returns the IDs of owner's tasks that are unfinished or whose outputs were never downloaded.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM tasks WHERE owner = ? AND delivered_at IS NULL AND status != 'failed'"
+                " ORDER BY created_at",
+                (owner,),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def usage(self, since: float, account: Optional[str] = None) -> Dict[str, dict]:
+        """
+        Returns {"submitted", "oldest", "queued", "leased"} per account (all accounts,
+        or just account): tasks created since `since` and when the first of them was,
+        and tasks waiting and running now.
+        """
+        sql = (
+            "SELECT account, SUM(created_at >= ?) AS submitted,"
+            " MIN(CASE WHEN created_at >= ? THEN created_at END) AS oldest,"
+            " SUM(status = 'queued') AS queued, SUM(status = 'leased') AS leased"
+            " FROM tasks WHERE (created_at >= ? OR status IN ('queued', 'leased'))"
+        )
+        params: List[Any] = [since, since, since]
+        if account is not None:
+            sql += " AND account = ?"
+            params.append(account)
+        with self._lock:
+            rows = self._db.execute(sql + " GROUP BY account", params).fetchall()
+        return {
+            row["account"]: {"submitted": row["submitted"], "oldest": row["oldest"],
+                             "queued": row["queued"], "leased": row["leased"]}
+            for row in rows
+        }
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns task counts by status.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS count FROM tasks GROUP BY status").fetchall()
+        counts = {"queued": 0, "leased": 0, "completed": 0, "failed": 0}
+        counts.update((row["status"], row["count"]) for row in rows)
+        return counts
+
+
+# Adds a batch of tasks (JSON objects of hash fields) as one atomic script, after
+# checking the account's quota against its index, KEYS[2]: ARGV is prefix, now, limit
+# ('' for none), since, the retention cutoff and '1' when KEYS[4] is the owner's index,
+# then the tasks. KEYS[3] is the set of accounts with queued tasks
+_REDIS_ENQUEUE = """
+local prefix, now, indexed = ARGV[1], ARGV[2], ARGV[6] == '1'
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[5])
+if ARGV[3] ~= '' and redis.call('ZCOUNT', KEYS[2], ARGV[4], '+inf') + #ARGV - 6 > tonumber(ARGV[3]) then
+    return 0
+end
+if indexed then
+    redis.call('ZREMRANGEBYSCORE', KEYS[4], '-inf', ARGV[5])
+end
+for i = 7, #ARGV do
+    local task = cjson.decode(ARGV[i])
+    local key = prefix .. 'task:' .. task.id
+    for name, value in pairs(task) do
+        redis.call('HSET', key, name, value)
+    end
+    redis.call('ZADD', KEYS[1], task.rank, task.id)
+    redis.call('ZADD', prefix .. 'ready:' .. task.account, task.rank, task.id)
+    redis.call('SADD', KEYS[3], task.account)
+    redis.call('ZADD', KEYS[2], now, task.id)
+    if indexed then
+        redis.call('ZADD', KEYS[4], now, task.id)
+    end
+end
+return 1
+"""
+
+# Lease claim as one atomic script: requeue or fail expired leases, then pop the best
+# task. ARGV is prefix, now, expiry, worker, max_attempts, the per-account cap ('' for
+# none), then account/weight pairs. KEYS[3] counts leased tasks per account and KEYS[4]
+# holds the accounts with queued tasks, each in their own ready set
+_REDIS_LEASE = """
+local prefix, now, expires, worker, max_attempts = ARGV[1], tonumber(ARGV[2]), ARGV[3], ARGV[4], tonumber(ARGV[5])
+local cap = tonumber(ARGV[6])
+local weights = {}
+for i = 7, #ARGV, 2 do
+    weights[ARGV[i]] = tonumber(ARGV[i + 1])
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now)
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = prefix .. 'task:' .. id
+    local account = redis.call('HGET', key, 'account') or ''
+    redis.call('HINCRBY', KEYS[3], account, -1)
+    local attempts = tonumber(redis.call('HGET', key, 'attempts') or '0')
+    if attempts >= max_attempts then
+        redis.call('HSET', key, 'status', 'failed', 'worker', '', 'finished_at', ARGV[2],
+                   'error', 'Abandoned by ' .. attempts .. ' workers')
+    else
+        redis.call('HSET', key, 'status', 'queued', 'worker', '',
+                   'message', 'A worker stopped responding; waiting for another one...')
+        local rank = tonumber(redis.call('HGET', key, 'rank'))
+        redis.call('ZADD', KEYS[1], rank, id)
+        redis.call('ZADD', prefix .. 'ready:' .. account, rank, id)
+        redis.call('SADD', KEYS[4], account)
+    end
+end
+-- Each account's queue is in (priority, age) order. Of their first tasks, take the best
+-- priority, then the account with the fewest leased tasks for its weight, then the oldest
+local id, chosen, best
+for _, account in ipairs(redis.call('SMEMBERS', KEYS[4])) do
+    local running = tonumber(redis.call('HGET', KEYS[3], account) or '0')
+    if not cap or running < cap then
+        local head = redis.call('ZRANGE', prefix .. 'ready:' .. account, 0, 0, 'WITHSCORES')
+        if #head == 0 then
+            redis.call('SREM', KEYS[4], account)
+        else
+            local order = {tonumber(redis.call('HGET', prefix .. 'task:' .. head[1], 'priority')),
+                           running / (weights[account] or 1), tonumber(head[2])}
+            if not best or order[1] < best[1] or (order[1] == best[1] and (order[2] < best[2]
+                    or (order[2] == best[2] and order[3] < best[3]))) then
+                id, chosen, best = head[1], account, order
+            end
+        end
+    end
+end
+if not id then
+    return false
+end
+redis.call('ZREM', KEYS[1], id)
+redis.call('ZREM', prefix .. 'ready:' .. chosen, id)
+redis.call('HINCRBY', KEYS[3], chosen, 1)
+local key = prefix .. 'task:' .. id
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'leased', 'worker', worker, 'lease_expires', expires)
+redis.call('HSETNX', key, 'started_at', ARGV[2])
+redis.call('ZADD', KEYS[2], expires, id)
+return id
+"""
+
+# Applies a state change only while worker still holds the lease; ARGV[3] is the new
+# lease expiry, or '' to end the lease (KEYS[3] counts leases per account), then
+# field/value pairs follow
+_REDIS_UPDATE = """
+local key = KEYS[1]
+if redis.call('HGET', key, 'status') ~= 'leased' or redis.call('HGET', key, 'worker') ~= ARGV[1] then
+    return 0
+end
+if ARGV[3] == '' then
+    redis.call('ZREM', KEYS[2], ARGV[2])
+    redis.call('HINCRBY', KEYS[3], redis.call('HGET', key, 'account') or '', -1)
+else
+    redis.call('ZADD', KEYS[2], ARGV[3], ARGV[2])
+    redis.call('HSET', key, 'lease_expires', ARGV[3])
+end
+for i = 4, #ARGV, 2 do
+    redis.call('HSET', key, ARGV[i], ARGV[i + 1])
+end
+return 1
+"""
+
+# Hands a leased task back to the queue in one step, so it can never be left marked
+# queued but missing from the ready sets: ARGV is worker, task ID, prefix, message
+_REDIS_RELEASE = """
+local key = KEYS[1]
+if redis.call('HGET', key, 'status') ~= 'leased' or redis.call('HGET', key, 'worker') ~= ARGV[1] then
+    return 0
+end
+local account = redis.call('HGET', key, 'account') or ''
+local rank = redis.call('HGET', key, 'rank')
+redis.call('ZREM', KEYS[2], ARGV[2])
+redis.call('HINCRBY', KEYS[3], account, -1)
+redis.call('HINCRBY', key, 'attempts', -1)
+redis.call('HSET', key, 'status', 'queued', 'worker', '', 'message', ARGV[4])
+redis.call('ZADD', KEYS[4], rank, ARGV[2])
+redis.call('ZADD', ARGV[3] .. 'ready:' .. account, rank, ARGV[2])
+redis.call('SADD', KEYS[5], account)
+return 1
+"""
+
+
+class RedisWorkQueue:
+    """
+    The WorkQueue interface on a Redis-compatible server, for workers spread over
+    several hosts. Tasks are hashes; sorted sets order the queued ones (all of them,
+    and each account's) and track lease expiries, and a hash counts each account's
+    leased tasks for the per-user limits and weights. Needs the redis package.
+    """
+
+    def __init__(self, url: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 retention: float = DEFAULT_RETENTION, prefix: str = "cadia:"):
+        import redis
+
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.prefix = prefix
+        self._redis = redis.Redis.from_url(url)
+        self._ready = prefix + "ready"
+        self._leases = prefix + "leases"
+        # Leased tasks per account, and the accounts with queued tasks (in "ready:<account>")
+        self._running = prefix + "running"
+        self._accounts = prefix + "accounts"
+        self._enqueue_script = self._redis.register_script(_REDIS_ENQUEUE)
+        self._lease_script = self._redis.register_script(_REDIS_LEASE)
+        self._update_script = self._redis.register_script(_REDIS_UPDATE)
+        self._release_script = self._redis.register_script(_REDIS_RELEASE)
+
+    def _key(self, task_id: str) -> str:
+        return f"{self.prefix}task:{task_id}"
+
+    def enqueue(self, prompt: str, formats: List[str], file_name: str = "my_design", use_cache: bool = True,
+                owner: Optional[str] = None, priority: int = 0, task_id: Optional[str] = None) -> str:
+        request = {"prompt": prompt, "formats": formats, "file_name": file_name, "use_cache": use_cache,
+                   "task_id": task_id}
+        return self.enqueue_many([request], owner=owner, priority=priority)[0]
+
+    def enqueue_many(self, requests: List[dict], owner: Optional[str] = None, priority: int = 0,
+                     limit: Optional[int] = None, since: Optional[float] = None) -> Optional[List[str]]:
+        # The limit is counted on the account's index; the owner's lists their tasks
+        charged = account(owner)
+        now = time.time()
+        # Lower priority values first, then oldest first, as one sortable score; a
+        # batch's tasks are spaced apart so they keep their order
+        rank = priority * 1e10 + now
+        task_ids, tasks = [], []
+        for index, request in enumerate(requests):
+            task_id = request.get("task_id") or uuid.uuid4().hex
+            task_ids.append(task_id)
+            tasks.append(json.dumps({name: str(value) for name, value in {
+                "id": task_id, "prompt": request["prompt"], "formats": json.dumps(request["formats"]),
+                "file_name": request.get("file_name", "my_design"), "use_cache": int(request.get("use_cache", True)),
+                "owner": owner or "", "account": charged, "priority": priority, "rank": repr(rank + index * 1e-4), "status": "queued", "attempts": 0,
+                "progress": 0, "polls": 0, "stage": "queued", "message": "Waiting for a free generation worker...",
+                "created_at": repr(now),
+            }.items()}))
+        added = self._enqueue_script(
+            keys=[self._ready, f"{self.prefix}account:{charged}", self._accounts, f"{self.prefix}owner:{owner or ''}"],
+            args=[self.prefix, repr(now), "" if limit is None else limit, repr(since or 0.0),
+                  repr(now - self.retention), "1" if owner else "0", *tasks],
+        )
+        if not added:
+            return None
+        tasks_enqueued.inc(len(requests))
+        return task_ids
+
+    def lease(self, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+              max_per_owner: Optional[int] = None, weights: Optional[Dict[str, float]] = None) -> Optional[dict]:
+        # Same order and limits as WorkQueue.lease, chosen among the accounts' first tasks
+        now = time.time()
+        args = [self.prefix, now, now + lease_seconds, worker, self.max_attempts,
+                "" if max_per_owner is None else max_per_owner]
+        for name, weight in (weights or {}).items():
+            args += [name, weight]
+        task_id = self._lease_script(keys=[self._ready, self._leases, self._running, self._accounts], args=args)
+        if not task_id:
+            return None
+        return self.get(task_id.decode() if isinstance(task_id, bytes) else task_id)
+
+    def _update(self, task_id: str, worker: str, expires: Any, fields: Dict[str, Any]) -> bool:
+        args = [worker, task_id, expires]
+        for name, value in fields.items():
+            args += [name, "" if value is None else value]
+        return bool(self._update_script(keys=[self._key(task_id), self._leases, self._running], args=args))
+
+    def _finish(self, task_id: str, worker: str, fields: Dict[str, Any]) -> bool:
+        fields.update(worker="", finished_at=time.time())
+        if not self._update(task_id, worker, "", fields):
+            return False
+        self._redis.expire(self._key(task_id), int(self.retention))
+        return True
+
+    def heartbeat(self, task_id: str, worker: str, lease_seconds: float = DEFAULT_LEASE_SECONDS,
+                  **state: Any) -> bool:
+        fields = {name: value for name, value in state.items() if name in STATE_FIELDS}
+        return self._update(task_id, worker, time.time() + lease_seconds, fields)
+
+    def complete(self, task_id: str, worker: str, analysis: Optional[dict] = None,
+                 preview: Optional[bytes] = None, timings: Optional[Dict[str, float]] = None) -> bool:
+        return self._finish(task_id, worker, {
+            "status": "completed", "progress": 1, "stage": "completed", "message": "CAD model completed!",
+            "analysis": json.dumps(analysis) if analysis else "", "preview": preview or b"",
+            "timings": json.dumps(timings or {}),
+        })
+
+    def fail(self, task_id: str, worker: str, error: str, timings: Optional[Dict[str, float]] = None) -> bool:
+        return self._finish(task_id, worker, {
+            "status": "failed", "stage": "failed", "message": f"Failed: {error}", "error": error,
+            "timings": json.dumps(timings or {}),
+        })
+
+    def release(self, task_id: str, worker: str) -> bool:
+        return bool(self._release_script(
+            keys=[self._key(task_id), self._leases, self._running, self._ready, self._accounts],
+            args=[worker, task_id, self.prefix, "Waiting for a free generation worker..."],
+        ))
+
+    def mark_delivered(self, task_id: str) -> None:
+        if self._redis.exists(self._key(task_id)):
+            self._redis.hset(self._key(task_id), "delivered_at", time.time())
+
+    def get(self, task_id: str) -> Optional[dict]:
+        tasks = self.tasks([task_id])
+        return tasks[0] if tasks else None
+
+    def tasks(self, task_ids: List[str]) -> List[dict]:
+        with self._redis.pipeline() as pipe:
+            for task_id in task_ids:
+                pipe.hgetall(self._key(task_id))
+            rows = pipe.execute()
+        return [self._decode_hash(row) for row in rows if row]
+
+    @staticmethod
+    def _decode_hash(row: Dict[bytes, bytes]) -> dict:
+        # Hash fields come back as bytes and "" stands for NULL
+        task: Dict[str, Any] = {}
+        for name, value in row.items():
+            name = name.decode()
+            task[name] = value if name == "preview" else value.decode()
+        for name in ("priority", "attempts", "polls"):
+            task[name] = int(task.get(name) or 0)
+        task["progress"] = float(task.get("progress") or 0)
+        for name in ("lease_expires", "created_at", "started_at", "finished_at", "delivered_at"):
+            task[name] = float(task[name]) if task.get(name) else None
+        for name in ("owner", "worker", "message", "stage", "remote_id", "error", "preview", "analysis", "timings"):
+            task[name] = task.get(name) or None
+        return _decode(task)
+
+    def undelivered(self, owner: str) -> List[str]:
+        task_ids = [value.decode() for value in self._redis.zrange(f"{self.prefix}owner:{owner}", 0, -1)]
+        return [task["id"] for task in self.tasks(task_ids)
+                if task["delivered_at"] is None and task["status"] != "failed"]
+
+    def usage(self, since: float, account: Optional[str] = None) -> Dict[str, dict]:
+        if account is not None:
+            keys = [f"{self.prefix}account:{account}"]
+        else:
+            keys = [key.decode() for key in self._redis.scan_iter(match=f"{self.prefix}account:*")]
+        usage = {}
+        for key in keys:
+            tasks = self.tasks([value.decode() for value in self._redis.zrange(key, 0, -1)])
+            recent = [task["created_at"] for task in tasks if task["created_at"] >= since]
+            counts = {
+                "submitted": len(recent),
+                "oldest": min(recent) if recent else None,
+                "queued": sum(task["status"] == "queued" for task in tasks),
+                "leased": sum(task["status"] == "leased" for task in tasks),
+            }
+            if counts["submitted"] or counts["queued"] or counts["leased"]:
+                usage[key[len(self.prefix) + len("account:"):]] = counts
+        return usage
+
+    def stats(self) -> Dict[str, int]:
+        # Only the live sets are counted; finished tasks are not indexed
+        return {"queued": self._redis.zcard(self._ready), "leased": self._redis.zcard(self._leases)}
+
+
+_default_queue = None
+_default_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """
+    Returns the process-wide work queue for CADIA_QUEUE_URL, creating it on first use.
+    """
+    global _default_queue
+    with _default_queue_lock:
+        if _default_queue is None:
+            if DEFAULT_QUEUE_URL.startswith(("redis://", "rediss://", "unix://")):
+                _default_queue = RedisWorkQueue(DEFAULT_QUEUE_URL)
+            else:
+                _default_queue = WorkQueue(DEFAULT_QUEUE_URL)
+        return _default_queue